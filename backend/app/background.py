@@ -0,0 +1,254 @@
+import asyncio
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+from app.logging_config import app_logger
+from postgresql import database as db
+from postgresql import partitions
+
+# Загружаем переменные окружения из .env файла
+load_dotenv()
+
+
+class PeriodicTask:
+    """Runs an async job every `interval_seconds` until stopped."""
+
+    def __init__(self, name: str, interval_seconds: float, job: Callable[[], Awaitable[None]],
+                 run_on_stop: bool = False, run_on_start: bool = False):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.job = job
+        self.run_on_stop = run_on_stop
+        self.run_on_start = run_on_start
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if self.run_on_stop:
+                try:
+                    await self.job()
+                except Exception as e:
+                    app_logger.error(f"Final run of background task '{self.name}' failed: {e}", exc_info=e)
+
+    async def _run(self):
+        delay = 0 if self.run_on_start else self.interval_seconds
+        while True:
+            await asyncio.sleep(delay)
+            delay = self.interval_seconds
+            try:
+                await self.job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # A failed run must not kill the loop; the next run retries
+                app_logger.error(f"Background task '{self.name}' failed: {e}", exc_info=e)
+
+
+_tasks: List[PeriodicTask] = []
+
+
+def register_periodic(name: str, interval_seconds: float, job: Callable[[], Awaitable[None]],
+                      run_on_stop: bool = False, run_on_start: bool = False):
+    """
+    Registers a job to be started with the application. A non-positive interval disables it.
+    With run_on_stop the job runs once more on shutdown (e.g. to flush buffers); with
+    run_on_start its first run happens right after startup instead of one interval later.
+    """
+    if interval_seconds > 0:
+        _tasks.append(PeriodicTask(name, interval_seconds, job, run_on_stop, run_on_start))
+
+
+def start_background_tasks():
+    for task in _tasks:
+        task.start()
+        app_logger.info(f"Background task '{task.name}' started (every {task.interval_seconds}s)")
+
+
+async def stop_background_tasks():
+    for task in _tasks:
+        await task.stop()
+
+
+# --- Jobs ---
+
+REFRESH_TOKEN_PURGE_INTERVAL_SECONDS = float(os.getenv("REFRESH_TOKEN_PURGE_INTERVAL_SECONDS", "3600"))
+REFRESH_TOKEN_PURGE_BATCH_SIZE = int(os.getenv("REFRESH_TOKEN_PURGE_BATCH_SIZE", "1000"))
+
+
+async def purge_refresh_tokens():
+    """
+    Deletes expired and revoked refresh tokens in bounded batches.
+    Each batch takes its own short-lived connection so logins are not starved.
+    """
+    total = 0
+    while True:
+        async with db.acquire_connection() as conn:
+            deleted = await db.purge_dead_refresh_tokens(conn, REFRESH_TOKEN_PURGE_BATCH_SIZE)
+        total += deleted
+        if deleted < REFRESH_TOKEN_PURGE_BATCH_SIZE:
+            break
+        await asyncio.sleep(0)
+    if total:
+        app_logger.info(f"Purged {total} expired or revoked refresh tokens")
+
+
+register_periodic("purge_refresh_tokens", REFRESH_TOKEN_PURGE_INTERVAL_SECONDS, purge_refresh_tokens)
+
+
+LAST_SEEN_FLUSH_INTERVAL_SECONDS = float(os.getenv("LAST_SEEN_FLUSH_INTERVAL_SECONDS", "30"))
+
+
+async def flush_last_seen():
+    """Writes buffered users.last_seen_at updates in one batched statement."""
+    async with db.acquire_connection() as conn:
+        updated = await db.flush_last_seen(conn)
+    if updated:
+        app_logger.debug(f"Flushed last_seen_at for {updated} users")
+
+
+register_periodic("flush_last_seen", LAST_SEEN_FLUSH_INTERVAL_SECONDS, flush_last_seen, run_on_stop=True)
+
+
+REAPER_INTERVAL_SECONDS = float(os.getenv("REAPER_INTERVAL_SECONDS", "600"))
+REAPER_BATCH_SIZE = int(os.getenv("REAPER_BATCH_SIZE", "500"))
+# How long rows stay in the working tables after expires_at
+REAPER_RETENTION_HOURS = float(os.getenv("REAPER_RETENTION_HOURS", "168"))
+# archive - move rows to <table>_archive, delete - drop them
+REAPER_ARCHIVE = os.getenv("REAPER_MODE", "archive").lower() != "delete"
+
+_reaper_stats = {
+    "runs": 0,
+    "last_run_at": None,
+    "last_run_ms": 0.0,
+    "last_run": {},
+    "total": {table: 0 for table in db.REAPED_TABLES},
+}
+
+
+def get_reaper_stats() -> dict:
+    """Returns what the reaper did on its last run and since startup."""
+    return {
+        "mode": "archive" if REAPER_ARCHIVE else "delete",
+        "retention_hours": REAPER_RETENTION_HOURS,
+        **_reaper_stats,
+    }
+
+
+async def reap_expired_rows():
+    """
+    Moves trades, transfers and profile view requests that expired more than
+    REAPER_RETENTION_HOURS ago out of the working tables, in bounded batches.
+    """
+    started = time.perf_counter()
+    retention = timedelta(hours=REAPER_RETENTION_HOURS)
+    counts = {}
+    for table in db.REAPED_TABLES:
+        total = 0
+        while True:
+            async with db.acquire_connection() as conn:
+                reaped = await db.reap_expired_rows(conn, table, retention, REAPER_BATCH_SIZE, REAPER_ARCHIVE)
+            total += reaped
+            if reaped < REAPER_BATCH_SIZE:
+                break
+            await asyncio.sleep(0)
+        counts[table] = total
+        _reaper_stats["total"][table] += total
+
+    _reaper_stats["runs"] += 1
+    _reaper_stats["last_run_at"] = time.time()
+    _reaper_stats["last_run_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    _reaper_stats["last_run"] = counts
+    if any(counts.values()):
+        action = "Archived" if REAPER_ARCHIVE else "Deleted"
+        app_logger.info(f"{action} expired rows: " + ", ".join(f"{table}={count}" for table, count in counts.items()))
+
+
+register_periodic("reap_expired_rows", REAPER_INTERVAL_SECONDS, reap_expired_rows)
+
+
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", "86400"))
+
+
+async def maintain_partitions():
+    """Creates upcoming monthly partitions and detaches or drops expired ones."""
+    async with db.acquire_connection() as conn:
+        report = await partitions.maintain_partitions(conn)
+    for table, changes in report.items():
+        app_logger.info(f"Partitions of {table}: created {changes['created'] or 'none'}, expired {changes['expired'] or 'none'}")
+
+
+# Also runs at startup: a process restarted more often than the interval must still premake partitions
+register_periodic("maintain_partitions", PARTITION_MAINTENANCE_INTERVAL_SECONDS, maintain_partitions, run_on_start=True)
+
+
+BLOB_CLEANUP_INTERVAL_SECONDS = float(os.getenv("BLOB_CLEANUP_INTERVAL_SECONDS", "3600"))
+BLOB_CLEANUP_BATCH_SIZE = int(os.getenv("BLOB_CLEANUP_BATCH_SIZE", "200"))
+UPLOADS_DIR = Path(os.getenv("UPLOADS_DIR", "uploads"))
+
+
+def _set_aside(file_ids: List[str], moved: List[Path]):
+    for file_id in file_ids:
+        path = UPLOADS_DIR / file_id
+        removed = UPLOADS_DIR / f".removed-{file_id}"
+        try:
+            os.replace(path, removed)
+        except FileNotFoundError:
+            continue
+        moved.append(removed)
+
+
+def _restore(moved: List[Path]):
+    for removed in moved:
+        os.replace(removed, removed.with_name(removed.name[len(".removed-"):]))
+
+
+def _remove_files(moved: List[Path]):
+    for removed in moved:
+        removed.unlink(missing_ok=True)
+
+
+async def remove_unreferenced_blobs():
+    """
+    Deletes upload files no art object references any more (upload_blobs.ref_count = 0)
+    in bounded batches. Files are unlinked after the batch commits. Before that they are
+    only renamed, while the deleted rows are still locked: once the rows are gone an
+    upload of the same content stores its file under the same name again, and the
+    rename keeps the unlink away from it. If the commit fails the files are renamed back.
+    """
+    total = 0
+    while True:
+        moved: List[Path] = []
+        try:
+            async with db.acquire_connection() as conn:
+                async with conn.transaction():
+                    file_ids = await db.delete_unreferenced_blobs(conn, BLOB_CLEANUP_BATCH_SIZE)
+                    await run_in_threadpool(_set_aside, file_ids, moved)
+        except BaseException:
+            await run_in_threadpool(_restore, moved)
+            raise
+        await run_in_threadpool(_remove_files, moved)
+        total += len(file_ids)
+        if len(file_ids) < BLOB_CLEANUP_BATCH_SIZE:
+            break
+        await asyncio.sleep(0)
+    if total:
+        app_logger.info(f"Removed {total} unreferenced upload files")
+
+
+register_periodic("remove_unreferenced_blobs", BLOB_CLEANUP_INTERVAL_SECONDS, remove_unreferenced_blobs)
@@ -0,0 +1,129 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения из .env файла
+load_dotenv()
+
+
+class TTLCache:
+    """
+    Bounded in-process LRU cache with per-entry time-to-live.
+
+    Every worker process keeps its own copy, so invalidation only reaches the
+    local process; the TTL bounds how stale other workers can get.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached value or None if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        """Stores a value, evicting the least recently used entries when full."""
+        if self.max_size <= 0:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """Removes a single entry if present."""
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        """Removes all entries."""
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+# Cache of authenticated users (user_id -> app.schemas.User) used by get_current_user
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
+user_cache = TTLCache(max_size=USER_CACHE_MAX_SIZE, ttl_seconds=USER_CACHE_TTL_SECONDS)
+
+
+# Decoded and verified JWT claims keyed by (secret, SHA-256 of the token). Each entry
+# is stored with a TTL that ends at the token's own "exp".
+JWT_CACHE_MAX_SIZE = int(os.getenv("JWT_CACHE_MAX_SIZE", "20000"))
+
+decoded_token_cache = TTLCache(max_size=JWT_CACHE_MAX_SIZE, ttl_seconds=0)
+
+
+# Moments of the latest profile change (user_id -> unix time). Access tokens with
+# embedded user claims issued before that moment are treated as stale. Entries only
+# need to outlive the claims staleness bound, after which such tokens are stale anyway.
+ACCESS_TOKEN_CLAIMS_MAX_AGE_SECONDS = int(os.getenv("ACCESS_TOKEN_CLAIMS_MAX_AGE_SECONDS", "300"))
+
+profile_changes = TTLCache(max_size=USER_CACHE_MAX_SIZE, ttl_seconds=ACCESS_TOKEN_CLAIMS_MAX_AGE_SECONDS)
+
+
+def invalidate_user(user_id: int):
+    """Drops a user from the authenticated-user cache after their row changes."""
+    user_cache.invalidate(user_id)
+    profile_changes.set(user_id, time.time())
+
+
+# Shared head of the public feed: the newest FEED_CACHE_WINDOW feed items, formatted once
+# for all users (see get_public_photos). Per-user parts - own photos and is_imported -
+# are applied to the cached items on every request. FEED_CACHE_WINDOW=0 disables it.
+FEED_CACHE_WINDOW = int(os.getenv("FEED_CACHE_WINDOW", "1000"))
+FEED_CACHE_TTL_SECONDS = float(os.getenv("FEED_CACHE_TTL_SECONDS", "15"))
+
+public_feed_cache = TTLCache(max_size=1 if FEED_CACHE_WINDOW > 0 else 0, ttl_seconds=FEED_CACHE_TTL_SECONDS)
+
+# The feed head is cached under the current generation, so a reload that started before
+# an invalidation stores its (stale) result under a key nobody reads any more
+_public_feed_generation = 0
+
+
+def public_feed_key() -> int:
+    return _public_feed_generation
+
+
+def invalidate_public_feed():
+    """Drops the cached feed head after a change to what the feed shows."""
+    global _public_feed_generation
+    _public_feed_generation += 1
+    public_feed_cache.clear()
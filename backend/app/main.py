@@ -7,7 +7,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
 from app.logging_config import app_logger
-from postgresql.database import connect_db, close_db
+from postgresql.database import connect_db, close_db, PoolExhaustedError
+from postgresql.migrate import run_startup_migrations
+from app.background import start_background_tasks, stop_background_tasks
 from app.routers import health, auth, photos, trades, websocket, transfers, profile_requests
 
 # Загружаем переменные окружения из .env файла
@@ -61,6 +63,25 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         }
     )
 
+@app.exception_handler(PoolExhaustedError)
+async def pool_exhausted_exception_handler(request: Request, exc: PoolExhaustedError):
+    """
+    Sheds load when no database connection is available in time: fails fast with 503
+    and Retry-After instead of letting requests queue up without limit.
+    """
+    app_logger.warning(f"Shedding {request.method} {request.url}: {exc.reason}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service is temporarily overloaded, please retry later."},
+        headers={
+            "Retry-After": str(exc.retry_after),
+            "Access-Control-Allow-Origin": origins[0] if origins else "https://whitea.cloud",
+            "Access-Control-Allow-Credentials": "true",
+            "Access-Control-Allow-Methods": "*",
+            "Access-Control-Allow-Headers": "*",
+        }
+    )
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     """
@@ -94,20 +115,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=cors_methods,
     allow_headers=["*"],
-    expose_headers=["*"],
+    # "*" is not honoured for credentialed requests, so custom headers are listed explicitly
+    expose_headers=["*", "Retry-After", "X-Next-Cursor"],
     max_age=cors_max_age,
 )
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Connects to the database and confirms logging setup."""
+    """Checks the schema version, connects to the database and confirms logging setup."""
     app_logger.info("Logging configured successfully. Application starting up.")
+    # Before the pool: its connections prepare statements against the schema
+    await run_startup_migrations()
     await connect_db()
+    start_background_tasks()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Closes the database connection when the application shuts down."""
+    """Stops background tasks and closes the database connection when the application shuts down."""
+    await stop_background_tasks()
     await close_db()
 
 # Include routers
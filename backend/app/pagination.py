@@ -0,0 +1,60 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Response, status
+
+# Загружаем переменные окружения из .env файла
+load_dotenv()
+
+# Page size when a client asks for a cursor page without a limit, and the largest allowed
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "50"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "200"))
+
+# Response header with the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Paginated ids are INTEGER (int4) columns
+_ID_MIN, _ID_MAX = -2**31, 2**31 - 1
+
+
+def encode_cursor(created_at: datetime, item_id: int) -> str:
+    """Builds an opaque cursor pointing just past the (created_at, id) of the last item on a page."""
+    raw = json.dumps([created_at.isoformat(), item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[Optional[datetime], Optional[int]]:
+    """Returns the (created_at, id) position of a cursor, or (None, None) for the first page."""
+    if not cursor:
+        return None, None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, item_id = json.loads(raw)
+        created_at = datetime.fromisoformat(created_at)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    # Cursors are built from TIMESTAMPTZ values; a naive one cannot be compared with them.
+    # An id that is not an int4 would fail in the database instead of here
+    if (
+        created_at.tzinfo is None
+        or type(item_id) is not int
+        or not _ID_MIN <= item_id <= _ID_MAX
+    ):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return created_at, item_id
+
+
+def finish_page(response: Response, rows: list, limit: int) -> list:
+    """
+    Trims rows fetched with LIMIT limit + 1 to one page and, when the extra row shows
+    that more items follow, sets the next-page cursor header.
+    """
+    if len(rows) <= limit:
+        return rows
+    page = rows[:limit]
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(page[-1]["created_at"], page[-1]["id"])
+    return page
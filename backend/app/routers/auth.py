@@ -3,20 +3,25 @@ from urllib.parse import parse_qsl
 from datetime import datetime, timezone
 
 from fastapi import APIRouter, Depends, HTTPException, Body
-from postgresql.database import get_connection, upsert_user, store_refresh_token, get_refresh_token
+from postgresql.database import (
+    LazyConnection, get_auth_connection, get_connection, upsert_user, store_refresh_token, get_refresh_token, get_user_by_id,
+    touch_last_seen
+)
 from app.security import (
     validate_init_data, create_access_token, create_refresh_token,
-    verify_token, REFRESH_SECRET_KEY, SECRET_KEY, get_current_user
+    verify_token, REFRESH_SECRET_KEY, SECRET_KEY, get_current_user,
+    ACCESS_TOKEN_EMBED_USER
 )
 from app.schemas import Token, UserData
-import asyncpg
+from app.cache import invalidate_user, invalidate_public_feed
+from postgresql import queries
 
 router = APIRouter(prefix="/auth", tags=["Аутентификация"])
 
 @router.post("/login", response_model=Token)
 async def login_for_access_token(
     init_data: str = Body(..., embed=True, description="Строка InitData, полученная от мессенджера."),
-    conn: asyncpg.Connection = Depends(get_connection)
+    conn: LazyConnection = Depends(get_auth_connection)
 ):
     """
     Аутентификация пользователя на основе InitData и возврат JWT.
@@ -37,21 +42,24 @@ async def login_for_access_token(
     except (json.JSONDecodeError, KeyError) as e:
         raise HTTPException(status_code=400, detail=f"Could not parse user data: {e}")
 
-    user_record = await upsert_user(conn, user_data)
-    if not user_record:
-        raise HTTPException(status_code=500, detail="Could not create or update user")
+    # The user and the refresh token are written on one connection, or not at all
+    async with conn.transaction():
+        user_record = await upsert_user(conn, user_data)
+        if not user_record:
+            raise HTTPException(status_code=500, detail="Could not create or update user")
 
-    # Determine if the user is new by comparing timestamps
-    # A small delta accounts for the transaction time.
-    is_new_user = (user_record["last_seen_at"] - user_record["created_at"]).total_seconds() < 2
+        # Set by the INSERT branch of the upsert; timestamps cannot tell, since
+        # last_seen_at of a returning user is written later in batches
+        is_new_user = user_record["inserted"]
 
-    user_id = user_record["id"]
-    token_data = {"sub": str(user_id)}
+        user_id = user_record["id"]
+        token_data = {"sub": str(user_id)}
 
-    access_token = create_access_token(data=token_data)
-    refresh_token, refresh_token_expires_at = create_refresh_token(data=token_data)
+        access_token = create_access_token(data=token_data, user=user_record)
+        refresh_token, refresh_token_expires_at = create_refresh_token(data=token_data)
 
-    await store_refresh_token(conn, user_id, refresh_token, refresh_token_expires_at)
+        await store_refresh_token(conn, user_id, refresh_token, refresh_token_expires_at)
+    touch_last_seen(user_id)
 
     return {
         "access_token": access_token,
@@ -63,7 +71,7 @@ async def login_for_access_token(
 @router.post("/refresh", response_model=Token)
 async def refresh_access_token(
     refresh_token: str = Body(..., embed=True, description="Refresh токен для получения новой пары токенов."),
-    conn: asyncpg.Connection = Depends(get_connection)
+    conn: LazyConnection = Depends(get_auth_connection)
 ):
     """
     Обновляет access токен с помощью refresh токена.
@@ -84,7 +92,14 @@ async def refresh_access_token(
     # refresh token and issue a new one (token rotation).
     # For now, we'll just issue a new access token.
 
-    new_access_token = create_access_token(data={"sub": str(token_data.user_id)})
+    user_record = None
+    if ACCESS_TOKEN_EMBED_USER:
+        # Re-read the user so the new token carries fresh claims
+        user_record = await get_user_by_id(conn, token_data.user_id)
+        if not user_record:
+            raise HTTPException(status_code=401, detail="Refresh token is invalid or has expired")
+
+    new_access_token = create_access_token(data={"sub": str(token_data.user_id)}, user=user_record)
     
     return {
         "access_token": new_access_token,
@@ -97,69 +112,66 @@ async def refresh_access_token(
 async def toggle_public_profile(
     is_public: bool = Body(..., embed=True),
     current_user = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection)
+    conn: LazyConnection = Depends(get_connection)
 ):
     """
     Toggle public profile setting for the current user.
     When enabled, all photos become public. When disabled, all photos become private.
     """
+    deleted_imports = []
     async with conn.transaction():
         # Update user's public profile setting
-        await conn.execute(
-            "UPDATE users SET is_public_profile = $1 WHERE id = $2",
+        user_record = await queries.fetchrow(
+            conn, "users.set_public_profile",
             is_public,
             current_user.id
         )
         
         # Update all user's photos to match the profile setting
-        await conn.execute(
-            "UPDATE art_objects SET is_public = $1 WHERE owner_id = $2",
+        await queries.execute(
+            conn, "photos.set_public_for_owner",
             is_public,
             current_user.id
         )
         
         # If making profile private, remove all imported copies from other users
         if not is_public:
-            deleted_imports = await conn.fetch(
-                """
-                DELETE FROM imported_photos
-                WHERE photo_id IN (
-                    SELECT id FROM art_objects WHERE owner_id = $1
-                )
-                AND user_id != $1
-                RETURNING user_id
-                """,
+            deleted_imports = await queries.fetch(
+                conn, "imports.delete_others_of_owner",
                 current_user.id
             )
-            
-            # Notify affected users
-            from app.routers.photos import notify_materials_updated
-            notified_users = set()
-            for user_record in deleted_imports:
-                user_id = user_record["user_id"]
-                if user_id not in notified_users:
-                    notified_users.add(user_id)
-                    try:
-                        await notify_materials_updated(user_id)
-                    except Exception as e:
-                        print(f"Failed to notify user {user_id}: {e}")
-        
-        return {
-            "success": True,
-            "is_public_profile": is_public,
-            "message": "Профиль теперь публичный" if is_public else "Профиль теперь приватный"
-        }
+
+    invalidate_user(current_user.id)
+    invalidate_public_feed()
+
+    # Notify affected users (after commit, without holding a connection)
+    from app.routers.photos import notify_materials_updated
+    for user_id in {record["user_id"] for record in deleted_imports}:
+        try:
+            await notify_materials_updated(user_id)
+        except Exception as e:
+            print(f"Failed to notify user {user_id}: {e}")
+    
+    response = {
+        "success": True,
+        "is_public_profile": is_public,
+        "message": "Профиль теперь публичный" if is_public else "Профиль теперь приватный"
+    }
+    if ACCESS_TOKEN_EMBED_USER and user_record:
+        # Tokens issued before this change are stale now; hand out a fresh one
+        response["access_token"] = create_access_token(data={"sub": str(current_user.id)}, user=user_record)
+    return response
 
 @router.get("/profile-settings")
 async def get_profile_settings(
     current_user = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection)
+    conn: LazyConnection = Depends(get_connection)
 ):
     """
     Get current user's profile settings.
     """
-    user = await conn.fetchrow(
-        "SELECT is_public_profile, contact_link FROM users WHERE id = $1",
+    user = await queries.fetchrow(
+        conn, "users.profile_settings",
         current_user.id
     )
     
@@ -175,7 +187,7 @@ async def get_profile_settings(
 async def update_contact_link(
     contact_link: str = Body(..., embed=True),
     current_user = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection)
+    conn: LazyConnection = Depends(get_connection)
 ):
     """
     Update user's contact link (shown in public profile).
@@ -190,13 +202,17 @@ async def update_contact_link(
     # Allow empty string to clear the link
     link_to_save = contact_link if contact_link else None
     
-    await conn.execute(
-        "UPDATE users SET contact_link = $1 WHERE id = $2",
+    user_record = await queries.fetchrow(
+        conn, "users.set_contact_link",
         link_to_save,
         current_user.id
     )
+    invalidate_user(current_user.id)
     
-    return {
+    response = {
         "success": True,
         "contact_link": link_to_save
     }
+    if ACCESS_TOKEN_EMBED_USER and user_record:
+        response["access_token"] = create_access_token(data={"sub": str(current_user.id)}, user=user_record)
+    return response
@@ -1,18 +1,65 @@
+import os
+
+from dotenv import load_dotenv
 from fastapi import APIRouter, Depends, HTTPException
-from postgresql.database import get_connection
-import asyncpg
+from postgresql.database import LazyConnection, PoolExhaustedError, get_health_connection, get_pool_stats
+from postgresql.metrics import get_query_stats, DB_SLOW_QUERY_MS
+from postgresql import queries
+from app.cache import user_cache, decoded_token_cache, public_feed_cache
+from app.background import get_reaper_stats
+
+# Загружаем переменные окружения из .env файла
+load_dotenv()
+
+# /health/stats and /health/queries expose pool internals and SQL statistics: off by default
+HEALTH_STATS_ENABLED = os.getenv("HEALTH_STATS_ENABLED", "false").lower() == "true"
 
 router = APIRouter()
 
+def require_health_stats_enabled():
+    """Hides the diagnostic endpoints (404) unless HEALTH_STATS_ENABLED=true."""
+    if not HEALTH_STATS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
 @router.get("/health", summary="Проверка работоспособности", tags=["Система"], response_model=dict)
-async def health_check(conn: asyncpg.Connection = Depends(get_connection)):
+async def health_check(conn: LazyConnection = Depends(get_health_connection)):
     """
     Выполняет проверку работоспособности приложения и его зависимостей.
     Проверяет подключение к базе данных.
     """
     try:
         # Attempt to fetch a simple value from the database to confirm connectivity
-        await conn.fetchval("SELECT 1")
+        await queries.fetchval(conn, "health.ping")
         return {"status": "ok", "database": "connected"}
+    except PoolExhaustedError:
+        # Overloaded, not down: let the shedding handler answer 503 with Retry-After
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {e}")
+
+@router.get("/health/stats", summary="Статистика кешей и пула соединений", tags=["Система"], response_model=dict,
+            include_in_schema=HEALTH_STATS_ENABLED, dependencies=[Depends(require_health_stats_enabled)])
+async def health_stats():
+    """
+    Возвращает внутренние счетчики процесса (кеши, пул соединений, очистка
+    просроченных записей) для оценки нагрузки на БД.
+    """
+    return {
+        "user_cache": user_cache.stats(),
+        "decoded_token_cache": decoded_token_cache.stats(),
+        "public_feed_cache": public_feed_cache.stats(),
+        "db_pool": get_pool_stats(),
+        "reaper": get_reaper_stats(),
+    }
+
+@router.get("/health/queries", summary="Статистика времени выполнения SQL-запросов", tags=["Система"], response_model=dict,
+            include_in_schema=HEALTH_STATS_ENABLED, dependencies=[Depends(require_health_stats_enabled)])
+async def health_queries():
+    """
+    Возвращает гистограммы времени выполнения по каждому именованному SQL-запросу
+    (с момента запуска процесса), самые затратные запросы первыми.
+    """
+    return {
+        "slow_query_ms": DB_SLOW_QUERY_MS,
+        "queries": get_query_stats(),
+    }
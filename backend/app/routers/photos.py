@@ -1,16 +1,19 @@
-import shutil
-import uuid
+import asyncio
 import json
 import os
 from pathlib import Path
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Body
-from typing import List
-import asyncpg
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Body, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
 from app.security import get_current_user
 from app.schemas import User
+from app.cache import FEED_CACHE_WINDOW, public_feed_cache, public_feed_key, invalidate_public_feed
+from app.uploads import UPLOAD_OPENAPI, StoredUpload, discard_uploads, parse_sha256s, place_uploads, receive_uploads
+from app.pagination import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, decode_cursor, finish_page
 from postgresql import database as db
+from postgresql import queries
 from app.logging_config import app_logger
 
 # Загружаем переменные окружения
@@ -41,109 +44,201 @@ def get_cors_origin():
     except:
         return os.getenv("CORS_ORIGINS", "https://whitea.cloud").split(",")[0].strip()
 
+def _owned_photo_item(photo, base_url: str) -> dict:
+    return {
+        "id": photo["id"],
+        "url": f"{base_url}/uploads/{photo['file_id']}",
+        "file_id": photo["file_id"],
+        "created_at": photo["created_at"],
+        "description": photo.get("description"),
+        "tags": photo.get("tags") or [],
+        "is_public": photo.get("is_public", False),
+        "is_imported": False,
+        "is_own": True
+    }
+
+def _uploaded_photo_item(art_object) -> dict:
+    return {
+        "id": art_object["id"],
+        "url": f"{BASE_URL}/uploads/{art_object['file_id']}",
+        "file_id": art_object["file_id"],
+        "created_at": art_object["created_at"]
+    }
+
+def _imported_photo_item(photo, base_url: str) -> dict:
+    return {
+        "id": photo["id"],
+        "url": f"{base_url}/uploads/{photo['file_id']}",
+        "file_id": photo["file_id"],
+        "created_at": photo["created_at"],
+        "description": photo.get("description"),
+        "tags": photo.get("tags") or [],
+        "is_public": photo.get("is_public", False),
+        "imported_at": photo["imported_at"],
+        "is_imported": True,
+        "is_own": False,
+        "owner_id": photo["owner_id"]
+    }
+
 @router.get("/", response_model=List[dict])
 async def get_user_photos(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_read_connection)
 ):
     """
-    Retrieves a list of all photos for the currently authenticated user,
+    Retrieves the photos of the currently authenticated user,
     including both owned photos and imported (requested) photos.
+
+    With `limit` and/or `cursor` the owned and imported photos are returned as one
+    stream, newest first by (created_at, id), one page at a time; the cursor of the
+    next page is sent in the X-Next-Cursor header. Without them all photos are
+    returned at once (legacy behaviour).
     """
+    base_url = BASE_URL
+
+    if cursor is not None or limit is not None:
+        page_size = limit or PAGE_SIZE_DEFAULT
+        after_created_at, after_id = decode_cursor(cursor)
+        rows = await queries.fetch(
+            conn, "photos.gallery_page",
+            current_user.id, after_created_at, after_id, page_size + 1
+        )
+        return [
+            _imported_photo_item(photo, base_url) if photo["is_imported"] else _owned_photo_item(photo, base_url)
+            for photo in finish_page(response, rows, page_size)
+        ]
+
     # Get owned photos
     owned_photos = await db.get_photos_by_owner(conn, owner_id=current_user.id)
     
     # Get imported photos
-    imported_photos_records = await conn.fetch(
-        """
-        SELECT ao.id, ao.file_id, ao.created_at, ao.owner_id, ao.description, ao.tags, ao.is_public, ip.imported_at
-        FROM imported_photos ip
-        JOIN art_objects ao ON ip.photo_id = ao.id
-        WHERE ip.user_id = $1
-        ORDER BY ip.imported_at DESC
-        """,
+    imported_photos_records = await queries.fetch(
+        conn, "imports.photos_by_user",
         current_user.id
     )
     
-    base_url = BASE_URL
-    
-    # Format owned photos
-    result = [
-        {
-            "id": photo["id"],
-            "url": f"{base_url}/uploads/{photo['file_id']}",
-            "file_id": photo["file_id"],
-            "created_at": photo["created_at"],
-            "description": photo.get("description"),
-            "tags": photo.get("tags") or [],
-            "is_public": photo.get("is_public", False),
-            "is_imported": False,
-            "is_own": True
-        }
-        for photo in owned_photos
-    ]
-    
-    # Add imported photos
-    for photo in imported_photos_records:
-        result.append({
-            "id": photo["id"],
-            "url": f"{base_url}/uploads/{photo['file_id']}",
-            "file_id": photo["file_id"],
-            "created_at": photo["created_at"],
-            "description": photo.get("description"),
-            "tags": photo.get("tags") or [],
-            "is_public": photo.get("is_public", False),
-            "imported_at": photo["imported_at"],
-            "is_imported": True,
-            "is_own": False,
-            "owner_id": photo["owner_id"]
-        })
-    
+    result = [_owned_photo_item(photo, base_url) for photo in owned_photos]
+    result.extend(_imported_photo_item(photo, base_url) for photo in imported_photos_records)
     return result
 
-@router.post("/upload", response_model=List[dict], status_code=status.HTTP_201_CREATED)
+@router.post("/upload", response_model=List[dict], status_code=status.HTTP_201_CREATED, openapi_extra=UPLOAD_OPENAPI)
 async def upload_photos(
-    files: List[UploadFile] = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
-    Uploads one or more photo files.
+    Uploads one or more photo files (multipart field `files`).
+    The body is streamed straight into UPLOADS_DIR (see app/uploads.py), files over
+    MAX_UPLOAD_SIZE are rejected with 413. Files are stored by content: an image that
+    is already stored is not written again, its blob gets one more reference.
     """
-    created_photos = []
-    for file in files:
-        if not file.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail=f"File '{file.filename}' is not an image.")
+    uploads = await receive_uploads(request, UPLOADS_DIR)
 
-        # Generate a unique filename
-        file_extension = Path(file.filename).suffix
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = UPLOADS_DIR / unique_filename
+    # Records for all files or none; files without a record are removed
+    try:
+        async with conn.transaction():
+            # One blob per distinct content, named after its first file
+            first_by_content: Dict[bytes, StoredUpload] = {}
+            for upload in uploads:
+                first_by_content.setdefault(upload.sha256, upload)
+            unique = list(first_by_content.values())
+            blobs = await db.store_blobs(
+                conn,
+                sha256s=[upload.sha256 for upload in unique],
+                file_names=[upload.blob_name for upload in unique],
+                sizes=[upload.size for upload in unique],
+            )
+            art_objects = await db.create_art_objects(
+                conn, owner_id=current_user.id, file_names=[blobs[upload.sha256][0] for upload in uploads]
+            )
+    except BaseException:
+        await discard_uploads(uploads)
+        raise
 
-        # Save the file
+    # Files get their blob names only after commit: a file placed earlier would be left
+    # without a blob row if the transaction failed. The committed references keep the
+    # cleanup job away from the blobs
+    try:
+        await place_uploads(uploads, blobs, UPLOADS_DIR)
+    except BaseException:
         try:
-            with file_path.open("wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-        finally:
-            file.file.close()
-
-        # Create database record
-        art_object = await db.create_art_object(conn, owner_id=current_user.id, file_name=unique_filename)
-        created_photos.append({
-            "id": art_object["id"],
-            "url": f"{BASE_URL}/uploads/{art_object['file_id']}",
-            "file_id": art_object["file_id"],
-            "created_at": art_object["created_at"]
-        })
+            await db.delete_photos_by_ids(conn, [art_object["id"] for art_object in art_objects])
+        except Exception as e:
+            app_logger.error(f"Failed to remove photos of a failed upload: {e}")
+        await discard_uploads(uploads)
+        raise
 
+    if any(art_object["in_public_feed"] for art_object in art_objects):
+        invalidate_public_feed()
     await notify_materials_updated(current_user.id)
-    return created_photos
+    return [_uploaded_photo_item(art_object) for art_object in art_objects]
+
+async def _reusable_blobs(conn: db.LazyConnection, user_id: int, digests: List[bytes]) -> Dict[bytes, str]:
+    """
+    Stored contents among `digests` the user may reuse: {sha256: file_id}.
+    Only blobs of the user's own photos count - file names are content hashes and
+    appear in public URLs, so a hash alone does not prove the client has the image.
+    """
+    records = await queries.fetch(conn, "blobs.owned_by_sha256", list(set(digests)), user_id)
+    # A blob whose file went missing needs a real upload to be restored
+    present = await run_in_threadpool(
+        lambda: [record for record in records if (UPLOADS_DIR / record["file_id"]).exists()]
+    )
+    return {bytes(record["sha256"]): record["file_id"] for record in present}
+
+@router.post("/upload/check", response_model=List[str])
+async def check_uploaded_content(
+    sha256: List[str] = Body(..., embed=True),
+    current_user: User = Depends(get_current_user),
+    conn: db.LazyConnection = Depends(db.get_connection)
+):
+    """
+    Returns the SHA-256 digests (hex) of images the server already stores for the
+    user, among up to MAX_UPLOAD_FILES sent. Those can be added with
+    /upload/existing instead of being uploaded again.
+    """
+    digests = parse_sha256s(sha256)
+    stored = await _reusable_blobs(conn, current_user.id, digests)
+    return [value for value, digest in zip(sha256, digests) if digest in stored]
+
+@router.post("/upload/existing", response_model=List[dict], status_code=status.HTTP_201_CREATED)
+async def upload_existing_photos(
+    sha256: List[str] = Body(..., embed=True),
+    current_user: User = Depends(get_current_user),
+    conn: db.LazyConnection = Depends(db.get_connection)
+):
+    """
+    Creates photos from images already stored for the user (see /upload/check),
+    without sending the files. Responds like /upload; 404 if any digest is unknown,
+    then nothing is created.
+    """
+    digests = parse_sha256s(sha256)
+    if not digests:
+        raise HTTPException(status_code=422, detail="No files uploaded.")
+
+    async with conn.transaction():
+        stored = await _reusable_blobs(conn, current_user.id, digests)
+        unknown = [value for value, digest in zip(sha256, digests) if digest not in stored]
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Content is not stored: {', '.join(unknown)}")
+        art_objects = await db.create_art_objects(
+            conn, owner_id=current_user.id, file_names=[stored[digest] for digest in digests]
+        )
+
+    if any(art_object["in_public_feed"] for art_object in art_objects):
+        invalidate_public_feed()
+    await notify_materials_updated(current_user.id)
+    return [_uploaded_photo_item(art_object) for art_object in art_objects]
 
 @router.post("/check-usage")
 async def check_photo_usage(
     photo_ids: List[int] = Body(..., embed=True),
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Checks if photos are used in active requests or permissions.
@@ -156,43 +251,22 @@ async def check_photo_usage(
     
     for photo_id in photo_ids:
         # Проверить, используется ли фото в активных запросах на просмотр профиля
-        profile_requests = await conn.fetch(
-            """
-            SELECT id, status, target_id, requester_id
-            FROM profile_view_requests
-            WHERE $1 = ANY(selected_photo_ids)
-            AND status IN ('pending', 'approved')
-            AND expires_at > NOW()
-            AND target_id = $2
-            """,
+        profile_requests = await queries.fetch(
+            conn, "usage.profile_requests_with_photo",
             photo_id,
             current_user.id
         )
         
         # Проверить, используется ли фото в активных трейдах
-        trades = await conn.fetch(
-            """
-            SELECT id, status, receiver_id
-            FROM trades
-            WHERE art_object_id = $1
-            AND status IN ('pending', 'scanned')
-            AND expires_at > NOW()
-            AND sender_id = $2
-            """,
+        trades = await queries.fetch(
+            conn, "usage.trades_with_photo",
             photo_id,
             current_user.id
         )
         
         # Проверить, используется ли фото в активных запросах на передачу
-        transfers = await conn.fetch(
-            """
-            SELECT id, status, scanner_id
-            FROM pending_transfers
-            WHERE photo_id = $1
-            AND status = 'pending'
-            AND expires_at > NOW()
-            AND sharer_id = $2
-            """,
+        transfers = await queries.fetch(
+            conn, "usage.transfers_with_photo",
             photo_id,
             current_user.id
         )
@@ -220,28 +294,28 @@ async def check_photo_usage(
 async def delete_user_photos(
     photo_ids: List[int] = Body(..., embed=True),
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Deletes one or more photos owned by the current user.
     """
-    async with conn.transaction():
-        try:
-            app_logger.info(f"Delete photos request from user {current_user.id}: {photo_ids}")
-            
-            if not photo_ids:
-                app_logger.warning("Empty photo_ids list provided")
-                from fastapi import Response
-                return Response(
-                    status_code=status.HTTP_204_NO_CONTENT,
-                    headers={
-                        "Access-Control-Allow-Origin": get_cors_origin(),
-                        "Access-Control-Allow-Credentials": "true",
-                        "Access-Control-Allow-Methods": "*",
-                        "Access-Control-Allow-Headers": "*",
-                    }
-                )
+    try:
+        app_logger.info(f"Delete photos request from user {current_user.id}: {photo_ids}")
+        
+        if not photo_ids:
+            app_logger.warning("Empty photo_ids list provided")
+            from fastapi import Response
+            return Response(
+                status_code=status.HTTP_204_NO_CONTENT,
+                headers={
+                    "Access-Control-Allow-Origin": get_cors_origin(),
+                    "Access-Control-Allow-Credentials": "true",
+                    "Access-Control-Allow-Methods": "*",
+                    "Access-Control-Allow-Headers": "*",
+                }
+            )
 
+        async with conn.transaction():
             # Fetch the photos to verify ownership and get filenames
             photos_to_delete = await db.get_photos_by_ids(conn, photo_ids)
             app_logger.info(f"Found {len(photos_to_delete)} photos to delete")
@@ -262,86 +336,51 @@ async def delete_user_photos(
 
             # Удалить связанные записи перед удалением фотографий (в правильном порядке из-за внешних ключей)
             # 1. Удалить записи из ownership_history (ссылается на art_objects)
-            await conn.execute(
-                """
-                DELETE FROM ownership_history
-                WHERE art_object_id = ANY($1::int[])
-                """,
+            await queries.execute(
+                conn, "ownership_history.delete_for_photos",
                 photo_ids
             )
             app_logger.info(f"Deleted ownership history for photos: {photo_ids}")
             
             # 2. Удалить трейды, связанные с этими фотографиями
-            await conn.execute(
-                """
-                DELETE FROM trades
-                WHERE art_object_id = ANY($1::int[])
-                """,
+            await queries.execute(
+                conn, "trades.delete_for_photos",
                 photo_ids
             )
             app_logger.info(f"Deleted trades for photos: {photo_ids}")
             
             # 3. Удалить запросы на передачу, связанные с этими фотографиями
-            await conn.execute(
-                """
-                DELETE FROM pending_transfers
-                WHERE photo_id = ANY($1::int[])
-                """,
+            await queries.execute(
+                conn, "transfers.delete_for_photos",
                 photo_ids
             )
             app_logger.info(f"Deleted pending transfers for photos: {photo_ids}")
             
             # 4. Получить список пользователей, у которых импортированы эти фото, и уведомить их
-            users_with_imports = await conn.fetch(
-                """
-                SELECT DISTINCT user_id
-                FROM imported_photos
-                WHERE photo_id = ANY($1::int[])
-                """,
+            users_with_imports = await queries.fetch(
+                conn, "imports.users_for_photos",
                 photo_ids
             )
             
             # 4a. Удалить импортированные ссылки на эти фото у других пользователей
-            await conn.execute(
-                """
-                DELETE FROM imported_photos
-                WHERE photo_id = ANY($1::int[])
-                """,
+            await queries.execute(
+                conn, "imports.delete_for_photos",
                 photo_ids
             )
             app_logger.info(f"Deleted imported photo references for photos: {photo_ids}")
             
-            # 4b. Уведомить всех пользователей, у которых были импортированы эти фото
-            for user_record in users_with_imports:
-                user_id = user_record["user_id"]
-                if user_id != current_user.id:  # Не уведомляем владельца
-                    try:
-                        await notify_materials_updated(user_id)
-                        app_logger.info(f"Notified user {user_id} about deleted imported photos")
-                    except Exception as e:
-                        app_logger.warning(f"Failed to notify user {user_id}: {e}")
-            
             # 5. Обновить запросы на просмотр профиля - удалить фото из selected_photo_ids
             # Сначала найдем все запросы, которые содержат эти фото
-            requests_to_update = await conn.fetch(
-                """
-                SELECT id, selected_photo_ids
-                FROM profile_view_requests
-                WHERE selected_photo_ids && $1::int[]
-                AND status IN ('pending', 'approved')
-                """,
+            requests_to_update = await queries.fetch(
+                conn, "profile_requests.with_any_photo",
                 photo_ids
             )
             
             for request in requests_to_update:
                 old_ids = request["selected_photo_ids"] or []
                 new_ids = [pid for pid in old_ids if pid not in photo_ids]
-                await conn.execute(
-                    """
-                    UPDATE profile_view_requests
-                    SET selected_photo_ids = $1
-                    WHERE id = $2
-                    """,
+                await queries.execute(
+                    conn, "profile_requests.set_selected_photos",
                     new_ids if new_ids else None,
                     request["id"]
                 )
@@ -351,40 +390,47 @@ async def delete_user_photos(
             deleted_count = await db.delete_photos_by_ids(conn, photo_ids)
             app_logger.info(f"Deleted {deleted_count} photos from database")
 
-            # Delete files from disk (после успешного удаления из БД)
-            for photo in photos_to_delete:
+        # После фиксации транзакции: уведомления и работа с диском не держат соединение
+        if any(photo["in_public_feed"] for photo in photos_to_delete):
+            invalidate_public_feed()
+
+        # 4b. Уведомить всех пользователей, у которых были импортированы эти фото
+        for user_record in users_with_imports:
+            user_id = user_record["user_id"]
+            if user_id != current_user.id:  # Не уведомляем владельца
                 try:
-                    file_path = UPLOADS_DIR / photo["file_id"]
-                    if file_path.exists():
-                        file_path.unlink(missing_ok=True)
-                        app_logger.info(f"Deleted file: {photo['file_id']}")
+                    await notify_materials_updated(user_id)
+                    app_logger.info(f"Notified user {user_id} about deleted imported photos")
                 except Exception as e:
-                    # Log this error but don't block DB deletion
-                    app_logger.warning(f"Error deleting file {photo['file_id']}: {e}")
+                    app_logger.warning(f"Failed to notify user {user_id}: {e}")
 
-            await notify_materials_updated(current_user.id)
-            
-            from fastapi import Response
-            return Response(
-                status_code=status.HTTP_204_NO_CONTENT,
-                headers={
-                    "Access-Control-Allow-Origin": get_cors_origin(),
-                    "Access-Control-Allow-Credentials": "true",
-                    "Access-Control-Allow-Methods": "*",
-                    "Access-Control-Allow-Headers": "*",
-                }
-            )
-        except HTTPException:
-            raise
-        except Exception as e:
-            app_logger.error(f"Error deleting photos: {e}", exc_info=e)
-            raise HTTPException(status_code=500, detail=f"Failed to delete photos: {str(e)}")
+        # Файлы не удаляются здесь: они общие (upload_blobs), удаление фото снимает
+        # ссылку, а файлы без ссылок удаляет фоновая задача (app/background.py)
+
+        await notify_materials_updated(current_user.id)
+        
+        from fastapi import Response
+        return Response(
+            status_code=status.HTTP_204_NO_CONTENT,
+            headers={
+                "Access-Control-Allow-Origin": get_cors_origin(),
+                "Access-Control-Allow-Credentials": "true",
+                "Access-Control-Allow-Methods": "*",
+                "Access-Control-Allow-Headers": "*",
+            }
+        )
+    except (HTTPException, db.PoolExhaustedError):
+        # No connection in time is load shedding (503 + Retry-After), not a failed delete
+        raise
+    except Exception as e:
+        app_logger.error(f"Error deleting photos: {e}", exc_info=e)
+        raise HTTPException(status_code=500, detail=f"Failed to delete photos: {str(e)}")
 
 @router.post("/import/{photo_id}", status_code=status.HTTP_201_CREATED)
 async def import_photo(
     photo_id: int,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Imports (requests) a specific photo from another user's profile.
@@ -392,8 +438,8 @@ async def import_photo(
     """
     async with conn.transaction():
         # Check if the photo exists
-        photo = await conn.fetchrow(
-            "SELECT id, owner_id, is_public FROM art_objects WHERE id = $1",
+        photo = await queries.fetchrow(
+            conn, "photos.get_visibility",
             photo_id
         )
         
@@ -418,17 +464,8 @@ async def import_photo(
             has_permission = True
         else:
             # Check if user has permission via approved profile request
-            has_permission = await conn.fetchval(
-                """
-                SELECT EXISTS(
-                    SELECT 1 FROM profile_view_requests
-                    WHERE requester_id = $1
-                    AND target_id = $2
-                    AND status = 'approved'
-                    AND $3 = ANY(selected_photo_ids)
-                    AND expires_at > NOW()
-                )
-                """,
+            has_permission = await queries.fetchval(
+                conn, "profile_requests.has_approved_photo",
                 current_user.id,
                 photo["owner_id"],
                 photo_id
@@ -441,13 +478,8 @@ async def import_photo(
             )
         
         # Check if already imported
-        already_imported = await conn.fetchval(
-            """
-            SELECT EXISTS(
-                SELECT 1 FROM imported_photos
-                WHERE user_id = $1 AND photo_id = $2
-            )
-            """,
+        already_imported = await queries.fetchval(
+            conn, "imports.exists",
             current_user.id,
             photo_id
         )
@@ -459,26 +491,23 @@ async def import_photo(
             )
         
         # Import the photo
-        await conn.execute(
-            """
-            INSERT INTO imported_photos (user_id, photo_id)
-            VALUES ($1, $2)
-            """,
+        await queries.execute(
+            conn, "imports.insert",
             current_user.id,
             photo_id
         )
         
-        app_logger.info(f"User {current_user.id} imported photo {photo_id} from user {photo['owner_id']}")
-        
-        await notify_materials_updated(current_user.id)
-        
-        return {"message": "Photo imported successfully", "photo_id": photo_id}
+    app_logger.info(f"User {current_user.id} imported photo {photo_id} from user {photo['owner_id']}")
+    
+    await notify_materials_updated(current_user.id)
+    
+    return {"message": "Photo imported successfully", "photo_id": photo_id}
 
 @router.delete("/imported/{photo_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_imported_photo(
     photo_id: int,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Removes an imported photo from the user's collection.
@@ -486,11 +515,8 @@ async def remove_imported_photo(
     """
     async with conn.transaction():
         # Check if the photo is imported by this user
-        imported = await conn.fetchrow(
-            """
-            SELECT id FROM imported_photos
-            WHERE user_id = $1 AND photo_id = $2
-            """,
+        imported = await queries.fetchrow(
+            conn, "imports.get",
             current_user.id,
             photo_id
         )
@@ -502,36 +528,30 @@ async def remove_imported_photo(
             )
         
         # Remove the import
-        await conn.execute(
-            """
-            DELETE FROM imported_photos
-            WHERE user_id = $1 AND photo_id = $2
-            """,
+        await queries.execute(
+            conn, "imports.delete",
             current_user.id,
             photo_id
         )
         
-        app_logger.info(f"User {current_user.id} removed imported photo {photo_id}")
-        
-        await notify_materials_updated(current_user.id)
-        
-        from fastapi import Response
-        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    app_logger.info(f"User {current_user.id} removed imported photo {photo_id}")
+    
+    await notify_materials_updated(current_user.id)
+    
+    from fastapi import Response
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @router.get("/imported/ids", response_model=List[int])
 async def get_imported_photo_ids(
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Get list of photo IDs that the current user has imported.
     Returns just the IDs for quick checks.
     """
-    photo_ids = await conn.fetch(
-        """
-        SELECT photo_id FROM imported_photos
-        WHERE user_id = $1
-        """,
+    photo_ids = await queries.fetch(
+        conn, "imports.photo_ids_by_user",
         current_user.id
     )
     
@@ -541,7 +561,7 @@ async def get_imported_photo_ids(
 async def add_favorite(
     photo_id: int,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Add a photo to user's favorites.
@@ -549,10 +569,8 @@ async def add_favorite(
     """
     async with conn.transaction():
         # Check if photo exists and user has access to it
-        photo = await conn.fetchrow(
-            """
-            SELECT id, owner_id FROM art_objects WHERE id = $1
-            """,
+        photo = await queries.fetchrow(
+            conn, "photos.get_owner",
             photo_id
         )
         
@@ -568,13 +586,8 @@ async def add_favorite(
             has_access = True
         else:
             # Check if imported
-            is_imported = await conn.fetchval(
-                """
-                SELECT EXISTS(
-                    SELECT 1 FROM imported_photos
-                    WHERE user_id = $1 AND photo_id = $2
-                )
-                """,
+            is_imported = await queries.fetchval(
+                conn, "imports.exists",
                 current_user.id,
                 photo_id
             )
@@ -587,13 +600,8 @@ async def add_favorite(
             )
         
         # Check if already favorited
-        already_favorited = await conn.fetchval(
-            """
-            SELECT EXISTS(
-                SELECT 1 FROM favorite_photos
-                WHERE user_id = $1 AND photo_id = $2
-            )
-            """,
+        already_favorited = await queries.fetchval(
+            conn, "favorites.exists",
             current_user.id,
             photo_id
         )
@@ -605,11 +613,8 @@ async def add_favorite(
             )
         
         # Add to favorites
-        await conn.execute(
-            """
-            INSERT INTO favorite_photos (user_id, photo_id)
-            VALUES ($1, $2)
-            """,
+        await queries.execute(
+            conn, "favorites.insert",
             current_user.id,
             photo_id
         )
@@ -622,18 +627,15 @@ async def add_favorite(
 async def remove_favorite(
     photo_id: int,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Remove a photo from user's favorites.
     """
     async with conn.transaction():
         # Check if the photo is favorited by this user
-        favorited = await conn.fetchrow(
-            """
-            SELECT id FROM favorite_photos
-            WHERE user_id = $1 AND photo_id = $2
-            """,
+        favorited = await queries.fetchrow(
+            conn, "favorites.get",
             current_user.id,
             photo_id
         )
@@ -645,11 +647,8 @@ async def remove_favorite(
             )
         
         # Remove from favorites
-        await conn.execute(
-            """
-            DELETE FROM favorite_photos
-            WHERE user_id = $1 AND photo_id = $2
-            """,
+        await queries.execute(
+            conn, "favorites.delete",
             current_user.id,
             photo_id
         )
@@ -662,20 +661,13 @@ async def remove_favorite(
 @router.get("/favorites", response_model=List[dict])
 async def get_favorites(
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Get all favorite photos for the current user.
     """
-    favorites = await conn.fetch(
-        """
-        SELECT ao.id, ao.file_id, ao.created_at, ao.owner_id, fp.favorited_at,
-               CASE WHEN ao.owner_id = $1 THEN false ELSE true END as is_imported
-        FROM favorite_photos fp
-        JOIN art_objects ao ON fp.photo_id = ao.id
-        WHERE fp.user_id = $1
-        ORDER BY fp.favorited_at DESC
-        """,
+    favorites = await queries.fetch(
+        conn, "favorites.photos_by_user",
         current_user.id
     )
     
@@ -698,17 +690,14 @@ async def get_favorites(
 @router.get("/favorites/ids", response_model=List[int])
 async def get_favorite_ids(
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Get list of photo IDs that are in user's favorites.
     Returns just the IDs for quick checks.
     """
-    photo_ids = await conn.fetch(
-        """
-        SELECT photo_id FROM favorite_photos
-        WHERE user_id = $1
-        """,
+    photo_ids = await queries.fetch(
+        conn, "favorites.photo_ids_by_user",
         current_user.id
     )
     
@@ -721,7 +710,7 @@ async def update_photo_metadata(
     tags: List[str] = Body(None),
     is_public: bool = Body(None),
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Update photo metadata (description, tags, and/or is_public).
@@ -729,8 +718,8 @@ async def update_photo_metadata(
     """
     async with conn.transaction():
         # Check if photo exists and user owns it
-        photo = await conn.fetchrow(
-            "SELECT id, owner_id FROM art_objects WHERE id = $1",
+        photo = await queries.fetchrow(
+            conn, "photos.get_owner",
             photo_id
         )
         
@@ -746,154 +735,176 @@ async def update_photo_metadata(
                 detail="You do not have permission to edit this photo."
             )
         
-        # Build update query dynamically
-        updates = []
-        params = [photo_id]
-        param_count = 2
-        
-        if description is not None:
-            updates.append(f"description = ${param_count}")
-            params.append(description)
-            param_count += 1
-        
-        if tags is not None:
-            updates.append(f"tags = ${param_count}")
-            params.append(tags)
-            param_count += 1
-        
-        if is_public is not None:
-            updates.append(f"is_public = ${param_count}")
-            params.append(is_public)
-            param_count += 1
-        
-        if not updates:
+        if description is None and tags is None and is_public is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="No metadata to update."
             )
         
-        query = f"""
-            UPDATE art_objects
-            SET {', '.join(updates)}
-            WHERE id = $1
-            RETURNING id, description, tags, is_public
-        """
-        
-        updated_photo = await conn.fetchrow(query, *params)
+        # One statement for every combination of fields: NULL keeps the current value
+        updated_photo = await queries.fetchrow(
+            conn, "photos.update_metadata",
+            photo_id,
+            description,
+            tags,
+            is_public
+        )
         
         # If making photo non-public, remove it from other users' imported collections
+        deleted_imports = []
         if is_public is False:
-            deleted_imports = await conn.fetch(
-                """
-                DELETE FROM imported_photos
-                WHERE photo_id = $1 AND user_id != $2
-                RETURNING user_id
-                """,
+            deleted_imports = await queries.fetch(
+                conn, "imports.delete_others_of_photo",
                 photo_id,
                 current_user.id
             )
-            
-            # Notify affected users
-            for user_record in deleted_imports:
-                user_id = user_record["user_id"]
-                try:
-                    await notify_materials_updated(user_id)
-                    app_logger.info(f"Notified user {user_id} about removed public photo {photo_id}")
-                except Exception as e:
-                    app_logger.warning(f"Failed to notify user {user_id}: {e}")
-        
-        app_logger.info(f"User {current_user.id} updated metadata for photo {photo_id}")
-        
-        return {
-            "photo_id": updated_photo["id"],
-            "description": updated_photo["description"],
-            "tags": updated_photo["tags"] or [],
-            "is_public": updated_photo["is_public"]
-        }
+    
+    invalidate_public_feed()
+
+    # Notify affected users
+    for user_record in deleted_imports:
+        user_id = user_record["user_id"]
+        try:
+            await notify_materials_updated(user_id)
+            app_logger.info(f"Notified user {user_id} about removed public photo {photo_id}")
+        except Exception as e:
+            app_logger.warning(f"Failed to notify user {user_id}: {e}")
+    
+    app_logger.info(f"User {current_user.id} updated metadata for photo {photo_id}")
+    
+    return {
+        "photo_id": updated_photo["id"],
+        "description": updated_photo["description"],
+        "tags": updated_photo["tags"] or [],
+        "is_public": updated_photo["is_public"]
+    }
+
+def _public_feed_item(photo, base_url: str) -> dict:
+    """Feed item without the per-user is_imported flag (shared by all viewers)."""
+    return {
+        "id": photo["id"],
+        "url": f"{base_url}/uploads/{photo['file_id']}",
+        "file_id": photo["file_id"],
+        "created_at": photo["created_at"],
+        "description": photo.get("description"),
+        "tags": photo.get("tags") or [],
+        "is_public": photo.get("is_public", False),
+        "owner_id": photo["owner_id"],
+        "owner_name": f"{photo.get('first_name', '')} {photo.get('last_name', '')}".strip() or photo.get("username") or f"User {photo['owner_id']}",
+    }
+
+_feed_window_lock = asyncio.Lock()
+# Cache key of the last reload; a different current key means an invalidation since
+_feed_window_loaded_key: Optional[int] = None
+
+async def _public_feed_window(conn: db.LazyConnection) -> Tuple[List[dict], bool]:
+    """
+    Returns the cached head of the feed and whether it holds the whole feed.
+    On a miss one request reloads it; concurrent requests wait for that result
+    instead of running the same query.
+    """
+    global _feed_window_loaded_key
+    key = public_feed_key()
+    window = public_feed_cache.get(key)
+    if window is None:
+        async with _feed_window_lock:
+            key = public_feed_key()
+            window = public_feed_cache.get(key)
+            if window is None:
+                if key != _feed_window_loaded_key:
+                    # Reload after a write: a lagging replica could put the old feed
+                    # back in the cache for the whole TTL, so read from the primary
+                    async with db.acquire_connection() as primary:
+                        rows = await queries.fetch(primary, "photos.public_feed_window", FEED_CACHE_WINDOW + 1)
+                else:
+                    # Only the TTL expired
+                    rows = await queries.fetch(conn, "photos.public_feed_window", FEED_CACHE_WINDOW + 1)
+                items = [_public_feed_item(row, BASE_URL) for row in rows[:FEED_CACHE_WINDOW]]
+                window = (items, len(rows) <= FEED_CACHE_WINDOW)
+                public_feed_cache.set(key, window)
+                _feed_window_loaded_key = key
+    return window
 
 @router.get("/public", response_model=List[dict])
 async def get_public_photos(
-    limit: int = 20,
-    offset: int = 0,
+    response: Response,
+    limit: int = Query(20, ge=1),
+    cursor: Optional[str] = None,
+    offset: Optional[int] = Query(None, ge=0),
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_read_connection)
 ):
     """
     Get all public photos from all users.
     Returns photos where is_public = true OR owner has is_public_profile = true.
-    Supports pagination.
-    """
-    # Get public photos: is_public = true OR owner has public profile
-    public_photos = await conn.fetch(
-        """
-        SELECT 
-            ao.id,
-            ao.file_id,
-            ao.created_at,
-            ao.owner_id,
-            ao.description,
-            ao.tags,
-            ao.is_public,
-            u.first_name,
-            u.last_name,
-            u.username
-        FROM art_objects ao
-        JOIN users u ON ao.owner_id = u.id
-        WHERE (ao.is_public = true OR u.is_public_profile = true)
-        AND ao.owner_id != $1  -- Exclude current user's own photos
-        ORDER BY ao.created_at DESC
-        LIMIT $2 OFFSET $3
-        """,
-        current_user.id,
-        limit,
-        offset
-    )
-    
-    # Get imported photo IDs for current user to mark which photos are already imported
-    imported_photo_ids = await conn.fetch(
-        """
-        SELECT photo_id FROM imported_photos
-        WHERE user_id = $1
-        """,
-        current_user.id
-    )
-    imported_ids_set = {row["photo_id"] for row in imported_photo_ids}
-    
-    base_url = BASE_URL
-    
-    result = []
-    for photo in public_photos:
-        result.append({
-            "id": photo["id"],
-            "url": f"{base_url}/uploads/{photo['file_id']}",
-            "file_id": photo["file_id"],
-            "created_at": photo["created_at"],
-            "description": photo.get("description"),
-            "tags": photo.get("tags") or [],
-            "is_public": photo.get("is_public", False),
-            "owner_id": photo["owner_id"],
-            "owner_name": f"{photo.get('first_name', '')} {photo.get('last_name', '')}".strip() or photo.get("username") or f"User {photo['owner_id']}",
-            "is_imported": photo["id"] in imported_ids_set
-        })
-    
-    return result
+
+    Paginated by cursor: the next page's cursor comes in the X-Next-Cursor header,
+    newest photos first by (created_at, id). Passing `offset` switches to the old
+    LIMIT/OFFSET pagination (kept for existing clients, and like before without an
+    upper bound on `limit`); cursor pages hold at most PAGE_SIZE_MAX photos.
+
+    Pages inside the cached head of the feed are cut from memory; only deeper
+    pages query the feed itself.
+    """
+    after_created_at, after_id = (None, None) if offset is not None else decode_cursor(cursor)
+    if offset is None:
+        # Clamped rather than rejected: older clients send large limits without offset
+        limit = min(limit, PAGE_SIZE_MAX)
+
+    public_photos = None
+    if FEED_CACHE_WINDOW > 0:
+        items, complete = await _public_feed_window(conn)
+        # The viewer's own photos are not part of their feed
+        visible = [item for item in items if item["owner_id"] != current_user.id]
+        if offset is not None:
+            if complete or offset + limit <= len(visible):
+                public_photos = visible[offset:offset + limit]
+        else:
+            if after_created_at is not None:
+                visible = [item for item in visible if (item["created_at"], item["id"]) < (after_created_at, after_id)]
+            if complete or len(visible) > limit:
+                public_photos = finish_page(response, visible[:limit + 1], limit)
+
+    if public_photos is None:
+        if offset is not None:
+            rows = await queries.fetch(
+                conn, "photos.public_feed",
+                current_user.id,
+                limit,
+                offset
+            )
+            public_photos = [_public_feed_item(row, BASE_URL) for row in rows]
+        else:
+            rows = await queries.fetch(
+                conn, "photos.public_feed_page",
+                current_user.id, after_created_at, after_id, limit + 1
+            )
+            public_photos = finish_page(response, [_public_feed_item(row, BASE_URL) for row in rows], limit)
+
+    # Mark which photos of this page the current user has already imported
+    imported_ids_set = set()
+    if public_photos:
+        imported_photo_ids = await queries.fetch(
+            conn, "imports.photo_ids_by_user_among",
+            current_user.id,
+            [photo["id"] for photo in public_photos]
+        )
+        imported_ids_set = {row["photo_id"] for row in imported_photo_ids}
+
+    return [{**photo, "is_imported": photo["id"] in imported_ids_set} for photo in public_photos]
 
 @router.get("/{photo_id}/metadata")
 async def get_photo_metadata(
     photo_id: int,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Get photo metadata (description, tags, and is_public).
     User must own the photo or have it imported.
     """
-    photo = await conn.fetchrow(
-        """
-        SELECT ao.id, ao.description, ao.tags, ao.is_public, ao.owner_id
-        FROM art_objects ao
-        WHERE ao.id = $1
-        """,
+    photo = await queries.fetchrow(
+        conn, "photos.get_metadata",
         photo_id
     )
     
@@ -909,13 +920,8 @@ async def get_photo_metadata(
     
     if not has_access:
         # Check if imported
-        is_imported = await conn.fetchval(
-            """
-            SELECT EXISTS(
-                SELECT 1 FROM imported_photos
-                WHERE user_id = $1 AND photo_id = $2
-            )
-            """,
+        is_imported = await queries.fetchval(
+            conn, "imports.exists",
             current_user.id,
             photo_id
         )
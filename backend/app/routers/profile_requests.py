@@ -2,14 +2,14 @@ import os
 from fastapi import APIRouter, Depends, HTTPException, status, Body
 from uuid import UUID
 from typing import List, Optional
-import asyncpg
 import logging
 import json
 from dotenv import load_dotenv
 
 from app.security import get_current_user
 from app.schemas import User
-from postgresql.database import get_connection
+from postgresql.database import LazyConnection, get_connection, get_read_connection, get_user_by_id
+from postgresql import queries
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -26,7 +26,7 @@ router = APIRouter(
 @router.get("/public/{user_id}")
 async def get_public_profile(
     user_id: int,
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_read_connection),
 ):
     """
     Get public profile information. No authentication required.
@@ -35,8 +35,8 @@ async def get_public_profile(
     logger.info(f"Public profile request for user_id: {user_id}")
     
     # Get user info
-    user = await conn.fetchrow(
-        "SELECT id, first_name, last_name, username, photo_url, is_public_profile, contact_link FROM users WHERE id = $1",
+    user = await queries.fetchrow(
+        conn, "users.public_profile",
         user_id
     )
     
@@ -66,13 +66,8 @@ async def get_public_profile(
         }
     
     # Get all photos for public profile
-    photos = await conn.fetch(
-        """
-        SELECT id, file_id, created_at, description, tags, is_public
-        FROM art_objects
-        WHERE owner_id = $1
-        ORDER BY created_at DESC
-        """,
+    photos = await queries.fetch(
+        conn, "photos.by_owner_with_metadata",
         user_id
     )
     
@@ -148,11 +143,11 @@ async def notify_materials_updated(user_id: int):
 async def get_user_info(
     user_id: int,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """Get public user information by user ID."""
-    user = await conn.fetchrow(
-        "SELECT id, first_name, last_name, username, photo_url, is_public_profile FROM users WHERE id = $1",
+    user = await queries.fetchrow(
+        conn, "users.public_info",
         user_id
     )
     if not user:
@@ -174,7 +169,7 @@ async def get_user_info(
 async def create_profile_request(
     target_user_id: int = Body(..., embed=True),
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     if target_user_id == current_user.id:
         raise HTTPException(
@@ -182,9 +177,7 @@ async def create_profile_request(
             detail="Cannot request access to your own profile."
         )
 
-    target_user = await conn.fetchrow(
-        "SELECT * FROM users WHERE id = $1", target_user_id
-    )
+    target_user = await get_user_by_id(conn, target_user_id)
     if not target_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -193,14 +186,8 @@ async def create_profile_request(
 
     async with conn.transaction():
         # Сначала проверим, есть ли уже активный pending запрос
-        existing_request = await conn.fetchrow(
-            """
-            SELECT id, created_at, expires_at
-            FROM profile_view_requests
-            WHERE requester_id = $1 AND target_id = $2
-            AND status = 'pending'
-            AND expires_at > NOW()
-            """,
+        existing_request = await queries.fetchrow(
+            conn, "profile_requests.pending_between",
             current_user.id,
             target_user_id
         )
@@ -218,14 +205,8 @@ async def create_profile_request(
         # НЕ отменяем одобренные (approved) запросы - они остаются активными
         # Это гарантирует, что может быть только один pending запрос от одного пользователя к другому
         # Но одобренные разрешения сохраняются при повторном сканировании QR
-        cancelled_count = await conn.execute(
-            """
-            UPDATE profile_view_requests
-            SET status = 'rejected'
-            WHERE requester_id = $1 AND target_id = $2
-            AND status = 'pending'
-            AND expires_at > NOW()
-            """,
+        cancelled_count = await queries.execute(
+            conn, "profile_requests.reject_pending_between",
             current_user.id,
             target_user_id
         )
@@ -233,46 +214,29 @@ async def create_profile_request(
             logger.info(f"Cancelled {cancelled_count} old pending profile requests from user {current_user.id} to user {target_user_id}")
 
         # Создать новый запрос (старые уже отменены, поэтому можно создавать новый)
-        request = await conn.fetchrow(
-            """
-            INSERT INTO profile_view_requests (requester_id, target_id)
-            VALUES ($1, $2)
-            RETURNING id, created_at, expires_at
-            """,
+        request = await queries.fetchrow(
+            conn, "profile_requests.insert",
             current_user.id,
             target_user_id
         )
 
-        await notify_profile_request(current_user.id, target_user_id, str(request["id"]))
+    await notify_profile_request(current_user.id, target_user_id, str(request["id"]))
 
-        logger.info(f"Profile view request created: {request['id']} from {current_user.id} to {target_user_id}")
+    logger.info(f"Profile view request created: {request['id']} from {current_user.id} to {target_user_id}")
 
-        return {
-            "request_id": str(request["id"]),
-            "created_at": request["created_at"],
-            "expires_at": request["expires_at"]
-        }
+    return {
+        "request_id": str(request["id"]),
+        "created_at": request["created_at"],
+        "expires_at": request["expires_at"]
+    }
 
 @router.get("/pending")
 async def get_pending_requests(
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
-    requests = await conn.fetch(
-        """
-        SELECT
-            pvr.id,
-            pvr.requester_id,
-            pvr.created_at,
-            pvr.expires_at,
-            u.first_name,
-            u.last_name,
-            u.username
-        FROM profile_view_requests pvr
-        JOIN users u ON pvr.requester_id = u.id
-        WHERE pvr.target_id = $1 AND pvr.status = 'pending' AND pvr.expires_at > NOW()
-        ORDER BY pvr.created_at DESC
-        """,
+    requests = await queries.fetch(
+        conn, "profile_requests.pending_for_target",
         current_user.id
     )
 
@@ -284,15 +248,11 @@ async def respond_to_request(
     approved: bool = Body(...),
     photo_ids: List[int] = Body(default=[]),
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     async with conn.transaction():
-        request = await conn.fetchrow(
-            """
-            SELECT * FROM profile_view_requests
-            WHERE id = $1 AND target_id = $2
-            FOR UPDATE
-            """,
+        request = await queries.fetchrow(
+            conn, "profile_requests.lock_for_target",
             request_id,
             current_user.id
         )
@@ -320,8 +280,8 @@ async def respond_to_request(
                 )
             
             # Проверить, что все выбранные фото принадлежат пользователю
-            photos = await conn.fetch(
-                "SELECT id FROM art_objects WHERE id = ANY($1) AND owner_id = $2",
+            photos = await queries.fetch(
+                conn, "photos.owned_ids",
                 photo_ids,
                 current_user.id
             )
@@ -335,20 +295,16 @@ async def respond_to_request(
         new_status = "approved" if approved else "rejected"
         selected_ids = photo_ids if approved else []
 
-        await conn.execute(
-            """
-            UPDATE profile_view_requests
-            SET status = $1, selected_photo_ids = $2
-            WHERE id = $3
-            """,
+        await queries.execute(
+            conn, "profile_requests.set_response",
             new_status,
             selected_ids,
             request_id
         )
 
         # Получить имя пользователя для уведомления
-        user_info = await conn.fetchrow(
-            "SELECT first_name, last_name FROM users WHERE id = $1",
+        user_info = await queries.fetchrow(
+            conn, "users.name",
             current_user.id
         )
         target_user_name = None
@@ -357,37 +313,31 @@ async def respond_to_request(
             last_name = user_info["last_name"] or ""
             target_user_name = f"{first_name} {last_name}".strip() or None
 
-        await notify_profile_response(
-            current_user.id,
-            request["requester_id"],
-            approved,
-            selected_ids,
-            str(request_id),
-            target_user_name=target_user_name
-        )
+    await notify_profile_response(
+        current_user.id,
+        request["requester_id"],
+        approved,
+        selected_ids,
+        str(request_id),
+        target_user_name=target_user_name
+    )
 
-        logger.info(f"Profile request {request_id} {new_status} by user {current_user.id}")
+    logger.info(f"Profile request {request_id} {new_status} by user {current_user.id}")
 
-        return {
-            "message": f"Request {new_status}",
-            "photo_count": len(selected_ids) if approved else 0
-        }
+    return {
+        "message": f"Request {new_status}",
+        "photo_count": len(selected_ids) if approved else 0
+    }
 
 @router.get("/user/{user_id}/request-status")
 async def get_request_status(
     user_id: int,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """Get the status of the most recent profile view request from current user to target user."""
-    request = await conn.fetchrow(
-        """
-        SELECT id, status, created_at, expires_at
-        FROM profile_view_requests
-        WHERE target_id = $1 AND requester_id = $2
-        ORDER BY created_at DESC
-        LIMIT 1
-        """,
+    request = await queries.fetchrow(
+        conn, "profile_requests.latest_between",
         user_id,
         current_user.id
     )
@@ -407,15 +357,15 @@ async def get_request_status(
 async def get_user_approved_photos(
     user_id: int,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """
     Get all public photos and approved photos from a specific user.
     If user has public profile, returns ALL photos. Otherwise returns public + approved.
     """
     # Check if the target user has a public profile
-    target_user = await conn.fetchrow(
-        "SELECT is_public_profile FROM users WHERE id = $1",
+    target_user = await queries.fetchrow(
+        conn, "users.is_public_profile",
         user_id
     )
     
@@ -429,13 +379,8 @@ async def get_user_approved_photos(
     
     # If user has public profile, return ALL their photos
     if has_public_profile:
-        photos = await conn.fetch(
-            """
-            SELECT id, file_id, created_at, description, tags, is_public
-            FROM art_objects
-            WHERE owner_id = $1
-            ORDER BY created_at DESC
-            """,
+        photos = await queries.fetch(
+            conn, "photos.by_owner_with_metadata",
             user_id
         )
         
@@ -443,28 +388,16 @@ async def get_user_approved_photos(
     else:
         # Original logic: return public + approved photos
         # Получить все публичные фотографии пользователя (доступны ВСЕГДА)
-        public_photos = await conn.fetch(
-            """
-            SELECT id, file_id, created_at, description, tags, is_public
-            FROM art_objects
-            WHERE owner_id = $1 AND is_public = TRUE
-            ORDER BY created_at DESC
-            """,
+        public_photos = await queries.fetch(
+            conn, "photos.public_by_owner",
             user_id
         )
         
         public_photo_ids = [photo["id"] for photo in public_photos]
         
         # Найти одобренные запросы (дополнительные фото с разрешением)
-        approved_requests = await conn.fetch(
-            """
-            SELECT selected_photo_ids, created_at
-            FROM profile_view_requests
-            WHERE target_id = $1 AND requester_id = $2 AND status = 'approved'
-            AND selected_photo_ids IS NOT NULL AND array_length(selected_photo_ids, 1) > 0
-            AND expires_at > NOW()
-            ORDER BY created_at DESC
-            """,
+        approved_requests = await queries.fetch(
+            conn, "profile_requests.approved_photo_ids",
             user_id,
             current_user.id
         )
@@ -488,13 +421,8 @@ async def get_user_approved_photos(
         logger.info(f"Returning {len(all_photo_ids)} photos for user {current_user.id} from user {user_id}: {len(public_photo_ids)} public + {len(approved_photo_ids)} approved")
 
         # Получить все фотографии
-        photos = await conn.fetch(
-            """
-            SELECT id, file_id, created_at, description, tags, is_public
-            FROM art_objects
-            WHERE id = ANY($1) AND owner_id = $2
-            ORDER BY created_at DESC
-            """,
+        photos = await queries.fetch(
+            conn, "photos.by_ids_of_owner_with_metadata",
             all_photo_ids,
             user_id
         )
@@ -521,13 +449,10 @@ async def get_user_approved_photos(
 async def get_approved_photos(
     request_id: UUID,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
-    request = await conn.fetchrow(
-        """
-        SELECT * FROM profile_view_requests
-        WHERE id = $1 AND requester_id = $2
-        """,
+    request = await queries.fetchrow(
+        conn, "profile_requests.get_for_requester",
         request_id,
         current_user.id
     )
@@ -548,12 +473,8 @@ async def get_approved_photos(
     if not photo_ids:
         return []
 
-    photos = await conn.fetch(
-        """
-        SELECT id, file_id, created_at
-        FROM art_objects
-        WHERE id = ANY($1)
-        """,
+    photos = await queries.fetch(
+        conn, "photos.by_ids",
         photo_ids
     )
 
@@ -572,27 +493,11 @@ async def get_approved_photos(
 @router.get("/my-permissions")
 async def get_my_permissions(
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_read_connection),
 ):
     """Get all approved profile view requests where current user is the target (gave permissions)."""
-    requests = await conn.fetch(
-        """
-        SELECT
-            pvr.id,
-            pvr.requester_id,
-            pvr.status,
-            pvr.selected_photo_ids,
-            pvr.created_at,
-            pvr.expires_at,
-            u.first_name,
-            u.last_name,
-            u.username,
-            u.photo_url
-        FROM profile_view_requests pvr
-        JOIN users u ON pvr.requester_id = u.id
-        WHERE pvr.target_id = $1 AND pvr.status = 'approved'
-        ORDER BY pvr.created_at DESC
-        """,
+    requests = await queries.fetch(
+        conn, "profile_requests.approved_for_target",
         current_user.id
     )
 
@@ -604,13 +509,8 @@ async def get_my_permissions(
         photo_ids = req["selected_photo_ids"] or []
         photos = []
         if photo_ids:
-            photo_records = await conn.fetch(
-                """
-                SELECT id, file_id, created_at
-                FROM art_objects
-                WHERE id = ANY($1) AND owner_id = $2
-                ORDER BY created_at DESC
-                """,
+            photo_records = await queries.fetch(
+                conn, "photos.by_ids_of_owner",
                 photo_ids,
                 current_user.id
             )
@@ -646,7 +546,7 @@ async def update_permission_photos(
     request_id: UUID,
     photo_ids: List[int] = Body(..., embed=True),
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """Update selected photos for an approved permission."""
     async with conn.transaction():
@@ -654,12 +554,8 @@ async def update_permission_photos(
         logger.info(f"Updating permission {request_id} for user {current_user.id}")
         
         # Сначала проверим, существует ли запрос вообще
-        request_check = await conn.fetchrow(
-            """
-            SELECT id, target_id, requester_id, status
-            FROM profile_view_requests
-            WHERE id = $1
-            """,
+        request_check = await queries.fetchrow(
+            conn, "profile_requests.get_summary",
             request_id
         )
         
@@ -673,12 +569,8 @@ async def update_permission_photos(
         logger.info(f"Request found: target_id={request_check['target_id']}, current_user.id={current_user.id}, status={request_check['status']}")
         
         # Теперь проверим права доступа и статус
-        request = await conn.fetchrow(
-            """
-            SELECT * FROM profile_view_requests
-            WHERE id = $1 AND target_id = $2 AND status = 'approved'
-            FOR UPDATE
-            """,
+        request = await queries.fetchrow(
+            conn, "profile_requests.lock_approved_for_target",
             request_id,
             current_user.id
         )
@@ -711,8 +603,8 @@ async def update_permission_photos(
             )
 
         # Проверить, что все выбранные фото принадлежат пользователю
-        photos = await conn.fetch(
-            "SELECT id FROM art_objects WHERE id = ANY($1) AND owner_id = $2",
+        photos = await queries.fetch(
+            conn, "photos.owned_ids",
             photo_ids,
             current_user.id
         )
@@ -731,11 +623,8 @@ async def update_permission_photos(
         
         # Удалить импортированные фото для фото, которые были убраны из разрешения
         if removed_photo_ids:
-            result = await conn.execute(
-                """
-                DELETE FROM imported_photos
-                WHERE user_id = $1 AND photo_id = ANY($2::int[])
-                """,
+            result = await queries.execute(
+                conn, "imports.delete_for_user_photos",
                 request["requester_id"],
                 removed_photo_ids
             )
@@ -743,8 +632,8 @@ async def update_permission_photos(
             logger.info(f"Deleted {deleted_count} imported photos for user {request['requester_id']} after permission update (removed photo IDs: {removed_photo_ids})")
         
         # Получить имя пользователя для уведомления
-        user_info = await conn.fetchrow(
-            "SELECT first_name, last_name FROM users WHERE id = $1",
+        user_info = await queries.fetchrow(
+            conn, "users.name",
             current_user.id
         )
         target_user_name = None
@@ -754,53 +643,45 @@ async def update_permission_photos(
             target_user_name = f"{first_name} {last_name}".strip() or None
         
         # Обновить выбранные фото
-        await conn.execute(
-            """
-            UPDATE profile_view_requests
-            SET selected_photo_ids = $1
-            WHERE id = $2
-            """,
+        await queries.execute(
+            conn, "profile_requests.set_selected_photos",
             photo_ids,
             request_id
         )
 
-        # Уведомить запрашивающего пользователя об обновлении
-        await notify_profile_response(
-            current_user.id,
-            request["requester_id"],
-            True,
-            photo_ids,
-            str(request_id),
-            is_update=True,
-            old_photo_ids=old_photo_ids,
-            target_user_name=target_user_name
-        )
-        
-        # Если были удалены фото, уведомить об обновлении материалов
-        if removed_photo_ids:
-            await notify_materials_updated(request["requester_id"])
+    # Уведомить запрашивающего пользователя об обновлении
+    await notify_profile_response(
+        current_user.id,
+        request["requester_id"],
+        True,
+        photo_ids,
+        str(request_id),
+        is_update=True,
+        old_photo_ids=old_photo_ids,
+        target_user_name=target_user_name
+    )
+    
+    # Если были удалены фото, уведомить об обновлении материалов
+    if removed_photo_ids:
+        await notify_materials_updated(request["requester_id"])
 
-        logger.info(f"Permission {request_id} updated by user {current_user.id}")
+    logger.info(f"Permission {request_id} updated by user {current_user.id}")
 
-        return {
-            "message": "Permission photos updated successfully.",
-            "photo_count": len(photo_ids)
-        }
+    return {
+        "message": "Permission photos updated successfully.",
+        "photo_count": len(photo_ids)
+    }
 
 @router.delete("/{request_id}/revoke")
 async def revoke_permission(
     request_id: UUID,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """Revoke an approved permission."""
     async with conn.transaction():
-        request = await conn.fetchrow(
-            """
-            SELECT * FROM profile_view_requests
-            WHERE id = $1 AND target_id = $2 AND status = 'approved'
-            FOR UPDATE
-            """,
+        request = await queries.fetchrow(
+            conn, "profile_requests.lock_approved_for_target",
             request_id,
             current_user.id
         )
@@ -812,8 +693,8 @@ async def revoke_permission(
             )
 
         # Получить имя пользователя для уведомления
-        user_info = await conn.fetchrow(
-            "SELECT first_name, last_name FROM users WHERE id = $1",
+        user_info = await queries.fetchrow(
+            conn, "users.name",
             current_user.id
         )
         target_user_name = None
@@ -823,24 +704,15 @@ async def revoke_permission(
             target_user_name = f"{first_name} {last_name}".strip() or None
 
         # Отозвать разрешение (установить статус rejected)
-        await conn.execute(
-            """
-            UPDATE profile_view_requests
-            SET status = 'rejected'
-            WHERE id = $1
-            """,
+        await queries.execute(
+            conn, "profile_requests.reject",
             request_id
         )
         
         # Удалить импортированные фото запрашивающего пользователя от текущего пользователя
         # Это удалит все фото, которые requester импортировал от current_user (владельца)
-        result = await conn.execute(
-            """
-            DELETE FROM imported_photos
-            WHERE user_id = $1 AND photo_id IN (
-                SELECT id FROM art_objects WHERE owner_id = $2
-            )
-            """,
+        result = await queries.execute(
+            conn, "imports.delete_for_user_from_owner",
             request["requester_id"],
             current_user.id
         )
@@ -848,21 +720,21 @@ async def revoke_permission(
         deleted_count = int(result.split()[-1]) if result and 'DELETE' in result else 0
         logger.info(f"Deleted {deleted_count} imported photos for user {request['requester_id']} from owner {current_user.id}")
 
-        # Уведомить запрашивающего пользователя об отзыве
-        await notify_profile_response(
-            current_user.id,
-            request["requester_id"],
-            False,
-            [],
-            str(request_id),
-            target_user_name=target_user_name
-        )
-        
-        # Уведомить запрашивающего об обновлении материалов (чтобы коллекция обновилась)
-        await notify_materials_updated(request["requester_id"])
+    # Уведомить запрашивающего пользователя об отзыве
+    await notify_profile_response(
+        current_user.id,
+        request["requester_id"],
+        False,
+        [],
+        str(request_id),
+        target_user_name=target_user_name
+    )
+    
+    # Уведомить запрашивающего об обновлении материалов (чтобы коллекция обновилась)
+    await notify_materials_updated(request["requester_id"])
 
-        logger.info(f"Permission {request_id} revoked by user {current_user.id}")
+    logger.info(f"Permission {request_id} revoked by user {current_user.id}")
 
-        return {
-            "message": "Permission revoked successfully."
-        }
+    return {
+        "message": "Permission revoked successfully."
+    }
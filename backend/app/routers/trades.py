@@ -1,15 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Body
 from uuid import UUID
 from typing import List
-import asyncpg
 import logging
 import secrets
 import string
 import json
 
 from app.security import get_current_user
+from app.cache import invalidate_public_feed
 from app.schemas import User
-from postgresql.database import get_connection
+from postgresql.database import LazyConnection, PoolExhaustedError, get_connection
+from postgresql import queries
 
 logger = logging.getLogger(__name__)
 
@@ -40,7 +41,7 @@ router = APIRouter(
 async def create_share_trades(
     art_object_ids: List[int] = Body(..., embed=True),
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """Create multiple trades with a single share token for QR code."""
     if not art_object_ids or len(art_object_ids) == 0:
@@ -50,8 +51,8 @@ async def create_share_trades(
         )
 
     # Check ownership of all art objects
-    owned_objects = await conn.fetch(
-        "SELECT id FROM art_objects WHERE id = ANY($1) AND owner_id = $2",
+    owned_objects = await queries.fetch(
+        conn, "photos.owned_ids",
         art_object_ids,
         current_user.id,
     )
@@ -70,18 +71,14 @@ async def create_share_trades(
         share_token = generate_share_token()
 
         # Ensure token is unique
-        while await conn.fetchval("SELECT 1 FROM trades WHERE share_token = $1", share_token):
+        while await queries.fetchval(conn, "trades.token_exists", share_token):
             share_token = generate_share_token()
 
         # Create trades with the share token
         trades_created = []
         for art_object_id in art_object_ids:
-            trade = await conn.fetchrow(
-                """
-                INSERT INTO trades (art_object_id, sender_id, share_token)
-                VALUES ($1, $2, $3)
-                RETURNING id, expires_at
-                """,
+            trade = await queries.fetchrow(
+                conn, "trades.insert",
                 art_object_id,
                 current_user.id,
                 share_token,
@@ -108,13 +105,13 @@ async def create_share_trades(
 async def initiate_trade(
     art_object_id: int,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """Initiate a trade for a single art object (legacy endpoint)."""
     async with conn.transaction():
         # Check if the user owns the art object
-        owner = await conn.fetchval(
-            "SELECT owner_id FROM art_objects WHERE id = $1", art_object_id
+        owner = await queries.fetchval(
+            conn, "photos.get_owner_id", art_object_id
         )
         if owner != current_user.id:
             raise HTTPException(
@@ -123,13 +120,8 @@ async def initiate_trade(
             )
 
         # Отменить все старые pending трейды от этого пользователя
-        cancelled_count = await conn.execute(
-            """
-            UPDATE trades
-            SET status = 'rejected'
-            WHERE sender_id = $1 AND status IN ('pending', 'scanned')
-            AND expires_at > NOW()
-            """,
+        cancelled_count = await queries.execute(
+            conn, "trades.reject_active_by_sender",
             current_user.id
         )
         if cancelled_count:
@@ -137,16 +129,12 @@ async def initiate_trade(
 
         # Generate share token for single trade too
         share_token = generate_share_token()
-        while await conn.fetchval("SELECT 1 FROM trades WHERE share_token = $1", share_token):
+        while await queries.fetchval(conn, "trades.token_exists", share_token):
             share_token = generate_share_token()
 
         # Create a new trade record
-        trade = await conn.fetchrow(
-            """
-            INSERT INTO trades (art_object_id, sender_id, share_token)
-            VALUES ($1, $2, $3)
-            RETURNING id, expires_at
-            """,
+        trade = await queries.fetchrow(
+            conn, "trades.insert",
             art_object_id,
             current_user.id,
             share_token,
@@ -163,28 +151,14 @@ async def initiate_trade(
 @router.get("/scanned")
 async def get_scanned_trades(
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """Get a list of trades where the user is the SENDER and they have been scanned by others."""
     try:
         logger.info(f"Loading scanned trades for user {current_user.id} (as sender)")
 
-        trades = await conn.fetch(
-            """
-            SELECT
-                t.id as trade_id,
-                t.art_object_id,
-                t.sender_id,
-                t.receiver_id,
-                t.status,
-                t.created_at,
-                t.expires_at,
-                ao.file_id
-            FROM trades t
-            LEFT JOIN art_objects ao ON t.art_object_id = ao.id
-            WHERE t.sender_id = $1 AND t.status = 'scanned'
-            ORDER BY t.created_at DESC
-            """,
+        trades = await queries.fetch(
+            conn, "trades.scanned_by_sender",
             current_user.id,
         )
 
@@ -192,6 +166,9 @@ async def get_scanned_trades(
         logger.info(f"Found {len(result)} scanned trades for user {current_user.id} as sender")
         return result
 
+    except PoolExhaustedError:
+        # Overloaded: answer 503 + Retry-After instead of an empty list
+        raise
     except Exception as e:
         logger.error(f"Error loading scanned trades for user {current_user.id}: {e}", exc_info=True)
         # Возвращаем пустой список вместо ошибки
@@ -202,10 +179,10 @@ async def get_scanned_trades(
 async def get_trade_status(
     trade_id: UUID,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """Get the status of a trade."""
-    trade = await conn.fetchrow("SELECT * FROM trades WHERE id = $1", trade_id)
+    trade = await queries.fetchrow(conn, "trades.get", trade_id)
     if not trade:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Trade not found."
@@ -225,17 +202,13 @@ async def get_trade_status(
 async def scan_share_token(
     share_token: str,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """Scan trades by share token and become the receiver for all."""
     async with conn.transaction():
         # First, check if trades with this token exist at all
-        all_trades = await conn.fetch(
-            """
-            SELECT * FROM trades
-            WHERE share_token = $1
-            ORDER BY created_at DESC
-            """,
+        all_trades = await queries.fetch(
+            conn, "trades.by_share_token",
             share_token
         )
         
@@ -254,12 +227,8 @@ async def scan_share_token(
             )
         
         # Find pending trades with this share token
-        trades = await conn.fetch(
-            """
-            SELECT * FROM trades
-            WHERE share_token = $1 AND status = 'pending'
-            FOR UPDATE
-            """,
+        trades = await queries.fetch(
+            conn, "trades.lock_pending_by_share_token",
             share_token
         )
 
@@ -289,20 +258,8 @@ async def scan_share_token(
         # Это гарантирует, что между пользователями может быть только один активный трейд
         trade_ids_to_keep = [trade["id"] for trade in trades]
         if trade_ids_to_keep:
-            cancelled_count = await conn.execute(
-                """
-                UPDATE trades
-                SET status = 'rejected'
-                WHERE (
-                    (sender_id = $1 AND receiver_id = $2) 
-                    OR (sender_id = $2 AND receiver_id = $1)
-                    OR (sender_id = $1 AND receiver_id IS NULL)
-                    OR (sender_id = $2 AND receiver_id IS NULL)
-                )
-                AND status IN ('pending', 'scanned')
-                AND NOT (id = ANY($3::uuid[]))
-                AND expires_at > NOW()
-                """,
+            cancelled_count = await queries.execute(
+                conn, "trades.reject_active_between_except_ids",
                 sender_id,
                 current_user.id,
                 trade_ids_to_keep
@@ -316,29 +273,22 @@ async def scan_share_token(
         
         for trade in trades:
             # Update to completed status and set receiver
-            await conn.execute(
-                """
-                UPDATE trades
-                SET status = 'completed', receiver_id = $1
-                WHERE id = $2
-                """,
+            await queries.execute(
+                conn, "trades.complete_for_receiver",
                 current_user.id,
                 trade["id"]
             )
             
             # Transfer ownership immediately
-            await conn.execute(
-                "UPDATE art_objects SET owner_id = $1 WHERE id = $2",
+            await queries.execute(
+                conn, "photos.set_owner",
                 current_user.id,
                 trade["art_object_id"],
             )
             
             # Log the ownership transfer
-            await conn.execute(
-                """
-                INSERT INTO ownership_history (art_object_id, from_user_id, to_user_id, transaction_type)
-                VALUES ($1, $2, $3, 'transfer')
-                """,
+            await queries.execute(
+                conn, "ownership_history.insert_transfer",
                 trade["art_object_id"],
                 sender_id,
                 current_user.id,
@@ -347,30 +297,31 @@ async def scan_share_token(
             completed_trades.append(str(trade["id"]))
             scanned_count += 1
 
-        logger.info(f"User {current_user.id} scanned and auto-completed {scanned_count} trades with token {share_token}")
-        
-        # Notify both users
-        await notify_trade_confirmed(sender_id, current_user.id)
+    logger.info(f"User {current_user.id} scanned and auto-completed {scanned_count} trades with token {share_token}")
+    invalidate_public_feed()
+    
+    # Notify both users
+    await notify_trade_confirmed(sender_id, current_user.id)
 
-        # Return the trade IDs that were just completed
-        return {
-            "message": f"Successfully received {scanned_count} photos",
-            "trade_count": scanned_count,
-            "trade_ids": completed_trades
-        }
+    # Return the trade IDs that were just completed
+    return {
+        "message": f"Successfully received {scanned_count} photos",
+        "trade_count": scanned_count,
+        "trade_ids": completed_trades
+    }
 
 
 @router.post("/{trade_id}/scan")
 async def scan_trade(
     trade_id: UUID,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """Scan a single trade QR code and become the receiver (legacy endpoint)."""
     async with conn.transaction():
         # Lock the trade row for update
-        trade = await conn.fetchrow(
-            "SELECT * FROM trades WHERE id = $1 FOR UPDATE", trade_id
+        trade = await queries.fetchrow(
+            conn, "trades.lock", trade_id
         )
         if not trade:
             raise HTTPException(
@@ -398,20 +349,8 @@ async def scan_trade(
 
         # Отменить все другие активные трейды между этими пользователями
         # Это гарантирует, что между пользователями может быть только один активный трейд
-        cancelled_count = await conn.execute(
-            """
-            UPDATE trades
-            SET status = 'rejected'
-            WHERE (
-                (sender_id = $1 AND receiver_id = $2) 
-                OR (sender_id = $2 AND receiver_id = $1)
-                OR (sender_id = $1 AND receiver_id IS NULL)
-                OR (sender_id = $2 AND receiver_id IS NULL)
-            )
-            AND status IN ('pending', 'scanned')
-            AND id != $3
-            AND expires_at > NOW()
-            """,
+        cancelled_count = await queries.execute(
+            conn, "trades.reject_active_between_except_id",
             sender_id,
             current_user.id,
             trade_id
@@ -420,8 +359,8 @@ async def scan_trade(
             logger.info(f"Cancelled {cancelled_count} old trades between users {sender_id} and {current_user.id}")
 
         # Update the receiver_id
-        await conn.execute(
-            "UPDATE trades SET receiver_id = $1, status = 'scanned' WHERE id = $2",
+        await queries.execute(
+            conn, "trades.set_scanned",
             current_user.id,
             trade_id,
         )
@@ -433,12 +372,12 @@ async def scan_trade(
 async def confirm_trade(
     trade_id: UUID,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """Confirm the trade and transfer ownership."""
     async with conn.transaction():
-        trade = await conn.fetchrow(
-            "SELECT * FROM trades WHERE id = $1 FOR UPDATE", trade_id
+        trade = await queries.fetchrow(
+            conn, "trades.lock", trade_id
         )
         if not trade:
             raise HTTPException(
@@ -458,28 +397,26 @@ async def confirm_trade(
             )
 
         # Update art object owner
-        await conn.execute(
-            "UPDATE art_objects SET owner_id = $1 WHERE id = $2",
+        await queries.execute(
+            conn, "photos.set_owner",
             trade["receiver_id"],
             trade["art_object_id"],
         )
 
         # Update trade status
-        await conn.execute(
-            "UPDATE trades SET status = 'completed' WHERE id = $1", trade_id
+        await queries.execute(
+            conn, "trades.complete", trade_id
         )
 
         # Log the ownership transfer
-        await conn.execute(
-            """
-            INSERT INTO ownership_history (art_object_id, from_user_id, to_user_id, transaction_type)
-            VALUES ($1, $2, $3, 'transfer')
-            """,
+        await queries.execute(
+            conn, "ownership_history.insert_transfer",
             trade["art_object_id"],
             trade["sender_id"],
             trade["receiver_id"],
         )
 
+    invalidate_public_feed()
     await notify_trade_confirmed(trade["sender_id"], trade["receiver_id"])
     return {"message": "Trade confirmed and ownership transferred."}
 
@@ -488,12 +425,12 @@ async def confirm_trade(
 async def reject_trade(
     trade_id: UUID,
     current_user: User = Depends(get_current_user),
-    conn: asyncpg.Connection = Depends(get_connection),
+    conn: LazyConnection = Depends(get_connection),
 ):
     """Reject the trade."""
     async with conn.transaction():
-        trade = await conn.fetchrow(
-            "SELECT * FROM trades WHERE id = $1 FOR UPDATE", trade_id
+        trade = await queries.fetchrow(
+            conn, "trades.lock", trade_id
         )
         if not trade:
             raise HTTPException(
@@ -513,8 +450,8 @@ async def reject_trade(
             )
 
         # Update trade status
-        await conn.execute(
-            "UPDATE trades SET status = 'rejected' WHERE id = $1", trade_id
+        await queries.execute(
+            conn, "trades.reject", trade_id
         )
 
     await notify_trade_confirmed(trade["sender_id"], trade["receiver_id"])
@@ -1,13 +1,14 @@
 import os
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import Dict
-import asyncpg
 from uuid import UUID
 from dotenv import load_dotenv
 
 from app.security import get_current_user
+from app.cache import invalidate_public_feed
 from app.schemas import InitiateTransferRequest, User
 from postgresql import database as db
+from postgresql import queries
 from app.routers.websocket import manager # Import the WebSocket manager
 from app.logging_config import app_logger
 
@@ -26,51 +27,67 @@ router = APIRouter(
 async def initiate_transfer(
     request: InitiateTransferRequest,
     current_user: User = Depends(get_current_user), # This is the Scanner/Receiver
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Instantly transfers (copies) a photo to the scanner.
     Called by the Scanner's device after scanning the Sharer's photo QR code.
     """
     receiver_id = current_user.id
-    photo_file_id = request.photo_file_id
-    
-    app_logger.info(f"Transfer initiated: receiver_id={receiver_id}, photo_file_id={photo_file_id}")
-    
-    # 1. Find the photo by file_id
-    photo = await conn.fetchrow("SELECT * FROM art_objects WHERE file_id = $1", photo_file_id)
-    if not photo:
-        app_logger.error(f"Photo not found: {photo_file_id}")
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photo not found.")
-    
-    owner_id = photo["owner_id"]
-    app_logger.info(f"Photo found: owner_id={owner_id}")
-    
-    if owner_id == receiver_id:
-        app_logger.warning(f"User {receiver_id} tried to transfer their own photo")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You already own this photo.")
-    
-    # 2. Check if receiver already has this photo
-    existing_photo = await conn.fetchrow(
-        "SELECT * FROM art_objects WHERE file_id = $1 AND owner_id = $2",
-        photo_file_id, receiver_id
-    )
-    if existing_photo:
-        app_logger.warning(f"User {receiver_id} already has photo {photo_file_id}")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You already have this photo.")
-    
-    # 3. Create a copy of the photo for the receiver (same file_id, different owner)
-    new_photo = await db.create_art_object(conn, owner_id=receiver_id, file_name=photo_file_id)
-    app_logger.info(f"Photo copied: new_id={new_photo['id']}, receiver_id={receiver_id}")
-    
-    # 4. Notify both users via WebSocket
-    receiver_user = await db.get_user_by_id(conn, receiver_id)
-    receiver_username = receiver_user["username"] if receiver_user and receiver_user["username"] else f"User {receiver_id}"
-    
-    owner_user = await db.get_user_by_id(conn, owner_id)
-    owner_username = owner_user["username"] if owner_user and owner_user["username"] else f"User {owner_id}"
+
+    app_logger.info(f"Transfer initiated: receiver_id={receiver_id}, photo_id={request.photo_id}, photo_file_id={request.photo_file_id}")
     
-    # Notify owner
+    # One connection for all statements: a later statement shed with 503 must not
+    # leave the copy committed (a retry would then fail with "You already have this photo")
+    async with conn.transaction():
+        # 1. Find the photo. Identical uploads share a file, so file_id only works for older
+        # clients while the file belongs to a single photo
+        if request.photo_id is not None:
+            photo = await queries.fetchrow(conn, "photos.for_transfer", request.photo_id)
+        elif request.photo_file_id:
+            photos = await queries.fetch(conn, "photos.by_file_id", request.photo_file_id)
+            if len(photos) > 1:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="The file belongs to several photos, send photo_id.")
+            photo = photos[0] if photos else None
+        else:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="photo_id is required.")
+        if not photo:
+            app_logger.error(f"Photo not found: {request.photo_id or request.photo_file_id}")
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photo not found.")
+
+        owner_id = photo["owner_id"]
+        photo_file_id = photo["file_id"]
+        app_logger.info(f"Photo found: id={photo['id']}, owner_id={owner_id}")
+
+        if owner_id == receiver_id:
+            app_logger.warning(f"User {receiver_id} tried to transfer their own photo")
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You already own this photo.")
+
+        # 2. Check if receiver already has this photo: the original or any copy of it
+        # (the same image uploaded by the receiver is a different photo)
+        original_id = photo["original_art_id"] or photo["id"]
+        if await queries.fetchval(conn, "photos.owner_has_lineage", original_id, receiver_id):
+            app_logger.warning(f"User {receiver_id} already has photo {original_id}")
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You already have this photo.")
+
+        # 3. Create a copy of the photo for the receiver (same file_id, different owner)
+        new_photo = await db.create_art_object(
+            conn, owner_id=receiver_id, file_name=photo_file_id, original_art_id=original_id
+        )
+        app_logger.info(f"Photo copied: new_id={new_photo['id']}, receiver_id={receiver_id}")
+
+        # 4. Names for the notifications
+        receiver_user = await db.get_user_by_id(conn, receiver_id)
+        receiver_username = receiver_user["username"] if receiver_user and receiver_user["username"] else f"User {receiver_id}"
+
+        owner_user = await db.get_user_by_id(conn, owner_id)
+        owner_username = owner_user["username"] if owner_user and owner_user["username"] else f"User {owner_id}"
+
+    # The copy is in the public feed when the receiver's profile is public
+    if new_photo["in_public_feed"]:
+        invalidate_public_feed()
+
+    # 5. Notify both users via WebSocket (after commit)
     owner_message = {
         "type": "transfer_completed",
         "message": f"{receiver_username} получил вашу фотографию.",
@@ -104,7 +121,7 @@ async def confirm_transfer(
     transfer_id: UUID,
     accept: bool,
     current_user: User = Depends(get_current_user), # This is the Sharer
-    conn: asyncpg.Connection = Depends(db.get_connection)
+    conn: db.LazyConnection = Depends(db.get_connection)
 ):
     """
     Confirms or rejects a photo ownership transfer request.
@@ -112,28 +129,35 @@ async def confirm_transfer(
     """
     sharer_id = current_user.id
 
-    # 1. Get the pending transfer
-    pending_transfer = await db.get_pending_transfer(conn, str(transfer_id))
-    if not pending_transfer:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transfer request not found.")
-    
-    if pending_transfer["sharer_id"] != sharer_id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to confirm this transfer.")
-    
-    if pending_transfer["status"] != "pending":
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Transfer request is already {pending_transfer['status']}.")
+    async with conn.transaction():
+        # 1. Get the pending transfer
+        pending_transfer = await db.get_pending_transfer(conn, str(transfer_id))
+        if not pending_transfer:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transfer request not found.")
 
-    photo_id = pending_transfer["photo_id"]
-    scanner_id = pending_transfer["scanner_id"]
+        if pending_transfer["sharer_id"] != sharer_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to confirm this transfer.")
+
+        if pending_transfer["status"] != "pending":
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Transfer request is already {pending_transfer['status']}.")
+
+        photo_id = pending_transfer["photo_id"]
+        scanner_id = pending_transfer["scanner_id"]
+
+        if accept:
+            # 2. Update photo owner
+            updated_photo = await db.update_art_object_owner(conn, photo_id, scanner_id)
+            if not updated_photo:
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update photo owner.")
+
+            # 3. Update transfer status
+            await db.update_pending_transfer_status(conn, str(transfer_id), "accepted")
+        else:
+            # 2. Update transfer status to rejected
+            await db.update_pending_transfer_status(conn, str(transfer_id), "rejected")
 
     if accept:
-        # 2. Update photo owner
-        updated_photo = await db.update_art_object_owner(conn, photo_id, scanner_id)
-        if not updated_photo:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update photo owner.")
-        
-        # 3. Update transfer status
-        await db.update_pending_transfer_status(conn, str(transfer_id), "accepted")
+        invalidate_public_feed()
 
         # 4. Notify both Sharer and Scanner
         sharer_message = {"type": "transfer_status", "transfer_id": str(transfer_id), "status": "accepted", "message": "Вы успешно передали фотографию."}
@@ -144,9 +168,6 @@ async def confirm_transfer(
 
         return {"message": "Transfer accepted and photo ownership updated."}
     else:
-        # 2. Update transfer status to rejected
-        await db.update_pending_transfer_status(conn, str(transfer_id), "rejected")
-
         # 3. Notify both Sharer and Scanner
         sharer_message = {"type": "transfer_status", "transfer_id": str(transfer_id), "status": "rejected", "message": "Вы отклонили передачу фотографии."}
         scanner_message = {"type": "transfer_status", "transfer_id": str(transfer_id), "status": "rejected", "message": "Передача фотографии отклонена."}
@@ -28,6 +28,7 @@ class User(BaseModel):
     username: Optional[str] = None
     language_code: Optional[str] = None
     photo_url: Optional[str] = None
+    is_public_profile: bool = False
     created_at: datetime
     last_seen_at: datetime
 
@@ -44,4 +45,6 @@ class TokenData(BaseModel):
 
 # Schema for initiating a transfer
 class InitiateTransferRequest(BaseModel):
-    photo_file_id: str
+    photo_id: Optional[int] = None
+    # Older clients: accepted only while the file belongs to a single photo
+    photo_file_id: Optional[str] = None
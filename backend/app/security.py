@@ -1,8 +1,9 @@
 import hmac
 import hashlib
 import os
-from datetime import datetime, timedelta
-from typing import Optional
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Mapping, Optional
 from urllib.parse import parse_qsl
 
 from fastapi import Depends, HTTPException, status, WebSocket
@@ -11,9 +12,9 @@ from jose import JWTError, jwt
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-from postgresql.database import get_connection, get_user_by_id
+from postgresql.database import acquire_connection, get_user_by_id
 from app.schemas import User
-import asyncpg
+from app.cache import user_cache, profile_changes, decoded_token_cache, ACCESS_TOKEN_CLAIMS_MAX_AGE_SECONDS
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
@@ -34,6 +35,11 @@ if not REFRESH_SECRET_KEY:
 
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
+# Self-contained access tokens: when enabled, the user fields handlers need are
+# embedded into the access token so get_current_user does not touch the database.
+# Claims older than ACCESS_TOKEN_CLAIMS_MAX_AGE_SECONDS fall back to a database lookup.
+ACCESS_TOKEN_EMBED_USER = os.getenv("ACCESS_TOKEN_EMBED_USER", "false").lower() == "true"
+
 # --- Messenger Bot Configuration ---
 # IMPORTANT: Replace this with your actual bot token from the messenger
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -48,8 +54,27 @@ class TokenData(BaseModel):
     user_id: Optional[int] = None
 
 
+def decode_token(token: str, secret_key: str) -> dict:
+    """
+    Verifies and decodes a JWT, reusing the result for tokens seen before.
+    Clients send the same bearer token many times until it expires, so the verified
+    claims are cached by token digest until the token's "exp". Raises JWTError.
+    """
+    key = (secret_key, hashlib.sha256(token.encode()).digest())
+    payload = decoded_token_cache.get(key)
+    if payload is not None:
+        return payload
+
+    payload = jwt.decode(token, secret_key, algorithms=[ALGORITHM])
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        ttl = exp - time.time()
+        if ttl > 0:
+            decoded_token_cache.set(key, payload, ttl_seconds=ttl)
+    return payload
+
+
 async def get_current_user(
-    conn: asyncpg.Connection = Depends(get_connection),
     token: str = Depends(reusable_oauth2)
 ) -> User:
     credentials_exception = HTTPException(
@@ -58,7 +83,7 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token.credentials, SECRET_KEY)
         user_id: Optional[str] = payload.get("sub")
         if user_id is None or not user_id.isdigit():
             raise credentials_exception
@@ -66,19 +91,84 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user_record = await get_user_by_id(conn, token_data.user_id)
+    user = user_from_claims(payload, token_data.user_id)
+    if user is not None:
+        return user
+
+    user = user_cache.get(token_data.user_id)
+    if user is not None:
+        return user
+
+    # The connection is only checked out when the user has to be read from the database.
+    # Default pool on the primary: the auth pool is kept for logins, and a replica
+    # may not have a user who has just signed up
+    async with acquire_connection() as conn:
+        user_record = await get_user_by_id(conn, token_data.user_id)
     if user_record is None:
         raise credentials_exception
 
     # Convert asyncpg.Record to User Pydantic model
-    return User(**dict(user_record))
-
-
-def create_access_token(data: dict) -> str:
-    """Creates a new JWT access token."""
+    user = User(**dict(user_record))
+    user_cache.set(token_data.user_id, user)
+    return user
+
+
+def user_claims(user: Mapping[str, Any]) -> dict:
+    """Builds the compact user claims embedded into self-contained access tokens."""
+    return {
+        "fn": user["first_name"],
+        "ln": user["last_name"],
+        "un": user["username"],
+        "lc": user["language_code"],
+        "pu": user["photo_url"],
+        "pp": bool(user.get("is_public_profile", False)),
+        "ca": user["created_at"].timestamp(),
+        "ls": user["last_seen_at"].timestamp(),
+        "ts": time.time(),
+    }
+
+
+def user_from_claims(payload: dict, user_id: int) -> Optional[User]:
+    """
+    Builds the principal from embedded user claims.
+    Returns None when the token carries no claims, they are older than the staleness
+    bound, or the profile changed after the token was issued.
+    """
+    claims = payload.get("usr")
+    if not ACCESS_TOKEN_EMBED_USER or not claims:
+        return None
+    issued_at = claims.get("ts", 0)
+    if time.time() - issued_at > ACCESS_TOKEN_CLAIMS_MAX_AGE_SECONDS:
+        return None
+    changed_at = profile_changes.get(user_id)
+    if changed_at is not None and issued_at < changed_at:
+        return None
+    try:
+        return User(
+            id=user_id,
+            first_name=claims["fn"],
+            last_name=claims.get("ln"),
+            username=claims.get("un"),
+            language_code=claims.get("lc"),
+            photo_url=claims.get("pu"),
+            is_public_profile=claims.get("pp", False),
+            created_at=datetime.fromtimestamp(claims["ca"], tz=timezone.utc),
+            last_seen_at=datetime.fromtimestamp(claims["ls"], tz=timezone.utc),
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def create_access_token(data: dict, user: Optional[Mapping[str, Any]] = None) -> str:
+    """
+    Creates a new JWT access token.
+    If self-contained tokens are enabled and the user row is given, its fields are embedded.
+    """
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    if ACCESS_TOKEN_EMBED_USER and user is not None:
+        to_encode["usr"] = user_claims(user)
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -95,7 +185,7 @@ def create_refresh_token(data: dict) -> (str, datetime):
 def verify_token(token: str, secret_key: str, credentials_exception) -> TokenData:
     """Decodes and verifies a JWT, returning the token data."""
     try:
-        payload = jwt.decode(token, secret_key, algorithms=[ALGORITHM])
+        payload = decode_token(token, secret_key)
         user_id_str: Optional[str] = payload.get("sub")
         if user_id_str is None or not user_id_str.isdigit():
             raise credentials_exception
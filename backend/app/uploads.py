@@ -0,0 +1,340 @@
+"""
+Streaming receiver for photo uploads.
+
+With File(...) parameters Starlette spools the whole multipart body into temporary
+files before the handler runs, and the handler then copied every file again. Here
+the body is parsed while it arrives and each file part is written straight into the
+uploads directory, with disk I/O in the threadpool so the event loop is never blocked.
+Every file has its own writer task, so disk writes overlap with receiving the rest
+of the body and with writes of the other files of the request.
+
+Files are hashed while they are written and stored content-addressed, as
+<sha256><ext>: a file lands under a temporary name and place_uploads() moves it to
+its blob name, or drops it when the same content is already stored.
+"""
+
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# Загружаем переменные окружения из .env файла
+load_dotenv()
+
+# Largest accepted file (bytes) and the most files in one upload request
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", "10485760"))
+MAX_UPLOAD_FILES = int(os.getenv("MAX_UPLOAD_FILES", "20"))
+# Files of one request written to disk at the same time
+UPLOAD_WRITE_CONCURRENCY = int(os.getenv("UPLOAD_WRITE_CONCURRENCY", "4"))
+
+# Received chunks a file may have waiting for the disk; when its writer falls further
+# behind, reading the body pauses until it catches up
+_WRITE_QUEUE_CHUNKS = 8
+
+# Multipart field with the files, as in the former `files: List[UploadFile]` parameter
+UPLOAD_FIELD = "files"
+
+# Room for part headers and boundaries when checking Content-Length up front
+_MULTIPART_OVERHEAD = 64 * 1024
+
+# The handler reads the raw body, so the request schema is declared by hand for the docs
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": [UPLOAD_FIELD],
+                    "properties": {
+                        UPLOAD_FIELD: {"type": "array", "items": {"type": "string", "format": "binary"}},
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+class StoredUpload:
+    """A file part of the request, written under a temporary name in the uploads directory."""
+
+    def __init__(self, filename: str, content_type: str, path: Path):
+        self.filename = filename
+        self.content_type = content_type
+        self.path = path
+        self.size = 0
+        self.hash = hashlib.sha256()
+        # Name in the uploads directory once placed (place_uploads)
+        self.file_id: Optional[str] = None
+        self.complete = False
+        self.file: Optional[BinaryIO] = None
+        self.pending: List[bytes] = []
+        self.queue: "Optional[asyncio.Queue[Optional[bytes]]]" = None
+        self.writer: Optional[asyncio.Task] = None
+        self.error: Optional[BaseException] = None
+
+    @property
+    def sha256(self) -> bytes:
+        return self.hash.digest()
+
+    @property
+    def blob_name(self) -> str:
+        """Content-addressed file name: the SHA-256 and the client's extension."""
+        return f"{self.hash.hexdigest()}{Path(self.filename).suffix}"
+
+    def open(self):
+        # Assigned in the thread, so a file opened for a cancelled writer is still closed
+        self.file = self.path.open("wb")
+
+    def write(self, data: bytes):
+        """Writes and hashes a chunk; runs in the threadpool (hashlib releases the GIL)."""
+        self.hash.update(data)
+        self.file.write(data)
+
+
+async def _run_to_completion(func, *args):
+    """
+    run_in_threadpool() whose call is waited for even when the caller is cancelled:
+    a cancelled writer must not close or unlink a file while a write to it is running.
+    """
+    call = asyncio.ensure_future(run_in_threadpool(func, *args))
+    try:
+        return await asyncio.shield(call)
+    except asyncio.CancelledError:
+        await asyncio.wait({call})
+        raise
+
+
+class _UploadReceiver:
+    """python-multipart callbacks; file data is buffered per chunk and queued by flush()."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.uploads: List[StoredUpload] = []
+        self._disposition = b""
+        self._content_type = b""
+        self._header_name = b""
+        self._header_value = b""
+        self._current: Optional[StoredUpload] = None
+        self._finished: List[StoredUpload] = []
+        self._write_slots = asyncio.Semaphore(UPLOAD_WRITE_CONCURRENCY)
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._content_type = b""
+        self._current = None
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        name = self._header_name.lower()
+        if name == b"content-disposition":
+            self._disposition = self._header_value
+        elif name == b"content-type":
+            self._content_type = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if options.get(b"name", b"").decode("utf-8", "replace") != UPLOAD_FIELD or b"filename" not in options:
+            return  # Other fields are skipped, as FastAPI did
+        filename = options[b"filename"].decode("utf-8", "replace")
+        content_type = self._content_type.decode("latin-1").strip()
+        if not content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail=f"File '{filename}' is not an image.")
+        if len(self.uploads) >= MAX_UPLOAD_FILES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Too many files, at most {MAX_UPLOAD_FILES} per upload.",
+            )
+        path = self.directory / f".upload-{uuid.uuid4()}.part"
+        self._current = StoredUpload(filename, content_type, path)
+        self.uploads.append(self._current)
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        upload = self._current
+        if upload is None:
+            return
+        upload.size += end - start
+        if upload.size > MAX_UPLOAD_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File '{upload.filename}' is larger than {MAX_UPLOAD_SIZE} bytes.",
+            )
+        upload.pending.append(data[start:end])
+
+    def on_part_end(self):
+        if self._current is not None:
+            self._current.complete = True
+            self._finished.append(self._current)
+            self._current = None
+
+    async def _write_file(self, upload: StoredUpload):
+        """Writes a file's queued chunks in order; None in the queue ends the file."""
+        ended = False
+        try:
+            async with self._write_slots:
+                try:
+                    await _run_to_completion(upload.open)
+                    while (data := await upload.queue.get()) is not None:
+                        await _run_to_completion(upload.write, data)
+                    ended = True
+                finally:
+                    # The writer owns the file: it is closed here, also when cancelled
+                    if upload.file is not None:
+                        await _run_to_completion(upload.file.close)
+        except Exception as e:
+            upload.error = e
+            # Keep taking chunks so the receiving side never waits on a failed writer
+            while not ended and await upload.queue.get() is not None:
+                pass
+
+    async def _send(self, upload: StoredUpload, data: Optional[bytes]):
+        if upload.writer is None:
+            upload.queue = asyncio.Queue(maxsize=_WRITE_QUEUE_CHUNKS)
+            upload.writer = asyncio.create_task(self._write_file(upload))
+        await upload.queue.put(data)
+        if upload.error is not None:
+            raise upload.error
+
+    async def flush(self):
+        """Hands the data of the last chunk to the writers and ends completed files."""
+        for upload in self.uploads:
+            if upload.pending:
+                data = b"".join(upload.pending)
+                upload.pending.clear()
+                await self._send(upload, data)
+        for upload in self._finished:
+            # An empty file gets its writer here and ends up as an empty final file
+            await self._send(upload, None)
+        self._finished.clear()
+
+    async def wait_written(self):
+        """Waits until every file is on disk; raises the first write error."""
+        await asyncio.gather(*[upload.writer for upload in self.uploads if upload.writer is not None])
+        for upload in self.uploads:
+            if upload.error is not None:
+                raise upload.error
+
+
+async def discard_uploads(uploads: List[StoredUpload]):
+    """
+    Stops the writers and deletes the files of a failed upload. A cancelled writer
+    finishes the write it has started and closes its file before the file is deleted.
+    """
+    writers = [upload.writer for upload in uploads if upload.writer is not None and not upload.writer.done()]
+    for writer in writers:
+        writer.cancel()
+    await asyncio.gather(*writers, return_exceptions=True)
+
+    def _discard():
+        for upload in uploads:
+            upload.path.unlink(missing_ok=True)
+
+    await run_in_threadpool(_discard)
+
+
+def parse_sha256s(values: List[str]) -> List[bytes]:
+    """Parses hex SHA-256 digests sent by a client; HTTPException 400/413 on bad input."""
+    if len(values) > MAX_UPLOAD_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many files, at most {MAX_UPLOAD_FILES} per upload.",
+        )
+    digests = []
+    for value in values:
+        try:
+            digest = bytes.fromhex(value)
+        except ValueError:
+            digest = b""
+        if len(digest) != hashlib.sha256().digest_size:
+            raise HTTPException(status_code=400, detail=f"'{value}' is not a hex SHA-256 digest.")
+        digests.append(digest)
+    return digests
+
+
+async def place_uploads(uploads: List[StoredUpload], blobs: Dict[bytes, Tuple[str, bool]], directory: Path):
+    """
+    Moves received files to their blob names; blobs maps sha256 to (file_id, is_new)
+    as returned by database.store_blobs. A new blob takes the first file with its
+    content, a known one keeps its stored file (restored if it went missing);
+    the other copies are deleted. Call it after the blob rows are committed. Files
+    already placed stay on failure: a blob name always holds that content, and
+    unreferenced blobs are removed by the cleanup job.
+    """
+    def _place():
+        placed: List[Path] = []
+        for upload in uploads:
+            file_id, is_new = blobs[upload.sha256]
+            target = directory / file_id
+            if target not in placed and (is_new or not target.exists()):
+                os.replace(upload.path, target)
+                placed.append(target)
+            else:
+                upload.path.unlink(missing_ok=True)
+            upload.file_id = file_id
+
+    await run_in_threadpool(_place)
+
+
+async def receive_uploads(request: Request, directory: Path) -> List[StoredUpload]:
+    """
+    Streams the `files` parts of a multipart request into `directory`.
+
+    Files get temporary names until place_uploads() is called. Raises HTTPException
+    (400 - not an image or a broken multipart body, 413 - over MAX_UPLOAD_SIZE or
+    MAX_UPLOAD_FILES, 422 - no files); nothing is left on disk on failure.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body.")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and \
+            int(content_length) > MAX_UPLOAD_SIZE * MAX_UPLOAD_FILES + _MULTIPART_OVERHEAD:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Upload is too large.")
+
+    receiver = _UploadReceiver(directory)
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": receiver.on_part_begin,
+        "on_header_field": receiver.on_header_field,
+        "on_header_value": receiver.on_header_value,
+        "on_header_end": receiver.on_header_end,
+        "on_headers_finished": receiver.on_headers_finished,
+        "on_part_data": receiver.on_part_data,
+        "on_part_end": receiver.on_part_end,
+    })
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            await receiver.flush()
+        parser.finalize()
+        await receiver.flush()
+        if not all(upload.complete for upload in receiver.uploads):
+            raise HTTPException(status_code=400, detail="Incomplete multipart body.")
+        await receiver.wait_written()
+    except MultipartParseError:
+        await discard_uploads(receiver.uploads)
+        raise HTTPException(status_code=400, detail="Malformed multipart body.")
+    except BaseException:
+        # Covers limit errors, malformed bodies and clients that disconnect mid-upload
+        await discard_uploads(receiver.uploads)
+        raise
+
+    if not receiver.uploads:
+        raise HTTPException(status_code=422, detail="No files uploaded.")
+    return receiver.uploads
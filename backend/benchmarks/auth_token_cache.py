@@ -0,0 +1,68 @@
+"""
+Benchmark: per-request CPU cost of access-token verification with and without
+the decoded-JWT cache.
+
+Simulates a realistic reuse pattern: a pool of active sessions where a few
+users are much busier than the rest (Zipf-like distribution), each sending the
+same bearer token on every request until it expires.
+
+Usage (from backend/):
+    python benchmarks/auth_token_cache.py [--sessions 2000] [--requests 200000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+# Add the project root to the Python path to resolve the 'app' module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+os.environ.setdefault("REFRESH_SECRET_KEY", "benchmark-refresh-secret-key")
+os.environ.setdefault("BOT_TOKEN", "benchmark-bot-token")
+
+from jose import jwt  # noqa: E402
+
+from app.cache import decoded_token_cache  # noqa: E402
+from app.security import ALGORITHM, SECRET_KEY, create_access_token, decode_token  # noqa: E402
+
+
+def build_workload(sessions: int, requests: int, seed: int = 42):
+    """Returns the list of tokens in the order they arrive at the server."""
+    rng = random.Random(seed)
+    tokens = [create_access_token({"sub": str(100000 + i)}) for i in range(sessions)]
+    weights = [1.0 / (rank + 1) for rank in range(sessions)]
+    return rng.choices(tokens, weights=weights, k=requests)
+
+
+def run(label: str, verify, workload) -> float:
+    start = time.perf_counter()
+    for token in workload:
+        verify(token)
+    elapsed = time.perf_counter() - start
+    per_request_us = elapsed / len(workload) * 1_000_000
+    print(f"{label:<22} total {elapsed:8.3f} s   per request {per_request_us:8.2f} us")
+    return per_request_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=2000, help="number of distinct active tokens")
+    parser.add_argument("--requests", type=int, default=200000, help="number of authenticated requests")
+    args = parser.parse_args()
+
+    workload = build_workload(args.sessions, args.requests)
+    print(f"{args.requests} requests over {args.sessions} active tokens "
+          f"(cache max size {decoded_token_cache.max_size})")
+
+    before = run("jwt.decode (no cache)", lambda t: jwt.decode(t, SECRET_KEY, algorithms=[ALGORITHM]), workload)
+    decoded_token_cache.clear()
+    after = run("decode_token (cache)", lambda t: decode_token(t, SECRET_KEY), workload)
+
+    stats = decoded_token_cache.stats()
+    print(f"cache hit ratio {stats['hit_ratio']:.2%}, speedup x{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark: concurrent photo uploads through the former upload handler (File(...)
+parameters spooled by Starlette, then shutil.copyfileobj inside the async handler)
+and through the streaming receiver from app/uploads.py.
+
+Both handlers run without the database, in a uvicorn server in a separate process,
+so bodies arrive in network-sized chunks and the client does not share its GIL.
+While the uploads run, a probe requests /ping every few milliseconds: its latency
+shows how long the event loop is blocked.
+
+Usage (from backend/):
+    python benchmarks/concurrent_uploads.py [--clients 32] [--uploads 4] [--size-mb 5]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+# Add the project root to the Python path to resolve the 'app' module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile  # noqa: E402
+
+from app.uploads import MAX_UPLOAD_SIZE, receive_uploads  # noqa: E402
+
+
+def build_app(directory: Path) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/legacy")
+    async def legacy_upload(files: List[UploadFile] = File(...)):
+        # The handler as it was before app/uploads.py
+        names = []
+        for file in files:
+            if not file.content_type.startswith("image/"):
+                raise HTTPException(status_code=400, detail=f"File '{file.filename}' is not an image.")
+            unique_filename = f"{uuid.uuid4()}{Path(file.filename).suffix}"
+            try:
+                with (directory / unique_filename).open("wb") as buffer:
+                    shutil.copyfileobj(file.file, buffer)
+            finally:
+                file.file.close()
+            names.append(unique_filename)
+        return names
+
+    @app.post("/stream")
+    async def stream_upload(request: Request):
+        return [upload.path.name for upload in await receive_uploads(request, directory)]
+
+    @app.get("/ping")
+    async def ping():
+        return "pong"
+
+    return app
+
+
+def serve(directory: str, port: int):
+    uvicorn.run(build_app(Path(directory)), host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+
+
+def start_server(directory: str) -> (multiprocessing.Process, int):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = multiprocessing.Process(target=serve, args=(directory, port), daemon=True)
+    server.start()
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return server, port
+        except OSError:
+            time.sleep(0.05)
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, latencies: List[float]):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/ping")
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+
+
+async def run(label: str, port: int, path: str, clients: int, uploads: int, payload: bytes):
+    latencies: List[float] = []
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=clients + 1)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=300) as client:
+        prober = asyncio.create_task(probe(client, stop, latencies))
+
+        async def upload_loop():
+            for _ in range(uploads):
+                response = await client.post(path, files={"files": ("photo.jpg", payload, "image/jpeg")})
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[upload_loop() for _ in range(clients)])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await prober
+
+    total_mb = clients * uploads * len(payload) / 1024 / 1024
+    p50 = statistics.median(latencies)
+    p99 = statistics.quantiles(latencies, n=100, method="inclusive")[98] if len(latencies) >= 2 else latencies[0]
+    print(f"{label:<10} {elapsed:7.2f} s  {total_mb / elapsed:8.1f} MB/s   "
+          f"/ping p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  max {max(latencies):7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32, help="concurrent uploading clients")
+    parser.add_argument("--uploads", type=int, default=4, help="uploads per client")
+    parser.add_argument("--size-mb", type=float, default=5, help="size of each uploaded file")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    if size > MAX_UPLOAD_SIZE:
+        parser.error(f"--size-mb is over MAX_UPLOAD_SIZE ({MAX_UPLOAD_SIZE} bytes)")
+    payload = os.urandom(size)
+
+    with tempfile.TemporaryDirectory() as directory:
+        server, port = start_server(directory)
+        print(f"{args.clients} clients x {args.uploads} uploads of {args.size_mb} MB")
+        try:
+            asyncio.run(run("legacy", port, "/legacy", args.clients, args.uploads, payload))
+            asyncio.run(run("streaming", port, "/stream", args.clients, args.uploads, payload))
+        finally:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
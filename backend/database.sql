@@ -57,16 +57,17 @@ COMMENT ON COLUMN ownership_history.from_user_id IS 'The previous owner. NULL fo
 CREATE TABLE IF NOT EXISTS refresh_tokens (
     id SERIAL PRIMARY KEY,
     user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    token VARCHAR(512) NOT NULL,
+    token_hash BYTEA NOT NULL CHECK (octet_length(token_hash) = 32), -- SHA-256 of the refresh token
     expires_at TIMESTAMPTZ NOT NULL,
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     is_revoked BOOLEAN NOT NULL DEFAULT FALSE
 );
 
 CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_id ON refresh_tokens (user_id);
-CREATE UNIQUE INDEX IF NOT EXISTS idx_refresh_tokens_token ON refresh_tokens (token);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_refresh_tokens_token_hash ON refresh_tokens (token_hash);
 
 COMMENT ON TABLE refresh_tokens IS 'Stores refresh tokens for users to maintain persistent sessions.';
+COMMENT ON COLUMN refresh_tokens.token_hash IS 'SHA-256 digest of the refresh token; the token itself is never stored.';
 COMMENT ON COLUMN refresh_tokens.is_revoked IS 'If TRUE, the token can no longer be used.';
 
 -- Table to manage the state of art object trades
@@ -205,6 +206,374 @@ ADD COLUMN IF NOT EXISTS contact_link TEXT;
 
 COMMENT ON COLUMN users.contact_link IS 'Custom contact link (e.g., social media, messaging app) shown in public profile. If NULL, user ID is displayed instead.';
 
+-- Migration: Indexes for the background purge of dead refresh tokens
+-- The purge deletes rows WHERE is_revoked = TRUE OR expires_at < NOW() in batches;
+-- these indexes let it find them without scanning the whole table.
+
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires_at ON refresh_tokens (expires_at);
+
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_revoked ON refresh_tokens (id) WHERE is_revoked = TRUE;
+
+-- Migration: Hot-path indexes (postgresql/queries.py)
+-- Галерея владельца: WHERE owner_id = $1 ORDER BY created_at DESC
+-- (photos.by_owner_with_metadata, get_photos_by_owner) - без сортировки
+CREATE INDEX IF NOT EXISTS idx_art_objects_owner_created ON art_objects (owner_id, created_at DESC);
+
+-- Публичные фото владельца (photos.public_by_owner)
+CREATE INDEX IF NOT EXISTS idx_art_objects_owner_public_created ON art_objects (owner_id, created_at DESC) WHERE is_public = TRUE;
+
+-- Поиск по имени файла (photos.by_file_id, photos.by_file_id_and_owner)
+CREATE INDEX IF NOT EXISTS idx_art_objects_file_id ON art_objects (file_id) INCLUDE (owner_id);
+
+-- Общая лента: ORDER BY created_at DESC LIMIT (photos.public_feed)
+CREATE INDEX IF NOT EXISTS idx_art_objects_created_at ON art_objects (created_at DESC);
+
+-- Удаление истории вместе с фото (ownership_history.delete_for_photos)
+CREATE INDEX IF NOT EXISTS idx_ownership_history_art_object_id ON ownership_history (art_object_id);
+
+-- Групповой обмен по QR: WHERE share_token = $1 AND status = 'pending'
+CREATE INDEX IF NOT EXISTS idx_trades_pending_share_token ON trades (share_token) WHERE status = 'pending';
+
+-- Активные обмены отправителя: status IN ('pending', 'scanned') AND expires_at > NOW()
+-- (trades.reject_active_*, usage.trades_with_photo)
+CREATE INDEX IF NOT EXISTS idx_trades_active_sender ON trades (sender_id, expires_at) WHERE status IN ('pending', 'scanned');
+
+-- Отсканированные обмены отправителя (trades.scanned_by_sender)
+CREATE INDEX IF NOT EXISTS idx_trades_scanned_sender ON trades (sender_id, created_at DESC) WHERE status = 'scanned';
+
+-- Обмены по фото (trades.delete_for_photos)
+CREATE INDEX IF NOT EXISTS idx_trades_art_object_id ON trades (art_object_id);
+
+-- Передачи по фото (usage.transfers_with_photo, transfers.delete_for_photos)
+CREATE INDEX IF NOT EXISTS idx_pending_transfers_photo_id ON pending_transfers (photo_id);
+
+-- Запросы между парой пользователей, последние первыми
+-- (profile_requests.latest_between, pending_between, approved_photo_ids, has_approved_photo)
+CREATE INDEX IF NOT EXISTS idx_profile_view_requests_pair ON profile_view_requests (target_id, requester_id, created_at DESC);
+
+-- Входящие запросы пользователя (profile_requests.pending_for_target, approved_for_target)
+CREATE INDEX IF NOT EXISTS idx_profile_view_requests_target_pending ON profile_view_requests (target_id, created_at DESC) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_profile_view_requests_target_approved ON profile_view_requests (target_id, created_at DESC) WHERE status = 'approved';
+
+-- Запросы, в которых открыты удаляемые фото (profile_requests.with_any_photo)
+CREATE INDEX IF NOT EXISTS idx_profile_view_requests_selected_photos ON profile_view_requests USING GIN (selected_photo_ids) WHERE status IN ('pending', 'approved');
+
+-- Импортированные и избранные фото пользователя, новые первыми (покрывающие)
+CREATE INDEX IF NOT EXISTS idx_imported_photos_user_imported ON imported_photos (user_id, imported_at DESC) INCLUDE (photo_id);
+CREATE INDEX IF NOT EXISTS idx_favorite_photos_user_favorited ON favorite_photos (user_id, favorited_at DESC) INCLUDE (photo_id);
+
+-- Индексы, которые полностью перекрыты новыми или UNIQUE(user_id, photo_id)
+DROP INDEX IF EXISTS idx_art_objects_is_public;
+DROP INDEX IF EXISTS idx_profile_view_requests_target_id;
+DROP INDEX IF EXISTS idx_imported_photos_user_id;
+DROP INDEX IF EXISTS idx_favorite_photos_user_id;
+
+-- Migration: Archive tables for expired rows
+-- Archive tables for rows removed by the background reaper (app/background.py)
+-- and indexes on expires_at so each reaper batch finds its rows without a full scan.
+
+-- Expired trades
+CREATE TABLE IF NOT EXISTS trades_archive (
+    id UUID PRIMARY KEY,
+    art_object_id INTEGER NOT NULL,                 -- No FK: the photo may be deleted later
+    sender_id BIGINT NOT NULL,
+    receiver_id BIGINT,
+    status VARCHAR(50) NOT NULL,
+    share_token VARCHAR(8),
+    created_at TIMESTAMPTZ NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Expired photo transfer requests
+CREATE TABLE IF NOT EXISTS pending_transfers_archive (
+    id UUID PRIMARY KEY,
+    photo_id INTEGER NOT NULL,
+    sharer_id BIGINT NOT NULL,
+    scanner_id BIGINT NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Expired profile view requests
+CREATE TABLE IF NOT EXISTS profile_view_requests_archive (
+    id UUID PRIMARY KEY,
+    requester_id BIGINT NOT NULL,
+    target_id BIGINT NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    selected_photo_ids INTEGER[],
+    created_at TIMESTAMPTZ NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_trades_expires_at ON trades (expires_at);
+CREATE INDEX IF NOT EXISTS idx_pending_transfers_expires_at ON pending_transfers (expires_at);
+
+-- Grant permissions to app_user
+GRANT SELECT, INSERT, DELETE ON trades_archive, pending_transfers_archive, profile_view_requests_archive TO app_user;
+
+COMMENT ON TABLE trades_archive IS 'Trades moved out of trades by the reaper after expires_at plus the retention period.';
+COMMENT ON TABLE pending_transfers_archive IS 'Transfer requests moved out of pending_transfers by the reaper after expiry.';
+COMMENT ON TABLE profile_view_requests_archive IS 'Profile view requests moved out of profile_view_requests by the reaper after expiry.';
+
+-- Migration: Monthly partitions for ownership_history and trades_archive
+-- Monthly range partitioning of ownership_history (by transfer_date) and
+-- trades_archive (by archived_at, where completed and expired trades end up).
+-- Partitions are named <table>_pYYYYMM (UTC months). Future partitions are created
+-- and old ones detached or dropped by postgresql/partitions.py (background job).
+-- Existing rows are copied into the new tables; both are locked while this runs.
+-- Re-running is a no-op once a table is partitioned.
+
+CREATE OR REPLACE FUNCTION pg_temp.create_monthly_partitions(parent TEXT, since TIMESTAMPTZ, months_ahead INT)
+RETURNS VOID AS $$
+DECLARE
+    month_start TIMESTAMP;
+BEGIN
+    FOR month_start IN
+        SELECT generate_series(
+            date_trunc('month', LEAST(COALESCE(since, NOW()), NOW()) AT TIME ZONE 'UTC'),
+            date_trunc('month', NOW() AT TIME ZONE 'UTC') + make_interval(months => months_ahead),
+            INTERVAL '1 month'
+        )
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            parent || '_p' || to_char(month_start, 'YYYYMM'), parent,
+            month_start AT TIME ZONE 'UTC', (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC'
+        );
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ownership_history
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'ownership_history'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE ownership_history RENAME TO ownership_history_unpartitioned;
+    ALTER SEQUENCE ownership_history_id_seq OWNED BY NONE;
+
+    CREATE TABLE ownership_history (
+        id INTEGER NOT NULL DEFAULT nextval('ownership_history_id_seq'),
+        art_object_id INTEGER NOT NULL REFERENCES art_objects(id),
+        from_user_id BIGINT REFERENCES users(id),
+        to_user_id BIGINT NOT NULL REFERENCES users(id),
+        transfer_date TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        transaction_type VARCHAR(50) NOT NULL,
+        PRIMARY KEY (id, transfer_date)                 -- The partition key must be part of the PK
+    ) PARTITION BY RANGE (transfer_date);
+
+    PERFORM pg_temp.create_monthly_partitions(
+        'ownership_history', (SELECT MIN(transfer_date) FROM ownership_history_unpartitioned), 3
+    );
+
+    INSERT INTO ownership_history (id, art_object_id, from_user_id, to_user_id, transfer_date, transaction_type)
+    SELECT id, art_object_id, from_user_id, to_user_id, transfer_date, transaction_type
+    FROM ownership_history_unpartitioned;
+
+    DROP TABLE ownership_history_unpartitioned;
+    ALTER SEQUENCE ownership_history_id_seq OWNED BY ownership_history.id;
+
+    CREATE INDEX idx_ownership_history_art_object_id ON ownership_history (art_object_id);
+
+    COMMENT ON TABLE ownership_history IS 'Logs all ownership changes for art objects. Partitioned by month of transfer_date.';
+    COMMENT ON COLUMN ownership_history.from_user_id IS 'The previous owner. NULL for the initial creation event.';
+END $$;
+
+-- trades_archive
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'trades_archive'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE trades_archive RENAME TO trades_archive_unpartitioned;
+
+    CREATE TABLE trades_archive (
+        id UUID NOT NULL,
+        art_object_id INTEGER NOT NULL,
+        sender_id BIGINT NOT NULL,
+        receiver_id BIGINT,
+        status VARCHAR(50) NOT NULL,
+        share_token VARCHAR(8),
+        created_at TIMESTAMPTZ NOT NULL,
+        expires_at TIMESTAMPTZ NOT NULL,
+        archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, archived_at)
+    ) PARTITION BY RANGE (archived_at);
+
+    PERFORM pg_temp.create_monthly_partitions(
+        'trades_archive', (SELECT MIN(archived_at) FROM trades_archive_unpartitioned), 3
+    );
+
+    INSERT INTO trades_archive SELECT * FROM trades_archive_unpartitioned;
+    DROP TABLE trades_archive_unpartitioned;
+
+    COMMENT ON TABLE trades_archive IS 'Trades moved out of trades by the reaper after expires_at plus the retention period. Partitioned by month of archived_at.';
+END $$;
+
+-- Grant permissions to app_user (the tables were re-created)
+GRANT SELECT, INSERT, UPDATE, DELETE ON ownership_history TO app_user;
+GRANT SELECT, INSERT, DELETE ON trades_archive TO app_user;
+
+-- Migration: Gallery keyset index
+-- Keyset pagination of the gallery (photos.gallery_page) seeks to
+-- (owner_id, created_at, id) < cursor; id is added to the owner index as the tie-breaker
+-- so the seek is an index condition instead of a filter over newer rows.
+-- Replaces idx_art_objects_owner_created from 0011 (same prefix, serves the same queries).
+
+CREATE INDEX IF NOT EXISTS idx_art_objects_owner_created_id ON art_objects (owner_id, created_at DESC, id DESC);
+
+DROP INDEX IF EXISTS idx_art_objects_owner_created;
+
+-- Migration: Public feed keyset index
+-- Seek pagination of the public feed (photos.public_feed_page) walks art_objects
+-- newest first from (created_at, id) < cursor; id is the tie-breaker.
+-- Replaces idx_art_objects_created_at from 0011, which the OFFSET feed used.
+
+CREATE INDEX IF NOT EXISTS idx_art_objects_created_id ON art_objects (created_at DESC, id DESC);
+
+DROP INDEX IF EXISTS idx_art_objects_created_at;
+
+-- Migration: Public feed flag
+-- Denormalized feed visibility: art_objects.in_public_feed = is_public OR the owner's
+-- users.is_public_profile. The feed filtered on that OR across the join, so no index
+-- could serve it; with the flag the feed is one range scan of a partial index.
+-- The flag is kept up to date by the queries that change either side
+-- (photos.update_metadata, photos.set_public_for_owner, photos.set_owner,
+-- create_art_object, update_art_object_owner).
+
+ALTER TABLE art_objects
+ADD COLUMN IF NOT EXISTS in_public_feed BOOLEAN NOT NULL DEFAULT FALSE;
+
+COMMENT ON COLUMN art_objects.in_public_feed IS 'Shown in the public feed: is_public OR the owner has a public profile. Maintained by the application.';
+
+-- Backfill; touches only rows whose flag is wrong, so re-running is cheap
+UPDATE art_objects ao
+SET in_public_feed = (ao.is_public OR u.is_public_profile)
+FROM users u
+WHERE u.id = ao.owner_id
+AND ao.in_public_feed IS DISTINCT FROM (ao.is_public OR u.is_public_profile);
+
+-- Общая лента (photos.public_feed, photos.public_feed_page): только видимые фото,
+-- новые первыми, id - для курсора
+CREATE INDEX IF NOT EXISTS idx_art_objects_public_feed ON art_objects (created_at DESC, id DESC) WHERE in_public_feed;
+
+-- Only the feed used the full (created_at, id) index from 0015
+DROP INDEX IF EXISTS idx_art_objects_created_id;
+
+-- Migration: Upload blobs
+-- Content-addressed upload storage. A file in UPLOADS_DIR is a blob shared by every
+-- art_objects row with its file_id; new uploads are named <sha256><ext>, so the same
+-- image uploaded again reuses the stored file. ref_count is the number of art_objects
+-- rows pointing at the blob: inserting such a row takes a reference, deleting releases
+-- it (postgresql/database.py). Unreferenced blobs are removed with their files by a
+-- background job (app/background.py).
+
+CREATE TABLE IF NOT EXISTS upload_blobs (
+    file_id VARCHAR(255) PRIMARY KEY,               -- File name in UPLOADS_DIR, as in art_objects.file_id
+    sha256 BYTEA UNIQUE,                            -- NULL for files stored before this migration
+    size BIGINT,
+    ref_count INTEGER NOT NULL DEFAULT 0 CHECK (ref_count >= 0),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE upload_blobs IS 'Stored upload files with the number of art_objects rows referencing each.';
+
+-- Blobs waiting for the cleanup job
+CREATE INDEX IF NOT EXISTS idx_upload_blobs_unreferenced ON upload_blobs (file_id) WHERE ref_count = 0;
+
+-- Files stored under random names so far: counted, not deduplicated
+INSERT INTO upload_blobs (file_id, ref_count)
+SELECT file_id, COUNT(*) FROM art_objects GROUP BY file_id
+ON CONFLICT (file_id) DO NOTHING;
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON upload_blobs TO app_user;
+
+-- Migration: Photo lineage
+-- Transfer copies record their source in original_art_id (the root of the lineage,
+-- never a copy). Since 0017 identical uploads share one file_id, so a file no longer
+-- identifies a photo: transfers look photos up by id and detect duplicates by lineage
+-- (photos.owner_has_lineage).
+
+-- Deleting an original keeps its copies: they become roots of their own lineages
+ALTER TABLE art_objects DROP CONSTRAINT IF EXISTS art_objects_original_art_id_fkey;
+ALTER TABLE art_objects
+ADD CONSTRAINT art_objects_original_art_id_fkey
+FOREIGN KEY (original_art_id) REFERENCES art_objects(id) ON DELETE SET NULL NOT VALID;
+ALTER TABLE art_objects VALIDATE CONSTRAINT art_objects_original_art_id_fkey;
+
+-- Copies made by transfers so far share the file_id of their source but have no
+-- original_art_id. Files stored before 0017 (upload_blobs.sha256 IS NULL) have random
+-- names, so of the rows sharing such a file the earliest is the source and the rest
+-- are its copies. Files stored since 0017 are named by content and are not linked.
+UPDATE art_objects ao
+SET original_art_id = root.id, is_original = FALSE
+FROM (
+    SELECT DISTINCT ON (a.file_id) a.file_id, a.id
+    FROM art_objects a
+    JOIN upload_blobs b ON b.file_id = a.file_id AND b.sha256 IS NULL
+    WHERE a.original_art_id IS NULL
+    ORDER BY a.file_id, a.created_at, a.id
+) root
+WHERE ao.file_id = root.file_id
+AND ao.id <> root.id
+AND ao.original_art_id IS NULL;
+
+-- Copies of a photo (photos.owner_has_lineage, ON DELETE SET NULL of the key above)
+CREATE INDEX IF NOT EXISTS idx_art_objects_original_art_id ON art_objects (original_art_id, owner_id) WHERE original_art_id IS NOT NULL;
+
+-- Migration: Default partitions
+-- DEFAULT partitions for the monthly partitioned tables (0013). A row whose month has no
+-- partition yet (maintenance disabled or behind) lands here instead of failing the
+-- insert; postgresql/partitions.py moves such rows into their monthly partition.
+
+CREATE TABLE IF NOT EXISTS ownership_history_default PARTITION OF ownership_history DEFAULT;
+CREATE TABLE IF NOT EXISTS trades_archive_default PARTITION OF trades_archive DEFAULT;
+
+-- ============================================
+-- Версии миграций
+-- ============================================
+-- Схема выше уже содержит миграции 0001-0019: они отмечаются примененными,
+-- чтобы python -m postgresql.migrate up не выполнял их повторно. checksum - sha256
+-- файла миграции (postgresql/migrate.py); добавляя миграцию в этот файл, добавьте
+-- сюда и ее строку.
+
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    execution_ms INTEGER NOT NULL
+);
+
+INSERT INTO schema_version (version, name, checksum, execution_ms) VALUES
+    (1, 'profile_view_requests', '95bf50dd89db2370e954411d48f35a71ceafb913d6330021699a2da5391e34cb', 0),
+    (2, 'imported_photos', 'daf2eeb834be43311b4161e28713215a4e8657d07cba78bf47e3dbec17151980', 0),
+    (3, 'favorites', '1b49ac85ad83c46420ded893bdb1a7249067197ac44b95b64dd0a2a473a64d26', 0),
+    (4, 'public_photos', '650c6324d90516763e498467e8a4d7659e3a810608fd50daddb21177353b656d', 0),
+    (5, 'public_profile', '9c2de3797cd5d5f89006a3332170296c5be08a3b3437a8b0eea466709bef411a', 0),
+    (6, 'share_token', '55025ad6b6eb016870c26f5e1dafc39afe385711927b7a928184c451144dca15', 0),
+    (7, 'photo_metadata', '15513dc499c823a17d6918894013318ae5ff736211978797e553df59a34942ce', 0),
+    (8, 'contact_link', '8b6df639e0a91f65ac6179f863f861785670c8f94fe615e57bafa468a54792ad', 0),
+    (9, 'refresh_token_purge_indexes', 'aaac41859ae02da76b78e5983834b552656ec8911a9dd1646b5c5904ad43594b', 0),
+    (10, 'refresh_token_hash', 'd39210a0df8a064d0e2d665f3f61c514e226d058b9468d9cca56b1f68a0f0272', 0),
+    (11, 'hot_path_indexes', '9339bb417ed2a0fed7cc4b4be1f1929bb185d2e28abfdd96d02dfdc23c4e4c3b', 0),
+    (12, 'expired_rows_archive', '394acb68a7716e96b115221605fd36659483ff5bde196174a09f37cd1d0b8a56', 0),
+    (13, 'monthly_partitions', '360872999451d69b0b7c1c9807d15a60ac30c15db8370870cec073285ff7489a', 0),
+    (14, 'gallery_keyset_index', '3d2d74fa49868eae56f9d1bc5c4ef34b8c25da6ab81fce18cbd7002adfeb872a', 0),
+    (15, 'feed_keyset_index', '7c1ee229cab3dc764cb13cb1ffc6297643ef8fb2a1f3f0eef2bd6399b70ea6de', 0),
+    (16, 'public_feed_flag', 'e1039fc5ec22e06b413581cb0a3a595db9d604451e9673516ff46785c84ed89e', 0),
+    (17, 'upload_blobs', 'b9da99974d97016992b13db6ff35269a4d3a91be1141ec2eefba598f48f7f05e', 0),
+    (18, 'photo_lineage', '3edac096ad7419fb61dbe2bcbbb000de1c7615a3f67f306a5ce6e43b6fbf1eec', 0),
+    (19, 'default_partitions', '92dda183c87b4edc56e10b3ac0353103369c886492271ded2385ee01167cc9f0', 0)
+ON CONFLICT (version) DO NOTHING;
+
 -- ============================================
 -- Права доступа (если используется пользователь app_user)
 -- ============================================
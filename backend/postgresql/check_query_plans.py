@@ -0,0 +1,216 @@
+"""
+Plan regression check for the hot queries.
+
+Seeds a large synthetic dataset, runs ``EXPLAIN (FORMAT JSON)`` for each checked
+query and verifies that the plan reads the table through the index designed for
+that access path (see migrations/0011_hot_path_indexes.sql). Everything runs in
+one transaction that is rolled back, so no data or statistics are left behind,
+but the schema must be migrated.
+
+Usage (from the backend directory, against a development database):
+    python -m postgresql.check_query_plans
+"""
+
+import asyncio
+import hashlib
+import json
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Set
+
+import asyncpg
+
+from postgresql import queries
+from postgresql.database import DATABASE_URL, GET_PHOTOS_BY_OWNER_QUERY
+
+# Synthetic ids start far above real messenger ids
+USER_BASE = 9_000_000_000
+N_USERS = 10_000
+N_PHOTOS = 200_000
+N_TRADES = 200_000
+N_TRANSFERS = 50_000
+N_PROFILE_REQUESTS = 100_000
+N_IMPORTS = 100_000
+
+SEED = [
+    f"""
+    INSERT INTO users (id, first_name)
+    SELECT {USER_BASE} + g, 'plan_check_' || g FROM generate_series(1, {N_USERS}) g
+    """,
+    f"""
+    INSERT INTO art_objects (owner_id, creator_id, file_id, is_public, in_public_feed, description, tags, created_at)
+    SELECT {USER_BASE} + 1 + g % {N_USERS}, {USER_BASE} + 1 + g % {N_USERS},
+           'plan_check_' || g || '.jpg', g % 10 = 0, g % 10 = 0, 'photo ' || g, ARRAY['tag' || g % 50],
+           NOW() - g * INTERVAL '1 minute'
+    FROM generate_series(1, {N_PHOTOS}) g
+    """,
+    f"""
+    INSERT INTO upload_blobs (file_id, sha256, size, ref_count)
+    SELECT 'plan_check_' || g || '.jpg', sha256(('plan_check_' || g)::bytea), 1000, 1
+    FROM generate_series(1, {N_PHOTOS}) g
+    """,
+    # Fresh statistics before the child tables are seeded: stale ones can turn every
+    # foreign key check into a sequential scan of the new rows
+    "ANALYZE users, art_objects",
+    # Photos get serial ids; remember where the seeded range starts
+    "CREATE TEMP TABLE plan_check_seed ON COMMIT DROP AS SELECT MIN(id) AS first_photo_id FROM art_objects WHERE file_id = 'plan_check_1.jpg'",
+    f"""
+    INSERT INTO ownership_history (art_object_id, from_user_id, to_user_id, transaction_type)
+    SELECT s.first_photo_id + g % {N_PHOTOS}, NULL, {USER_BASE} + 1 + g % {N_USERS}, 'creation'
+    FROM generate_series(0, {N_PHOTOS - 1}) g, plan_check_seed s
+    """,
+    f"""
+    INSERT INTO trades (art_object_id, sender_id, receiver_id, status, share_token, created_at, expires_at)
+    SELECT s.first_photo_id + g % {N_PHOTOS}, {USER_BASE} + 1 + g % {N_USERS},
+           {USER_BASE} + 1 + (g + 1) % {N_USERS},
+           CASE WHEN g % 100 = 0 THEN 'pending' WHEN g % 100 = 1 THEN 'scanned'
+                WHEN g % 100 < 50 THEN 'completed' ELSE 'rejected' END,
+           substr(md5(g::text), 1, 8),
+           NOW() - g * INTERVAL '1 second',
+           CASE WHEN g % 100 < 2 THEN NOW() + INTERVAL '5 minute' ELSE NOW() - INTERVAL '1 hour' END
+    FROM generate_series(1, {N_TRADES}) g, plan_check_seed s
+    """,
+    f"""
+    INSERT INTO pending_transfers (photo_id, sharer_id, scanner_id, status)
+    SELECT s.first_photo_id + g % {N_PHOTOS}, {USER_BASE} + 1 + g % {N_USERS}, {USER_BASE} + 1 + (g + 1) % {N_USERS},
+           CASE WHEN g % 100 = 0 THEN 'pending' ELSE 'accepted' END
+    FROM generate_series(1, {N_TRANSFERS}) g, plan_check_seed s
+    """,
+    f"""
+    INSERT INTO profile_view_requests (requester_id, target_id, status, selected_photo_ids, created_at, expires_at)
+    SELECT {USER_BASE} + 1 + g % {N_USERS}, {USER_BASE} + 1 + (g * 7 + 3) % {N_USERS},
+           CASE WHEN g % 20 = 0 THEN 'pending' WHEN g % 20 = 1 THEN 'approved' ELSE 'rejected' END,
+           CASE WHEN g % 20 = 1 THEN ARRAY[s.first_photo_id + g % {N_PHOTOS}] END,
+           NOW() - g * INTERVAL '1 second', NOW() - g * INTERVAL '1 second' + INTERVAL '24 hour'
+    FROM generate_series(1, {N_PROFILE_REQUESTS}) g, plan_check_seed s
+    """,
+    f"""
+    INSERT INTO imported_photos (user_id, photo_id, imported_at)
+    SELECT {USER_BASE} + 1 + g % {N_USERS}, s.first_photo_id + (g * 13) % {N_PHOTOS}, NOW() - g * INTERVAL '1 second'
+    FROM generate_series(1, {N_IMPORTS}) g, plan_check_seed s
+    """,
+    f"""
+    INSERT INTO favorite_photos (user_id, photo_id, favorited_at)
+    SELECT {USER_BASE} + 1 + g % {N_USERS}, s.first_photo_id + (g * 17) % {N_PHOTOS}, NOW() - g * INTERVAL '1 second'
+    FROM generate_series(1, {N_IMPORTS}) g, plan_check_seed s
+    """,
+    "ANALYZE users, art_objects, upload_blobs, ownership_history, trades, pending_transfers, profile_view_requests, imported_photos, favorite_photos",
+]
+
+
+def _checks(photo_id: int) -> List[tuple]:
+    """(label, query text, args, indexes any of which the plan must use)."""
+    user = USER_BASE + 1
+    # Request g = 1 has requester user+1 and target user+10
+    requester, target = USER_BASE + 2, USER_BASE + 11
+    pending_token = hashlib.md5(b"100").hexdigest()[:8]
+    q = queries.sql
+    return [
+        ("get_photos_by_owner", GET_PHOTOS_BY_OWNER_QUERY, (user,), {"idx_art_objects_owner_created_id"}),
+        ("photos.by_owner_with_metadata", q("photos.by_owner_with_metadata"), (user,), {"idx_art_objects_owner_created_id"}),
+        ("photos.gallery_page", q("photos.gallery_page"), (user, None, None, 51), {"idx_art_objects_owner_created_id"}),
+        ("photos.gallery_page (cursor)", q("photos.gallery_page"), (user, datetime.now(timezone.utc) - timedelta(days=30), 2**31 - 1, 51),
+         {"idx_art_objects_owner_created_id"}),
+        ("photos.public_by_owner", q("photos.public_by_owner"), (user,), {"idx_art_objects_owner_public_created"}),
+        ("photos.by_file_id", q("photos.by_file_id"), ("plan_check_5.jpg",), {"idx_art_objects_file_id"}),
+        ("photos.owner_has_lineage", q("photos.owner_has_lineage"), (photo_id, user),
+         {"art_objects_pkey", "idx_art_objects_original_art_id"}),
+        ("photos.public_feed", q("photos.public_feed"), (user, 20, 0), {"idx_art_objects_public_feed"}),
+        ("photos.public_feed_page", q("photos.public_feed_page"), (user, None, None, 21), {"idx_art_objects_public_feed"}),
+        ("photos.public_feed_window", q("photos.public_feed_window"), (1001,), {"idx_art_objects_public_feed"}),
+        ("photos.public_feed_page (cursor)", q("photos.public_feed_page"), (user, datetime.now(timezone.utc) - timedelta(days=60), 2**31 - 1, 21),
+         {"idx_art_objects_public_feed"}),
+        ("blobs.owned_by_sha256", q("blobs.owned_by_sha256"), ([hashlib.sha256(b"plan_check_5").digest()], user),
+         {"upload_blobs_sha256_key"}),
+        ("ownership_history.delete_for_photos", q("ownership_history.delete_for_photos"), ([photo_id, photo_id + 1],),
+         {"idx_ownership_history_art_object_id"}),
+        ("trades.by_share_token", q("trades.by_share_token"), (pending_token,), {"idx_trades_share_token", "idx_trades_pending_share_token"}),
+        ("trades.lock_pending_by_share_token", q("trades.lock_pending_by_share_token"), (pending_token,), {"idx_trades_pending_share_token"}),
+        ("trades.reject_active_by_sender", q("trades.reject_active_by_sender"), (user,), {"idx_trades_active_sender"}),
+        ("trades.reject_active_between_except_id", q("trades.reject_active_between_except_id"), (user, user + 1, uuid.uuid4()),
+         {"idx_trades_active_sender"}),
+        ("trades.scanned_by_sender", q("trades.scanned_by_sender"), (user,), {"idx_trades_scanned_sender"}),
+        ("trades.delete_for_photos", q("trades.delete_for_photos"), ([photo_id],), {"idx_trades_art_object_id"}),
+        ("usage.trades_with_photo", q("usage.trades_with_photo"), (photo_id, user), {"idx_trades_active_sender", "idx_trades_art_object_id"}),
+        ("usage.transfers_with_photo", q("usage.transfers_with_photo"), (photo_id, user), {"idx_pending_transfers_photo_id"}),
+        ("profile_requests.latest_between", q("profile_requests.latest_between"), (target, requester), {"idx_profile_view_requests_pair"}),
+        ("profile_requests.pending_between", q("profile_requests.pending_between"), (requester, target),
+         {"idx_profile_view_requests_pair", "idx_profile_view_requests_target_pending"}),
+        ("profile_requests.approved_photo_ids", q("profile_requests.approved_photo_ids"), (target, requester),
+         {"idx_profile_view_requests_pair", "idx_profile_view_requests_target_approved"}),
+        ("profile_requests.has_approved_photo", q("profile_requests.has_approved_photo"), (requester, target, photo_id),
+         {"idx_profile_view_requests_pair", "idx_profile_view_requests_target_approved"}),
+        ("profile_requests.pending_for_target", q("profile_requests.pending_for_target"), (target,), {"idx_profile_view_requests_target_pending"}),
+        ("profile_requests.approved_for_target", q("profile_requests.approved_for_target"), (target,), {"idx_profile_view_requests_target_approved"}),
+        ("profile_requests.with_any_photo", q("profile_requests.with_any_photo"), ([photo_id],), {"idx_profile_view_requests_selected_photos"}),
+        ("usage.profile_requests_with_photo", q("usage.profile_requests_with_photo"), (photo_id, target),
+         {"idx_profile_view_requests_pair", "idx_profile_view_requests_target_pending", "idx_profile_view_requests_target_approved"}),
+        ("imports.photos_by_user", q("imports.photos_by_user"), (user,), {"idx_imported_photos_user_imported"}),
+        ("favorites.photos_by_user", q("favorites.photos_by_user"), (user,), {"idx_favorite_photos_user_favorited"}),
+    ]
+
+
+def _walk(node: Dict, found: List[Dict]):
+    found.append(node)
+    for child in node.get("Plans", ()):
+        _walk(child, found)
+
+
+def _used_indexes(plan: Dict, parents: Dict[str, str]) -> Set[str]:
+    """Index names used by the plan; partition indexes are reported as their parent index."""
+    nodes: List[Dict] = []
+    _walk(plan, nodes)
+    return {parents.get(node["Index Name"], node["Index Name"]) for node in nodes if "Index Name" in node}
+
+
+def _seq_scans(plan: Dict) -> Set[str]:
+    nodes: List[Dict] = []
+    _walk(plan, nodes)
+    return {node.get("Relation Name", "?") for node in nodes if node["Node Type"] == "Seq Scan"}
+
+
+async def main() -> int:
+    conn = await asyncpg.connect(DATABASE_URL)
+    failures = 0
+    try:
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            print("Seeding synthetic data...")
+            for statement in SEED:
+                await conn.execute(statement)
+            photo_id = await conn.fetchval("SELECT first_photo_id FROM plan_check_seed")
+            parents = {
+                row["child"]: row["parent"]
+                for row in await conn.fetch("""
+                    SELECT c.relname AS child, p.relname AS parent
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    JOIN pg_class p ON p.oid = i.inhparent
+                    WHERE c.relkind = 'i'
+                """)
+            }
+
+            for label, query, args, expected in _checks(photo_id):
+                raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+                plan = json.loads(raw)[0]["Plan"]
+                used = _used_indexes(plan, parents)
+                if used & expected:
+                    print(f"✅ {label}: {', '.join(sorted(used & expected))}")
+                    continue
+                failures += 1
+                seq = _seq_scans(plan)
+                print(f"❌ {label}: expected one of {sorted(expected)}, plan uses {sorted(used) or 'no index'}"
+                      + (f", seq scan on {', '.join(sorted(seq))}" if seq else ""))
+        finally:
+            await transaction.rollback()
+    finally:
+        await conn.close()
+
+    print(f"{failures} plan regression(s)" if failures else "All query plans use the expected indexes.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,8 +1,14 @@
+import asyncio
 import asyncpg
+import hashlib
 import os
-from typing import Optional, List
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncContextManager, Callable, Dict, Optional, List, Tuple
 from app.schemas import UserData
-from datetime import datetime
+from app.cache import invalidate_user
+from postgresql import metrics, queries
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения из .env файла
@@ -24,53 +30,315 @@ if not DATABASE_URL:
     
     DATABASE_URL = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 
-_connection_pool: Optional[asyncpg.Pool] = None
+# Необязательная реплика только для чтения. Если не задана, чтение идет в основную БД.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+
+# --- Pool configuration ---
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_MAX_QUERIES = int(os.getenv("DB_POOL_MAX_QUERIES", "50000"))
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+
+# Load shedding: how long a request may wait for a connection, how many requests
+# may queue for one, and what Retry-After to suggest when either limit is hit
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+DB_POOL_MAX_WAITERS = int(os.getenv("DB_POOL_MAX_WAITERS", "100"))
+DB_POOL_RETRY_AFTER_SECONDS = int(os.getenv("DB_POOL_RETRY_AFTER_SECONDS", "2"))
+
+
+class PoolExhaustedError(Exception):
+    """Raised when a connection cannot be obtained within the shedding limits."""
+
+    def __init__(self, reason: str, retry_after: int = DB_POOL_RETRY_AFTER_SECONDS):
+        super().__init__(f"Database pool exhausted: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AppConnection(asyncpg.Connection):
+    """Pool connection class that prepares the hot queries up front."""
+
+    async def prepare_hot_queries(self, queries: List[str]):
+        """
+        Prepares the given queries once through the public prepare() API. This loads
+        the server-side catalog entries and asyncpg's type codecs for them when the
+        connection opens and checks them against the schema; the first real
+        fetch()/execute() still adds the statement to asyncpg's own cache.
+        """
+        for query in queries:
+            try:
+                await self.prepare(query)
+            except asyncpg.PostgresError as e:
+                # Schema may lag behind the code (migration not applied yet)
+                print(f"Could not prepare hot query, skipping: {e}")
+
+
+class PoolStats:
+    """Counters describing pool pressure, used to size the pool from data."""
+
+    def __init__(self):
+        self.acquired = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+
+    def record_acquire(self, wait_seconds: float):
+        self.acquired += 1
+        self.total_wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def snapshot(self, pool: Optional[asyncpg.Pool]) -> dict:
+        return {
+            "size": pool.get_size() if pool else 0,
+            "idle": pool.get_idle_size() if pool else 0,
+            "min_size": pool.get_min_size() if pool else 0,
+            "max_size": pool.get_max_size() if pool else 0,
+            "waiters": self.waiting,
+            "max_waiters": self.max_waiting,
+            "acquired": self.acquired,
+            "avg_acquire_wait_ms": round(self.total_wait_seconds / self.acquired * 1000, 3) if self.acquired else 0.0,
+            "max_acquire_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+        }
+
+
+# Named pools on the primary, each with its own (min_size, max_size) budget, so a burst
+# of slow requests on one pool cannot starve logins or liveness checks on another.
+# A pool with max_size 0 is not created and its users share the default pool.
+DEFAULT_POOL = "default"
+AUTH_POOL = "auth"
+HEALTH_POOL = "health"
+READ_POOL = "read"
+
+POOL_BUDGETS: Dict[str, tuple] = {
+    DEFAULT_POOL: (DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+    AUTH_POOL: (int(os.getenv("DB_AUTH_POOL_MIN_SIZE", "1")), int(os.getenv("DB_AUTH_POOL_MAX_SIZE", "3"))),
+    HEALTH_POOL: (int(os.getenv("DB_HEALTH_POOL_MIN_SIZE", "0")), int(os.getenv("DB_HEALTH_POOL_MAX_SIZE", "1"))),
+}
+
+_pools: Dict[str, asyncpg.Pool] = {}
+_pool_stats: Dict[str, PoolStats] = {name: PoolStats() for name in (*POOL_BUDGETS, READ_POOL)}
+
+async def _init_connection(conn: AppConnection):
+    """Runs once for every new pool connection."""
+    metrics.install(conn)
+    await conn.prepare_hot_queries(HOT_QUERIES)
+
+async def _create_pool(dsn: str, min_size: int, max_size: int) -> asyncpg.Pool:
+    return await asyncpg.create_pool(
+        dsn,
+        min_size=min(min_size, max_size),
+        max_size=max_size,
+        max_queries=DB_POOL_MAX_QUERIES,
+        max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        connection_class=AppConnection,
+        init=_init_connection,
+    )
 
 async def connect_db():
-    """Establishes a connection pool to the PostgreSQL database."""
-    global _connection_pool
-    if _connection_pool is None:
-        _connection_pool = await asyncpg.create_pool(DATABASE_URL)
-    print("Database connection pool created.")
+    """Establishes the named connection pools (and the read replica pool, if configured)."""
+    if len(queries.QUERIES) + len(HOT_QUERIES) > DB_STATEMENT_CACHE_SIZE:
+        # Registered statements would be evicted and re-prepared over and over
+        print(f"DB_STATEMENT_CACHE_SIZE={DB_STATEMENT_CACHE_SIZE} is smaller than the "
+              f"{len(queries.QUERIES) + len(HOT_QUERIES)} registered queries; consider raising it.")
+    for name, (min_size, max_size) in POOL_BUDGETS.items():
+        if max_size > 0 and name not in _pools:
+            _pools[name] = await _create_pool(DATABASE_URL, min_size, max_size)
+    print(f"Database connection pools created: {', '.join(_pools)}.")
+    if DATABASE_READ_URL and READ_POOL not in _pools:
+        try:
+            _pools[READ_POOL] = await _create_pool(DATABASE_READ_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE)
+            print("Read replica connection pool created.")
+        except (OSError, asyncpg.PostgresError) as e:
+            # The app keeps working on the primary; reads fall back to it
+            print(f"Read replica is unavailable, reads will use the primary: {e}")
 
 async def close_db():
-    """Closes the database connection pool."""
-    global _connection_pool
-    if _connection_pool:
-        await _connection_pool.close()
-        _connection_pool = None
+    """Closes all database connection pools."""
+    for pool in _pools.values():
+        await pool.close()
+    _pools.clear()
     print("Database connection pool closed.")
 
-async def get_connection():
-    """Provides a connection from the pool."""
-    if _connection_pool is None:
+def get_pool_stats() -> dict:
+    """Returns size, idle connections, waiters and acquire wait times for every pool."""
+    names = [name for name, (_, max_size) in POOL_BUDGETS.items() if max_size > 0]
+    if DATABASE_READ_URL:
+        names.append(READ_POOL)
+    return {name: _pool_stats[name].snapshot(_pools.get(name)) for name in names}
+
+async def _acquire(pool: asyncpg.Pool, stats: PoolStats) -> asyncpg.Connection:
+    """Acquires a connection, failing fast instead of queueing without limit."""
+    if DB_POOL_MAX_WAITERS > 0 and stats.waiting >= DB_POOL_MAX_WAITERS:
+        stats.shed_queue_full += 1
+        raise PoolExhaustedError("too many requests waiting for a connection")
+    stats.waiting += 1
+    stats.max_waiting = max(stats.max_waiting, stats.waiting)
+    started = time.perf_counter()
+    try:
+        connection = await pool.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        stats.shed_timeout += 1
+        raise PoolExhaustedError("timed out waiting for a connection")
+    finally:
+        stats.waiting -= 1
+    stats.record_acquire(time.perf_counter() - started)
+    return connection
+
+@asynccontextmanager
+async def acquire_connection(pool_name: str = DEFAULT_POOL):
+    """
+    Checks out a connection from the named pool on the primary for the duration
+    of the block. Pools that are disabled by their budget fall back to the default one.
+    """
+    if pool_name not in _pools or pool_name == READ_POOL:
+        pool_name = DEFAULT_POOL
+    pool = _pools.get(pool_name)
+    if pool is None:
         raise RuntimeError("Database connection pool not initialized. Call connect_db() first.")
-    async with _connection_pool.acquire() as connection:
+    connection = await _acquire(pool, _pool_stats[pool_name])
+    try:
+        yield connection
+    finally:
+        await pool.release(connection)
+
+@asynccontextmanager
+async def acquire_read_connection():
+    """
+    Checks out a connection for read-only work: from the replica when it is
+    configured and reachable, otherwise from the primary.
+    Replicas lag slightly, so only use this where read-your-writes is not required.
+    """
+    read_pool = _pools.get(READ_POOL)
+    if read_pool is not None:
+        try:
+            connection = await _acquire(read_pool, _pool_stats[READ_POOL])
+        except (OSError, asyncpg.PostgresConnectionError, asyncpg.CannotConnectNowError) as e:
+            print(f"Read replica acquire failed, falling back to the primary: {e}")
+        else:
+            try:
+                yield connection
+            finally:
+                await read_pool.release(connection)
+            return
+    async with acquire_connection() as connection:
         yield connection
 
+class LazyConnection:
+    """
+    Request-scoped database handle that holds a pool connection only while it is used.
+
+    Each fetch()/execute() checks a connection out for that one statement, and
+    transaction() pins one connection for the duration of the block. Time a handler
+    spends on anything else (WebSocket notifications, disk I/O) does not keep a
+    connection from the pool busy. Quacks like asyncpg.Connection for the methods
+    the application uses, so it can be passed to the helpers in this module.
+    """
+
+    def __init__(self, acquire: Callable[[], AsyncContextManager[asyncpg.Connection]]):
+        self._acquire = acquire
+        self._pinned: Optional[asyncpg.Connection] = None
+
+    async def _run(self, method: str, *args, **kwargs):
+        if self._pinned is not None:
+            return await getattr(self._pinned, method)(*args, **kwargs)
+        async with self._acquire() as connection:
+            return await getattr(connection, method)(*args, **kwargs)
+
+    async def fetch(self, query: str, *args, **kwargs):
+        return await self._run("fetch", query, *args, **kwargs)
+
+    async def fetchrow(self, query: str, *args, **kwargs):
+        return await self._run("fetchrow", query, *args, **kwargs)
+
+    async def fetchval(self, query: str, *args, **kwargs):
+        return await self._run("fetchval", query, *args, **kwargs)
+
+    async def execute(self, query: str, *args, **kwargs):
+        return await self._run("execute", query, *args, **kwargs)
+
+    async def executemany(self, command: str, args, **kwargs):
+        return await self._run("executemany", command, args, **kwargs)
+
+    @asynccontextmanager
+    async def transaction(self, **kwargs):
+        """Pins one connection for the block; nested blocks become savepoints on it."""
+        if self._pinned is not None:
+            async with self._pinned.transaction(**kwargs):
+                yield self
+            return
+        async with self._acquire() as connection:
+            self._pinned = connection
+            try:
+                async with connection.transaction(**kwargs):
+                    yield self
+            finally:
+                self._pinned = None
+
+
+def connection_dependency(pool_name: str):
+    """Builds a FastAPI dependency that provides a lazy handle on the named pool."""
+    async def dependency():
+        yield LazyConnection(lambda: acquire_connection(pool_name))
+    dependency.__name__ = f"get_{pool_name}_connection"
+    return dependency
+
+async def get_connection():
+    """Provides a lazy handle on the default pool."""
+    yield LazyConnection(acquire_connection)
+
+# Login/refresh and liveness checks get their own budgets (see POOL_BUDGETS)
+get_auth_connection = connection_dependency(AUTH_POOL)
+get_health_connection = connection_dependency(HEALTH_POOL)
+
+async def get_read_connection():
+    """Provides a lazy handle for read-only handlers (replica with fallback to the primary)."""
+    yield LazyConnection(acquire_read_connection)
+
 async def upsert_user(conn: asyncpg.Connection, user_data: UserData) -> asyncpg.Record:
     """
     Creates a new user or updates an existing one based on the messenger ID.
 
+    The row is only rewritten when a profile field actually changed; otherwise the
+    current row is returned untouched and the caller records the visit with
+    touch_last_seen(), which is flushed to the database in batches.
+
     Args:
         conn: The database connection.
         user_data: A Pydantic model containing the user's information.
 
     Returns:
-        The database record of the created or updated user.
+        The database record of the created or updated user, with extra boolean
+        columns: `changed` - the row was written, `inserted` - the user is new.
     """
     query = """
-        INSERT INTO users (id, first_name, last_name, username, language_code, photo_url, last_seen_at)
-        VALUES ($1, $2, $3, $4, $5, $6, NOW())
-        ON CONFLICT (id) DO UPDATE SET
-            first_name = EXCLUDED.first_name,
-            last_name = EXCLUDED.last_name,
-            username = EXCLUDED.username,
-            photo_url = EXCLUDED.photo_url,
-            last_seen_at = NOW()
-        RETURNING *;
+        WITH upserted AS (
+            INSERT INTO users (id, first_name, last_name, username, language_code, photo_url, last_seen_at)
+            VALUES ($1, $2, $3, $4, $5, $6, NOW())
+            ON CONFLICT (id) DO UPDATE SET
+                first_name = EXCLUDED.first_name,
+                last_name = EXCLUDED.last_name,
+                username = EXCLUDED.username,
+                photo_url = EXCLUDED.photo_url,
+                last_seen_at = NOW()
+            WHERE (users.first_name, users.last_name, users.username, users.photo_url)
+                IS DISTINCT FROM (EXCLUDED.first_name, EXCLUDED.last_name, EXCLUDED.username, EXCLUDED.photo_url)
+            RETURNING *, xmax = 0 AS inserted
+        )
+        SELECT *, TRUE AS changed FROM upserted
+        UNION ALL
+        SELECT *, FALSE AS inserted, FALSE AS changed FROM users
+        WHERE id = $1 AND NOT EXISTS (SELECT 1 FROM upserted);
     """
-    return await conn.fetchrow(
+    record = await conn.fetchrow(
         query,
         user_data.id,
         user_data.first_name,
@@ -79,47 +347,178 @@ async def upsert_user(conn: asyncpg.Connection, user_data: UserData) -> asyncpg.
         user_data.language_code,
         user_data.photo_url,
     )
+    if record and record["changed"]:
+        invalidate_user(user_data.id)
+    return record
+
+# Pending last_seen_at updates (user_id -> time of the latest visit), flushed by flush_last_seen
+_last_seen_buffer: Dict[int, datetime] = {}
+
+def touch_last_seen(user_id: int):
+    """Records a user visit in memory instead of rewriting the users row right away."""
+    _last_seen_buffer[user_id] = datetime.now(timezone.utc)
+
+async def flush_last_seen(conn: asyncpg.Connection) -> int:
+    """Writes buffered last_seen_at values with one batched UPDATE and returns the row count."""
+    global _last_seen_buffer
+    if not _last_seen_buffer:
+        return 0
+    batch, _last_seen_buffer = _last_seen_buffer, {}
+    query = """
+        UPDATE users AS u
+        SET last_seen_at = v.seen_at
+        FROM unnest($1::bigint[], $2::timestamptz[]) AS v(id, seen_at)
+        WHERE u.id = v.id AND u.last_seen_at < v.seen_at
+    """
+    try:
+        result = await conn.execute(query, list(batch.keys()), list(batch.values()))
+    except Exception:
+        # Put the batch back so the next flush retries it, keeping newer visits
+        for user_id, seen_at in batch.items():
+            if _last_seen_buffer.get(user_id, seen_at) <= seen_at:
+                _last_seen_buffer[user_id] = seen_at
+        raise
+    return int(result.split(" ")[1]) if result.startswith("UPDATE") else 0
 
 from datetime import datetime
 
+def hash_refresh_token(token: str) -> bytes:
+    """Refresh tokens are persisted and looked up by their 32-byte SHA-256 digest."""
+    return hashlib.sha256(token.encode()).digest()
+
 async def store_refresh_token(conn: asyncpg.Connection, user_id: int, token: str, expires_at: datetime):
-    """Stores a refresh token in the database, revoking existing ones for the user."""
-    await revoke_refresh_tokens_for_user(conn, user_id) # Revoke existing tokens
-    
-    # Check if token already exists and delete it if it does
-    existing_token = await conn.fetchrow("SELECT id FROM refresh_tokens WHERE token = $1", token)
-    if existing_token:
-        await conn.execute("DELETE FROM refresh_tokens WHERE token = $1", token)
-    
+    """
+    Stores a refresh token in the database, revoking existing ones for the user.
+    Revocation and the insert run as a single statement. Tokens are deterministic
+    within a second, so an identical token is re-activated instead of inserted twice.
+    """
     query = """
-        INSERT INTO refresh_tokens (user_id, token, expires_at)
+        WITH revoked AS (
+            UPDATE refresh_tokens SET is_revoked = TRUE
+            WHERE user_id = $1 AND is_revoked = FALSE AND token_hash <> $2
+        )
+        INSERT INTO refresh_tokens (user_id, token_hash, expires_at)
         VALUES ($1, $2, $3)
+        ON CONFLICT (token_hash) DO UPDATE SET
+            user_id = EXCLUDED.user_id,
+            expires_at = EXCLUDED.expires_at,
+            created_at = NOW(),
+            is_revoked = FALSE
     """
-    await conn.execute(query, user_id, token, expires_at)
+    await conn.execute(query, user_id, hash_refresh_token(token), expires_at)
+
+GET_REFRESH_TOKEN_QUERY = metrics.register_query("get_refresh_token", "SELECT * FROM refresh_tokens WHERE token_hash = $1")
 
 async def get_refresh_token(conn: asyncpg.Connection, token: str) -> Optional[asyncpg.Record]:
     """Retrieves a refresh token from the database."""
-    query = "SELECT * FROM refresh_tokens WHERE token = $1"
-    return await conn.fetchrow(query, token)
+    return await conn.fetchrow(GET_REFRESH_TOKEN_QUERY, hash_refresh_token(token))
+
+GET_USER_BY_ID_QUERY = metrics.register_query("get_user_by_id", "SELECT * FROM users WHERE id = $1")
 
 async def get_user_by_id(conn: asyncpg.Connection, user_id: int) -> Optional[asyncpg.Record]:
     """Retrieves a user from the database by their ID."""
-    query = "SELECT * FROM users WHERE id = $1"
-    return await conn.fetchrow(query, user_id)
+    return await conn.fetchrow(GET_USER_BY_ID_QUERY, user_id)
+
+# Every art_objects row holds one reference to the upload_blobs row of its file_id:
+# the statements that insert or delete art objects update ref_count in the same query
+# (see migrations/0017_upload_blobs.sql)
+
+async def create_art_object(
+    conn: asyncpg.Connection, owner_id: int, file_name: str, original_art_id: Optional[int] = None
+) -> asyncpg.Record:
+    """
+    Creates a new art object record in the database. With original_art_id the
+    record is a copy of that photo (is_original = FALSE).
+    """
+    query = """
+        WITH reference AS (
+            UPDATE upload_blobs SET ref_count = ref_count + 1 WHERE file_id = $2
+        )
+        INSERT INTO art_objects (owner_id, creator_id, file_id, is_original, original_art_id, in_public_feed)
+        VALUES ($1, $1, $2, $3::int IS NULL, $3, (SELECT is_public_profile FROM users WHERE id = $1))
+        RETURNING *;
+    """
+    return await conn.fetchrow(query, owner_id, file_name, original_art_id)
 
-async def create_art_object(conn: asyncpg.Connection, owner_id: int, file_name: str) -> asyncpg.Record:
-    """Creates a new art object record in the database."""
+async def create_art_objects(conn: asyncpg.Connection, owner_id: int, file_names: List[str]) -> List[asyncpg.Record]:
+    """
+    Creates art objects for several uploaded files with one INSERT. A file name may
+    repeat (identical files share a blob). Records come back in file_names order.
+    """
     query = """
-        INSERT INTO art_objects (owner_id, creator_id, file_id, is_original)
-        VALUES ($1, $1, $2, TRUE)
+        WITH reference AS (
+            UPDATE upload_blobs b SET ref_count = b.ref_count + f.n
+            FROM (SELECT file_id, COUNT(*) AS n FROM unnest($2::text[]) AS file_id GROUP BY file_id) f
+            WHERE b.file_id = f.file_id
+        )
+        INSERT INTO art_objects (owner_id, creator_id, file_id, is_original, in_public_feed)
+        SELECT $1, $1, f.file_id, TRUE, (SELECT is_public_profile FROM users WHERE id = $1)
+        FROM unnest($2::text[]) WITH ORDINALITY AS f(file_id, position)
+        ORDER BY f.position
         RETURNING *;
     """
-    return await conn.fetchrow(query, owner_id, file_name)
+    # Rows are inserted in file_names order, so their serial ids follow it too
+    return sorted(await conn.fetch(query, owner_id, file_names), key=lambda record: record["id"])
+
+async def store_blobs(
+    conn: asyncpg.Connection, sha256s: List[bytes], file_names: List[str], sizes: List[int]
+) -> Dict[bytes, Tuple[str, bool]]:
+    """
+    Registers uploaded contents by SHA-256 (each digest once) and returns
+    {sha256: (file_id, is_new)}. is_new - no blob had this content and the caller
+    must store its file as file_id; otherwise the existing file is reused. Keeps the
+    rows locked until the transaction ends, so the cleanup job cannot remove them;
+    references are taken by create_art_objects.
+    """
+    query = """
+        INSERT INTO upload_blobs (sha256, file_id, size)
+        SELECT * FROM unnest($1::bytea[], $2::text[], $3::bigint[])
+        ORDER BY 1  -- One lock order for concurrent uploads of the same files
+        ON CONFLICT (sha256) DO UPDATE SET sha256 = EXCLUDED.sha256
+        RETURNING sha256, file_id, xmax = 0 AS is_new
+    """
+    records = await conn.fetch(query, sha256s, file_names, sizes)
+    return {bytes(record["sha256"]): (record["file_id"], record["is_new"]) for record in records}
+
+async def delete_unreferenced_blobs(conn: asyncpg.Connection, batch_size: int) -> List[str]:
+    """
+    Deletes up to batch_size blobs no art object references and returns their file
+    names. Call it in a transaction and move the files out of their names before
+    commit: until then the deleted rows stay locked, and an upload of the same content
+    waits instead of reusing a file that is being removed.
+
+    ref_count = 0 only selects candidates: a blob is deleted if no art_objects row
+    has its file_id. An under-counted blob (rows written by code that did not count
+    references) gets its real count back instead.
+    """
+    query = """
+        WITH candidates AS (
+            SELECT b.file_id,
+                   (SELECT COUNT(*) FROM art_objects ao WHERE ao.file_id = b.file_id) AS refs
+            FROM upload_blobs b
+            WHERE b.ref_count = 0
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        ), recounted AS (
+            UPDATE upload_blobs b SET ref_count = c.refs
+            FROM candidates c
+            WHERE b.file_id = c.file_id AND c.refs > 0
+        )
+        DELETE FROM upload_blobs b
+        USING candidates c
+        WHERE b.file_id = c.file_id AND c.refs = 0
+        RETURNING b.file_id
+    """
+    return [record["file_id"] for record in await conn.fetch(query, batch_size)]
+
+GET_PHOTOS_BY_OWNER_QUERY = metrics.register_query(
+    "get_photos_by_owner",
+    "SELECT id, owner_id, creator_id, file_id, file_type, is_original, original_art_id, signature, created_at, description, tags, is_public FROM art_objects WHERE owner_id = $1 ORDER BY created_at DESC",
+)
 
 async def get_photos_by_owner(conn: asyncpg.Connection, owner_id: int) -> List[asyncpg.Record]:
     """Retrieves all art objects for a specific owner."""
-    query = "SELECT id, owner_id, creator_id, file_id, file_type, is_original, original_art_id, signature, created_at, description, tags, is_public FROM art_objects WHERE owner_id = $1 ORDER BY created_at DESC"
-    return await conn.fetch(query, owner_id)
+    return await conn.fetch(GET_PHOTOS_BY_OWNER_QUERY, owner_id)
 
 async def get_photos_by_ids(conn: asyncpg.Connection, photo_ids: List[int]) -> List[asyncpg.Record]:
     """Retrieves a list of art objects from the database by their IDs."""
@@ -127,16 +526,24 @@ async def get_photos_by_ids(conn: asyncpg.Connection, photo_ids: List[int]) -> L
     return await conn.fetch(query, photo_ids)
 
 async def delete_photos_by_ids(conn: asyncpg.Connection, photo_ids: List[int]) -> int:
-    """Deletes art objects from the database by their IDs and returns the count of deleted rows."""
+    """
+    Deletes art objects from the database by their IDs and returns the count of deleted rows.
+    Their files are not touched: the blobs only lose a reference each.
+    """
     if not photo_ids or len(photo_ids) == 0:
         return 0
-    query = "DELETE FROM art_objects WHERE id = ANY($1::int[])"
-    result = await conn.execute(query, photo_ids)
-    # The result of execute is a string like 'DELETE 5' or 'DELETE 0'
-    if result.startswith("DELETE"):
-        deleted_count = int(result.split(" ")[1])
-        return deleted_count
-    return 0
+    query = """
+        WITH deleted AS (
+            DELETE FROM art_objects WHERE id = ANY($1::int[]) RETURNING file_id
+        ), released AS (
+            -- Clamped: rows written by older code before the blob existed were never counted
+            UPDATE upload_blobs b SET ref_count = GREATEST(b.ref_count - d.n, 0)
+            FROM (SELECT file_id, COUNT(*) AS n FROM deleted GROUP BY file_id) d
+            WHERE b.file_id = d.file_id
+        )
+        SELECT COUNT(*) FROM deleted
+    """
+    return await conn.fetchval(query, photo_ids)
 
 async def create_pending_transfer(
     conn: asyncpg.Connection, photo_id: int, sharer_id: int, scanner_id: int
@@ -190,7 +597,9 @@ async def delete_pending_transfer(conn: asyncpg.Connection, transfer_id: str) ->
 async def update_art_object_owner(conn: asyncpg.Connection, art_object_id: int, new_owner_id: int) -> Optional[asyncpg.Record]:
     """Updates the owner_id of an art_object."""
     query = """
-        UPDATE art_objects SET owner_id = $1
+        UPDATE art_objects
+        SET owner_id = $1,
+            in_public_feed = is_public OR (SELECT is_public_profile FROM users WHERE id = $1)
         WHERE id = $2
         RETURNING *;
     """
@@ -204,6 +613,69 @@ async def revoke_refresh_tokens_for_user(conn: asyncpg.Connection, user_id: int)
     """
     await conn.execute(query, user_id)
 
+async def purge_dead_refresh_tokens(conn: asyncpg.Connection, batch_size: int) -> int:
+    """Deletes up to `batch_size` expired or revoked refresh tokens and returns the count."""
+    query = """
+        DELETE FROM refresh_tokens
+        WHERE id IN (
+            SELECT id FROM refresh_tokens
+            WHERE is_revoked = TRUE OR expires_at < NOW()
+            LIMIT $1
+        )
+    """
+    result = await conn.execute(query, batch_size)
+    return int(result.split(" ")[1]) if result.startswith("DELETE") else 0
+
+
+# Short-lived tables cleaned up by the reaper and the columns copied to <table>_archive.
+# Every row of these tables gets expires_at at creation, terminal ones included.
+REAPED_TABLES = {
+    "trades": "id, art_object_id, sender_id, receiver_id, status, share_token, created_at, expires_at",
+    "pending_transfers": "id, photo_id, sharer_id, scanner_id, status, created_at, expires_at",
+    "profile_view_requests": "id, requester_id, target_id, status, selected_photo_ids, created_at, expires_at",
+}
+
+_REAP_SELECT = """
+        SELECT id FROM {table}
+        WHERE expires_at < NOW() - $1::interval
+        LIMIT $2
+        FOR UPDATE SKIP LOCKED
+"""
+
+REAP_QUERIES = {
+    (table, archive): metrics.register_query(
+        f"reaper.{'archive' if archive else 'delete'}_{table}",
+        f"""
+        WITH reaped AS (
+            DELETE FROM {table} WHERE id IN ({_REAP_SELECT.format(table=table)})
+            RETURNING {columns}
+        )
+        INSERT INTO {table}_archive ({columns}) SELECT {columns} FROM reaped
+        """ if archive else
+        f"DELETE FROM {table} WHERE id IN ({_REAP_SELECT.format(table=table)})",
+    )
+    for table, columns in REAPED_TABLES.items()
+    for archive in (True, False)
+}
+
+
+async def reap_expired_rows(conn: asyncpg.Connection, table: str, retention: timedelta, batch_size: int, archive: bool) -> int:
+    """
+    Removes up to `batch_size` rows of `table` that expired more than `retention` ago,
+    moving them to <table>_archive when `archive` is set. Returns the count.
+    Rows locked by a running request are skipped until the next batch.
+    """
+    result = await conn.execute(REAP_QUERIES[(table, archive)], retention, batch_size)
+    return int(result.split(" ")[-1])
+
+
+# Queries prepared on every new pool connection (see _init_connection)
+HOT_QUERIES = [
+    GET_USER_BY_ID_QUERY,
+    GET_REFRESH_TOKEN_QUERY,
+    GET_PHOTOS_BY_OWNER_QUERY,
+]
+
 
 # Example of how to use it (for testing purposes, not part of the main app logic)
 async def test_connection():
@@ -218,5 +690,4 @@ async def test_connection():
         await close_db()
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(test_connection())
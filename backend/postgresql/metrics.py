@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from bisect import bisect_left
+from typing import Dict, List
+
+import asyncpg
+from dotenv import load_dotenv
+
+from app.logging_config import app_logger
+
+# Загружаем переменные окружения из .env файла
+load_dotenv()
+
+# Statements slower than this are logged (0 disables the slow-query log)
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+# Log the plan of slow statements (plain EXPLAIN, the statement is not re-executed)
+DB_SLOW_QUERY_EXPLAIN = os.getenv("DB_SLOW_QUERY_EXPLAIN", "false").lower() == "true"
+# Explain each query name at most once per interval
+DB_SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS = float(os.getenv("DB_SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS", "600"))
+# Upper bound on distinct query names; anything beyond is counted as "other"
+DB_MAX_TRACKED_QUERIES = int(os.getenv("DB_MAX_TRACKED_QUERIES", "500"))
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+([a-zA-Z_][a-zA-Z0-9_]*)", re.IGNORECASE)
+
+
+def _normalize(query: str) -> str:
+    return " ".join(query.split())
+
+
+class QueryStats:
+    """Latency histogram and counters for one named query."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, elapsed_ms: float, failed: bool):
+        self.count += 1
+        if failed:
+            self.errors += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of calls."""
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                if index < len(LATENCY_BUCKETS_MS):
+                    return round(min(float(LATENCY_BUCKETS_MS[index]), self.max_ms), 3)
+                return round(self.max_ms, 3)
+        return round(self.max_ms, 3)
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "buckets_ms": {
+                **{f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)},
+                "inf": self.buckets[-1],
+            },
+        }
+
+
+# Normalized text -> name, and the exact text as executed -> name. The logger runs for
+# every statement: a known text is found with one dict lookup, without normalizing it
+_names: Dict[str, str] = {}
+_names_by_text: Dict[str, str] = {}
+_stats: Dict[str, QueryStats] = {}
+_last_explained: Dict[str, float] = {}
+
+
+def register_query(name: str, query: str) -> str:
+    """Gives a SQL statement a stable name for metrics and logs. Returns the query unchanged."""
+    _names[_normalize(query)] = name
+    _names_by_text[query] = name
+    return query
+
+
+def query_name(query: str) -> str:
+    """
+    Returns the registered name of a statement, or a fingerprint such as
+    "select users#1a2b3c" built from its verb, first table and text hash.
+    """
+    name = _names_by_text.get(query)
+    if name is not None:
+        return name
+    normalized = _normalize(query)
+    name = _names.get(normalized)
+    if name is None:
+        if len(_names) >= DB_MAX_TRACKED_QUERIES:
+            return "other"
+        verb = normalized.split(" ", 1)[0].lower() if normalized else "empty"
+        table = _TABLE_RE.search(normalized)
+        digest = hashlib.sha1(normalized.encode()).hexdigest()[:6]
+        name = f"{verb} {table.group(1).lower()}#{digest}" if table else f"{verb}#{digest}"
+        _names[normalized] = name
+    # Texts differing only in whitespace share a name; their cache is bounded as well
+    if len(_names_by_text) < 2 * DB_MAX_TRACKED_QUERIES:
+        _names_by_text[query] = name
+    return name
+
+
+def _redact(args) -> List[str]:
+    """Describes parameters by type only, so values never reach the logs."""
+    redacted = []
+    for arg in args or ():
+        if isinstance(arg, (str, bytes, list, tuple)):
+            redacted.append(f"<{type(arg).__name__} len={len(arg)}>")
+        else:
+            redacted.append(f"<{type(arg).__name__}>")
+    return redacted
+
+
+def log_query(record: "asyncpg.connection.LoggedQuery"):
+    """
+    asyncpg query logger: records every statement executed on a pool connection
+    and reports the slow ones.
+    """
+    elapsed_ms = record.elapsed * 1000
+    name = query_name(record.query)
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = QueryStats()
+    stats.record(elapsed_ms, record.exception is not None)
+
+    if DB_SLOW_QUERY_MS <= 0 or elapsed_ms < DB_SLOW_QUERY_MS:
+        return
+    app_logger.warning(
+        f"Slow query '{name}' took {elapsed_ms:.1f} ms: {_normalize(record.query)} args={_redact(record.args)}"
+    )
+    if DB_SLOW_QUERY_EXPLAIN and record.exception is None and _should_explain(name, record.query):
+        asyncio.get_running_loop().create_task(_explain(name, record.query, record.args))
+
+
+def _should_explain(name: str, query: str) -> bool:
+    if not query.lstrip().upper().startswith(_EXPLAINABLE):
+        return False
+    now = time.monotonic()
+    last = _last_explained.get(name)
+    if last is not None and now - last < DB_SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS:
+        return False
+    _last_explained[name] = now
+    return True
+
+
+async def _explain(name: str, query: str, args):
+    # Imported here: the database module installs this logger on its connections
+    from postgresql.database import acquire_connection
+    try:
+        async with acquire_connection() as conn:
+            rows = await conn.fetch(f"EXPLAIN {query}", *(args or ()))
+        plan = "\n".join(row[0] for row in rows)
+        app_logger.warning(f"Plan of slow query '{name}':\n{plan}")
+    except Exception as e:
+        app_logger.warning(f"Could not explain slow query '{name}': {e}")
+
+
+def get_query_stats() -> List[dict]:
+    """Returns per-query latency statistics, the most expensive queries first."""
+    result = [{"name": name, **stats.snapshot()} for name, stats in _stats.items()]
+    result.sort(key=lambda item: item["total_ms"], reverse=True)
+    return result
+
+
+def install(conn: asyncpg.Connection):
+    """Attaches the query logger to a new pool connection."""
+    conn.add_query_logger(log_query)
@@ -0,0 +1,229 @@
+"""
+Versioned schema migrations.
+
+Migrations are files named ``NNNN_description.sql`` in ``postgresql/migrations/`` and
+are applied in version order. Applied versions are recorded in the ``schema_version``
+table together with a checksum of the file.
+
+A migration runs in one transaction unless its first line is
+``-- migrate:no-transaction``. Such migrations are executed statement by statement
+(split on ``;`` at the end of a line) and are meant for ``CREATE INDEX CONCURRENTLY``,
+which cannot run inside a transaction and does not block writes to the table.
+They are not atomic, so every statement in them must be idempotent (IF NOT EXISTS).
+
+Usage (from the backend directory):
+    python -m postgresql.migrate status
+    python -m postgresql.migrate up
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import asyncpg
+from dotenv import load_dotenv
+
+from app.logging_config import app_logger
+
+# Загружаем переменные окружения из .env файла
+load_dotenv()
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
+# DDL waits at most this long for a table lock instead of queueing every later
+# query on that table behind it
+MIGRATION_LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+# What the application does with pending migrations on startup: check, apply or off
+MIGRATIONS_ON_STARTUP = os.getenv("MIGRATIONS_ON_STARTUP", "check").lower()
+
+# Serializes runners started by several workers at once
+_ADVISORY_LOCK_KEY = 0x4D617841  # "MaxA"
+
+_NO_TRANSACTION = "-- migrate:no-transaction"
+_FILE_RE = re.compile(r"^(\d+)_([\w-]+)\.sql$")
+_STATEMENT_END_RE = re.compile(r";[ \t]*$", re.MULTILINE)
+_CONCURRENT_INDEX_RE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE
+)
+
+SCHEMA_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        checksum TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        execution_ms INTEGER NOT NULL
+    )
+"""
+
+
+class Migration:
+    """One migration file."""
+
+    def __init__(self, version: int, name: str, path: Path):
+        self.version = version
+        self.name = name
+        self.path = path
+        self.sql = path.read_text(encoding="utf-8")
+        self.checksum = hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+        self.transactional = not self.sql.lstrip().startswith(_NO_TRANSACTION)
+
+    def statements(self) -> List[str]:
+        """Splits a no-transaction migration into single statements."""
+        statements = []
+        for chunk in _STATEMENT_END_RE.split(self.sql):
+            code = "\n".join(line for line in chunk.splitlines() if not line.strip().startswith("--")).strip()
+            if code:
+                statements.append(code)
+        return statements
+
+    def __repr__(self):
+        return f"{self.version:04d}_{self.name}"
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    """Returns all migration files ordered by version."""
+    migrations = []
+    for path in directory.glob("*.sql"):
+        match = _FILE_RE.match(path.name)
+        if not match:
+            raise ValueError(f"Unexpected migration file name: {path.name}")
+        migrations.append(Migration(int(match.group(1)), match.group(2), path))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Duplicate migration versions in " + str(directory))
+    return migrations
+
+
+async def applied_versions(conn: asyncpg.Connection) -> Dict[int, str]:
+    """Returns {version: checksum} of applied migrations (empty if none were ever applied)."""
+    if await conn.fetchval("SELECT to_regclass('schema_version')") is None:
+        return {}
+    rows = await conn.fetch("SELECT version, checksum FROM schema_version")
+    return {row["version"]: row["checksum"] for row in rows}
+
+
+async def check_schema(conn: asyncpg.Connection) -> List[Migration]:
+    """
+    Fast startup check: returns migrations that are not applied yet and reports
+    applied ones whose file changed afterwards.
+    """
+    applied = await applied_versions(conn)
+    migrations = load_migrations()
+    for migration in migrations:
+        checksum = applied.get(migration.version)
+        if checksum is not None and checksum != migration.checksum:
+            app_logger.warning(f"Migration {migration} was modified after it had been applied.")
+    return [m for m in migrations if m.version not in applied]
+
+
+async def _drop_invalid_index(conn: asyncpg.Connection, statement: str):
+    # A failed CONCURRENTLY build leaves an INVALID index behind, and IF NOT EXISTS
+    # would then skip the retry; drop it so the statement builds it again
+    match = _CONCURRENT_INDEX_RE.search(statement)
+    if not match:
+        return
+    invalid = await conn.fetchval(
+        """
+        SELECT NOT i.indisvalid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = $1 AND pg_table_is_visible(c.oid)
+        """,
+        match.group(1),
+    )
+    if invalid:
+        app_logger.warning(f"Dropping invalid index {match.group(1)} left by an interrupted build")
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+
+
+async def apply_migration(conn: asyncpg.Connection, migration: Migration):
+    started = time.perf_counter()
+    record = """
+        INSERT INTO schema_version (version, name, checksum, execution_ms)
+        VALUES ($1, $2, $3, $4)
+    """
+    if migration.transactional:
+        async with conn.transaction():
+            await conn.execute(migration.sql)
+            elapsed_ms = int((time.perf_counter() - started) * 1000)
+            await conn.execute(record, migration.version, migration.name, migration.checksum, elapsed_ms)
+    else:
+        for statement in migration.statements():
+            await _drop_invalid_index(conn, statement)
+            await conn.execute(statement)
+        elapsed_ms = int((time.perf_counter() - started) * 1000)
+        await conn.execute(record, migration.version, migration.name, migration.checksum, elapsed_ms)
+    app_logger.info(f"Applied migration {migration} in {elapsed_ms} ms")
+
+
+async def migrate(conn: asyncpg.Connection) -> List[Migration]:
+    """Applies all pending migrations in order. Returns the applied ones."""
+    await conn.execute(f"SET lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'")
+    # Index builds may take long; the pool's command timeout does not apply here
+    await conn.execute("SET statement_timeout = 0")
+    await conn.execute("SELECT pg_advisory_lock($1)", _ADVISORY_LOCK_KEY)
+    try:
+        await conn.execute(SCHEMA_VERSION_TABLE)
+        applied = await applied_versions(conn)
+        pending = [m for m in load_migrations() if m.version not in applied]
+        for migration in pending:
+            await apply_migration(conn, migration)
+        return pending
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", _ADVISORY_LOCK_KEY)
+
+
+async def _connect() -> asyncpg.Connection:
+    # A dedicated connection: session settings must not leak into the pool,
+    # and the pool's command timeout would cut long index builds short
+    from postgresql.database import DATABASE_URL
+    return await asyncpg.connect(DATABASE_URL)
+
+
+async def run_startup_migrations():
+    """Checks or applies pending migrations before the pool is opened (MIGRATIONS_ON_STARTUP)."""
+    if MIGRATIONS_ON_STARTUP == "off":
+        return
+    conn = await _connect()
+    try:
+        if MIGRATIONS_ON_STARTUP == "apply":
+            await migrate(conn)
+            return
+        pending = await check_schema(conn)
+        if pending:
+            app_logger.warning(
+                f"{len(pending)} pending migration(s): {', '.join(map(repr, pending))}. "
+                "Run 'python -m postgresql.migrate up'."
+            )
+    finally:
+        await conn.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Database schema migrations")
+    parser.add_argument("command", choices=["status", "up"], nargs="?", default="status")
+    args = parser.parse_args()
+
+    conn = await _connect()
+    try:
+        if args.command == "up":
+            applied = await migrate(conn)
+            print(f"✅ Applied {len(applied)} migration(s), schema is up to date.")
+        else:
+            applied = await applied_versions(conn)
+            for migration in load_migrations():
+                state = "applied" if migration.version in applied else "pending"
+                print(f"{migration}: {state}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
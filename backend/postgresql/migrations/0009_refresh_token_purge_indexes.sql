@@ -0,0 +1,9 @@
+-- migrate:no-transaction
+-- Migration: Indexes for the background purge of dead refresh tokens
+-- The purge deletes rows WHERE is_revoked = TRUE OR expires_at < NOW() in batches;
+-- these indexes let it find them without scanning the whole table.
+-- Built CONCURRENTLY so logins keep writing to refresh_tokens during the build.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_refresh_tokens_expires_at ON refresh_tokens (expires_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_refresh_tokens_revoked ON refresh_tokens (id) WHERE is_revoked = TRUE;
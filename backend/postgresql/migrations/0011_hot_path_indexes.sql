@@ -0,0 +1,57 @@
+-- migrate:no-transaction
+-- Индексы под горячие запросы из postgresql/queries.py.
+-- Строятся CONCURRENTLY, чтобы не блокировать запись в таблицы.
+-- Проверка планов: python -m postgresql.check_query_plans
+
+-- Галерея владельца: WHERE owner_id = $1 ORDER BY created_at DESC
+-- (photos.by_owner_with_metadata, get_photos_by_owner) - без сортировки
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_art_objects_owner_created ON art_objects (owner_id, created_at DESC);
+
+-- Публичные фото владельца (photos.public_by_owner)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_art_objects_owner_public_created ON art_objects (owner_id, created_at DESC) WHERE is_public = TRUE;
+
+-- Поиск по имени файла (photos.by_file_id, photos.by_file_id_and_owner)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_art_objects_file_id ON art_objects (file_id) INCLUDE (owner_id);
+
+-- Общая лента: ORDER BY created_at DESC LIMIT (photos.public_feed)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_art_objects_created_at ON art_objects (created_at DESC);
+
+-- Удаление истории вместе с фото (ownership_history.delete_for_photos)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ownership_history_art_object_id ON ownership_history (art_object_id);
+
+-- Групповой обмен по QR: WHERE share_token = $1 AND status = 'pending'
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trades_pending_share_token ON trades (share_token) WHERE status = 'pending';
+
+-- Активные обмены отправителя: status IN ('pending', 'scanned') AND expires_at > NOW()
+-- (trades.reject_active_*, usage.trades_with_photo)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trades_active_sender ON trades (sender_id, expires_at) WHERE status IN ('pending', 'scanned');
+
+-- Отсканированные обмены отправителя (trades.scanned_by_sender)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trades_scanned_sender ON trades (sender_id, created_at DESC) WHERE status = 'scanned';
+
+-- Обмены по фото (trades.delete_for_photos)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trades_art_object_id ON trades (art_object_id);
+
+-- Передачи по фото (usage.transfers_with_photo, transfers.delete_for_photos)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pending_transfers_photo_id ON pending_transfers (photo_id);
+
+-- Запросы между парой пользователей, последние первыми
+-- (profile_requests.latest_between, pending_between, approved_photo_ids, has_approved_photo)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_profile_view_requests_pair ON profile_view_requests (target_id, requester_id, created_at DESC);
+
+-- Входящие запросы пользователя (profile_requests.pending_for_target, approved_for_target)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_profile_view_requests_target_pending ON profile_view_requests (target_id, created_at DESC) WHERE status = 'pending';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_profile_view_requests_target_approved ON profile_view_requests (target_id, created_at DESC) WHERE status = 'approved';
+
+-- Запросы, в которых открыты удаляемые фото (profile_requests.with_any_photo)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_profile_view_requests_selected_photos ON profile_view_requests USING GIN (selected_photo_ids) WHERE status IN ('pending', 'approved');
+
+-- Импортированные и избранные фото пользователя, новые первыми (покрывающие)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_imported_photos_user_imported ON imported_photos (user_id, imported_at DESC) INCLUDE (photo_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_favorite_photos_user_favorited ON favorite_photos (user_id, favorited_at DESC) INCLUDE (photo_id);
+
+-- Индексы, которые полностью перекрыты новыми или UNIQUE(user_id, photo_id)
+DROP INDEX CONCURRENTLY IF EXISTS idx_art_objects_is_public;
+DROP INDEX CONCURRENTLY IF EXISTS idx_profile_view_requests_target_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_imported_photos_user_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_favorite_photos_user_id;
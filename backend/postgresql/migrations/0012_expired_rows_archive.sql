@@ -0,0 +1,50 @@
+-- migrate:no-transaction
+-- Archive tables for rows removed by the background reaper (app/background.py)
+-- and indexes on expires_at so each reaper batch finds its rows without a full scan.
+
+-- Expired trades
+CREATE TABLE IF NOT EXISTS trades_archive (
+    id UUID PRIMARY KEY,
+    art_object_id INTEGER NOT NULL,                 -- No FK: the photo may be deleted later
+    sender_id BIGINT NOT NULL,
+    receiver_id BIGINT,
+    status VARCHAR(50) NOT NULL,
+    share_token VARCHAR(8),
+    created_at TIMESTAMPTZ NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Expired photo transfer requests
+CREATE TABLE IF NOT EXISTS pending_transfers_archive (
+    id UUID PRIMARY KEY,
+    photo_id INTEGER NOT NULL,
+    sharer_id BIGINT NOT NULL,
+    scanner_id BIGINT NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Expired profile view requests
+CREATE TABLE IF NOT EXISTS profile_view_requests_archive (
+    id UUID PRIMARY KEY,
+    requester_id BIGINT NOT NULL,
+    target_id BIGINT NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    selected_photo_ids INTEGER[],
+    created_at TIMESTAMPTZ NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trades_expires_at ON trades (expires_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pending_transfers_expires_at ON pending_transfers (expires_at);
+
+-- Grant permissions to app_user
+GRANT SELECT, INSERT, DELETE ON trades_archive, pending_transfers_archive, profile_view_requests_archive TO app_user;
+
+COMMENT ON TABLE trades_archive IS 'Trades moved out of trades by the reaper after expires_at plus the retention period.';
+COMMENT ON TABLE pending_transfers_archive IS 'Transfer requests moved out of pending_transfers by the reaper after expiry.';
+COMMENT ON TABLE profile_view_requests_archive IS 'Profile view requests moved out of profile_view_requests by the reaper after expiry.';
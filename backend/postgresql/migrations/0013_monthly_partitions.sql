@@ -0,0 +1,100 @@
+-- Monthly range partitioning of ownership_history (by transfer_date) and
+-- trades_archive (by archived_at, where completed and expired trades end up).
+-- Partitions are named <table>_pYYYYMM (UTC months). Future partitions are created
+-- and old ones detached or dropped by postgresql/partitions.py (background job).
+-- Existing rows are copied into the new tables; both are locked while this runs.
+-- Re-running is a no-op once a table is partitioned.
+
+CREATE OR REPLACE FUNCTION pg_temp.create_monthly_partitions(parent TEXT, since TIMESTAMPTZ, months_ahead INT)
+RETURNS VOID AS $$
+DECLARE
+    month_start TIMESTAMP;
+BEGIN
+    FOR month_start IN
+        SELECT generate_series(
+            date_trunc('month', LEAST(COALESCE(since, NOW()), NOW()) AT TIME ZONE 'UTC'),
+            date_trunc('month', NOW() AT TIME ZONE 'UTC') + make_interval(months => months_ahead),
+            INTERVAL '1 month'
+        )
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            parent || '_p' || to_char(month_start, 'YYYYMM'), parent,
+            month_start AT TIME ZONE 'UTC', (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC'
+        );
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ownership_history
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'ownership_history'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE ownership_history RENAME TO ownership_history_unpartitioned;
+    ALTER SEQUENCE ownership_history_id_seq OWNED BY NONE;
+
+    CREATE TABLE ownership_history (
+        id INTEGER NOT NULL DEFAULT nextval('ownership_history_id_seq'),
+        art_object_id INTEGER NOT NULL REFERENCES art_objects(id),
+        from_user_id BIGINT REFERENCES users(id),
+        to_user_id BIGINT NOT NULL REFERENCES users(id),
+        transfer_date TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        transaction_type VARCHAR(50) NOT NULL,
+        PRIMARY KEY (id, transfer_date)                 -- The partition key must be part of the PK
+    ) PARTITION BY RANGE (transfer_date);
+
+    PERFORM pg_temp.create_monthly_partitions(
+        'ownership_history', (SELECT MIN(transfer_date) FROM ownership_history_unpartitioned), 3
+    );
+
+    INSERT INTO ownership_history (id, art_object_id, from_user_id, to_user_id, transfer_date, transaction_type)
+    SELECT id, art_object_id, from_user_id, to_user_id, transfer_date, transaction_type
+    FROM ownership_history_unpartitioned;
+
+    DROP TABLE ownership_history_unpartitioned;
+    ALTER SEQUENCE ownership_history_id_seq OWNED BY ownership_history.id;
+
+    CREATE INDEX idx_ownership_history_art_object_id ON ownership_history (art_object_id);
+
+    COMMENT ON TABLE ownership_history IS 'Logs all ownership changes for art objects. Partitioned by month of transfer_date.';
+    COMMENT ON COLUMN ownership_history.from_user_id IS 'The previous owner. NULL for the initial creation event.';
+END $$;
+
+-- trades_archive
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'trades_archive'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE trades_archive RENAME TO trades_archive_unpartitioned;
+
+    CREATE TABLE trades_archive (
+        id UUID NOT NULL,
+        art_object_id INTEGER NOT NULL,
+        sender_id BIGINT NOT NULL,
+        receiver_id BIGINT,
+        status VARCHAR(50) NOT NULL,
+        share_token VARCHAR(8),
+        created_at TIMESTAMPTZ NOT NULL,
+        expires_at TIMESTAMPTZ NOT NULL,
+        archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, archived_at)
+    ) PARTITION BY RANGE (archived_at);
+
+    PERFORM pg_temp.create_monthly_partitions(
+        'trades_archive', (SELECT MIN(archived_at) FROM trades_archive_unpartitioned), 3
+    );
+
+    INSERT INTO trades_archive SELECT * FROM trades_archive_unpartitioned;
+    DROP TABLE trades_archive_unpartitioned;
+
+    COMMENT ON TABLE trades_archive IS 'Trades moved out of trades by the reaper after expires_at plus the retention period. Partitioned by month of archived_at.';
+END $$;
+
+-- Grant permissions to app_user (the tables were re-created)
+GRANT SELECT, INSERT, UPDATE, DELETE ON ownership_history TO app_user;
+GRANT SELECT, INSERT, DELETE ON trades_archive TO app_user;
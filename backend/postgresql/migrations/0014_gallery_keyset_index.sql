@@ -0,0 +1,9 @@
+-- migrate:no-transaction
+-- Keyset pagination of the gallery (photos.gallery_page) seeks to
+-- (owner_id, created_at, id) < cursor; id is added to the owner index as the tie-breaker
+-- so the seek is an index condition instead of a filter over newer rows.
+-- Replaces idx_art_objects_owner_created from 0011 (same prefix, serves the same queries).
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_art_objects_owner_created_id ON art_objects (owner_id, created_at DESC, id DESC);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_art_objects_owner_created;
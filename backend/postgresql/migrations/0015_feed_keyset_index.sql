@@ -0,0 +1,8 @@
+-- migrate:no-transaction
+-- Seek pagination of the public feed (photos.public_feed_page) walks art_objects
+-- newest first from (created_at, id) < cursor; id is the tie-breaker.
+-- Replaces idx_art_objects_created_at from 0011, which the OFFSET feed used.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_art_objects_created_id ON art_objects (created_at DESC, id DESC);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_art_objects_created_at;
@@ -0,0 +1,26 @@
+-- migrate:no-transaction
+-- Denormalized feed visibility: art_objects.in_public_feed = is_public OR the owner's
+-- users.is_public_profile. The feed filtered on that OR across the join, so no index
+-- could serve it; with the flag the feed is one range scan of a partial index.
+-- The flag is kept up to date by the queries that change either side
+-- (photos.update_metadata, photos.set_public_for_owner, photos.set_owner,
+-- create_art_object, update_art_object_owner).
+
+ALTER TABLE art_objects
+ADD COLUMN IF NOT EXISTS in_public_feed BOOLEAN NOT NULL DEFAULT FALSE;
+
+COMMENT ON COLUMN art_objects.in_public_feed IS 'Shown in the public feed: is_public OR the owner has a public profile. Maintained by the application.';
+
+-- Backfill; touches only rows whose flag is wrong, so re-running is cheap
+UPDATE art_objects ao
+SET in_public_feed = (ao.is_public OR u.is_public_profile)
+FROM users u
+WHERE u.id = ao.owner_id
+AND ao.in_public_feed IS DISTINCT FROM (ao.is_public OR u.is_public_profile);
+
+-- Общая лента (photos.public_feed, photos.public_feed_page): только видимые фото,
+-- новые первыми, id - для курсора
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_art_objects_public_feed ON art_objects (created_at DESC, id DESC) WHERE in_public_feed;
+
+-- Only the feed used the full (created_at, id) index from 0015
+DROP INDEX CONCURRENTLY IF EXISTS idx_art_objects_created_id;
@@ -0,0 +1,26 @@
+-- Content-addressed upload storage. A file in UPLOADS_DIR is a blob shared by every
+-- art_objects row with its file_id; new uploads are named <sha256><ext>, so the same
+-- image uploaded again reuses the stored file. ref_count is the number of art_objects
+-- rows pointing at the blob: inserting such a row takes a reference, deleting releases
+-- it (postgresql/database.py). Unreferenced blobs are removed with their files by a
+-- background job (app/background.py).
+
+CREATE TABLE IF NOT EXISTS upload_blobs (
+    file_id VARCHAR(255) PRIMARY KEY,               -- File name in UPLOADS_DIR, as in art_objects.file_id
+    sha256 BYTEA UNIQUE,                            -- NULL for files stored before this migration
+    size BIGINT,
+    ref_count INTEGER NOT NULL DEFAULT 0 CHECK (ref_count >= 0),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE upload_blobs IS 'Stored upload files with the number of art_objects rows referencing each.';
+
+-- Blobs waiting for the cleanup job
+CREATE INDEX IF NOT EXISTS idx_upload_blobs_unreferenced ON upload_blobs (file_id) WHERE ref_count = 0;
+
+-- Files stored under random names so far: counted, not deduplicated
+INSERT INTO upload_blobs (file_id, ref_count)
+SELECT file_id, COUNT(*) FROM art_objects GROUP BY file_id
+ON CONFLICT (file_id) DO NOTHING;
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON upload_blobs TO app_user;
@@ -0,0 +1,32 @@
+-- migrate:no-transaction
+-- Transfer copies record their source in original_art_id (the root of the lineage,
+-- never a copy). Since 0017 identical uploads share one file_id, so a file no longer
+-- identifies a photo: transfers look photos up by id and detect duplicates by lineage
+-- (photos.owner_has_lineage).
+
+-- Deleting an original keeps its copies: they become roots of their own lineages
+ALTER TABLE art_objects DROP CONSTRAINT IF EXISTS art_objects_original_art_id_fkey;
+ALTER TABLE art_objects
+ADD CONSTRAINT art_objects_original_art_id_fkey
+FOREIGN KEY (original_art_id) REFERENCES art_objects(id) ON DELETE SET NULL NOT VALID;
+ALTER TABLE art_objects VALIDATE CONSTRAINT art_objects_original_art_id_fkey;
+
+-- Copies made by transfers so far share the file_id of their source but have no
+-- original_art_id. Files stored before 0017 (upload_blobs.sha256 IS NULL) have random
+-- names, so of the rows sharing such a file the earliest is the source and the rest
+-- are its copies. Files stored since 0017 are named by content and are not linked.
+UPDATE art_objects ao
+SET original_art_id = root.id, is_original = FALSE
+FROM (
+    SELECT DISTINCT ON (a.file_id) a.file_id, a.id
+    FROM art_objects a
+    JOIN upload_blobs b ON b.file_id = a.file_id AND b.sha256 IS NULL
+    WHERE a.original_art_id IS NULL
+    ORDER BY a.file_id, a.created_at, a.id
+) root
+WHERE ao.file_id = root.file_id
+AND ao.id <> root.id
+AND ao.original_art_id IS NULL;
+
+-- Copies of a photo (photos.owner_has_lineage, ON DELETE SET NULL of the key above)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_art_objects_original_art_id ON art_objects (original_art_id, owner_id) WHERE original_art_id IS NOT NULL;
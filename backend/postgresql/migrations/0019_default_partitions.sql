@@ -0,0 +1,6 @@
+-- DEFAULT partitions for the monthly partitioned tables (0013). A row whose month has no
+-- partition yet (maintenance disabled or behind) lands here instead of failing the
+-- insert; postgresql/partitions.py moves such rows into their monthly partition.
+
+CREATE TABLE IF NOT EXISTS ownership_history_default PARTITION OF ownership_history DEFAULT;
+CREATE TABLE IF NOT EXISTS trades_archive_default PARTITION OF trades_archive DEFAULT;
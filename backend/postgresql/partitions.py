@@ -0,0 +1,166 @@
+"""
+Maintenance of monthly range partitions (see migrations/0013_monthly_partitions.sql).
+
+Partitions are named ``<table>_pYYYYMM`` and cover one UTC month. The maintenance job
+keeps PARTITION_PREMAKE_MONTHS future partitions ready and removes partitions older
+than the table's retention. Removing a partition is a catalog operation instead of a
+mass DELETE. Rows inserted while their month had no partition land in the table's
+DEFAULT partition (migrations/0019_default_partitions.sql); the job creates the
+missing partitions and moves those rows into them.
+"""
+
+import os
+import re
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import asyncpg
+from dotenv import load_dotenv
+
+from app.logging_config import app_logger
+
+# Загружаем переменные окружения из .env файла
+load_dotenv()
+
+# How many months ahead of the current one must have a partition
+PARTITION_PREMAKE_MONTHS = int(os.getenv("PARTITION_PREMAKE_MONTHS", "3"))
+# detach - old partitions become standalone tables (dump and drop them by hand), drop - delete them
+PARTITION_EXPIRY_MODE = os.getenv("PARTITION_EXPIRY_MODE", "detach").lower()
+# Maintenance DDL waits at most this long for a lock on the parent table
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+
+# Partitioned table -> months of data to keep (0 - keep forever)
+PARTITIONED_TABLES: Dict[str, int] = {
+    "ownership_history": int(os.getenv("OWNERSHIP_HISTORY_RETENTION_MONTHS", "0")),
+    "trades_archive": int(os.getenv("TRADES_ARCHIVE_RETENTION_MONTHS", "12")),
+}
+
+# Partitioned table -> partition key column
+PARTITION_KEYS: Dict[str, str] = {
+    "ownership_history": "transfer_date",
+    "trades_archive": "archived_at",
+}
+
+
+def month_start(moment: datetime) -> datetime:
+    moment = moment.astimezone(timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    years, index = divmod(month.month - 1 + months, 12)
+    return month.replace(year=month.year + years, month=index + 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+async def list_partitions(conn: asyncpg.Connection, table: str) -> Dict[datetime, str]:
+    """Returns {month: partition name} of the attached monthly partitions of a table."""
+    rows = await conn.fetch(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass($1)
+        """,
+        table,
+    )
+    pattern = re.compile(rf"^{re.escape(table)}_p(\d{{4}})(\d{{2}})$")
+    partitions = {}
+    for row in rows:
+        match = pattern.match(row["relname"])
+        if match:
+            partitions[datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)] = row["relname"]
+    return partitions
+
+
+async def _is_partitioned(conn: asyncpg.Connection, table: str) -> bool:
+    return await conn.fetchval("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass($1)", table) is True
+
+
+async def _run_ddl(conn: asyncpg.Connection, *statements: str):
+    # A short lock wait: if the parent is busy the job gives up and retries next run
+    async with conn.transaction():
+        await conn.execute(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'")
+        for statement in statements:
+            await conn.execute(statement)
+
+
+async def _months_in_default(conn: asyncpg.Connection, table: str) -> List[datetime]:
+    """Returns the months that have rows in the table's DEFAULT partition."""
+    default = f"{table}_default"
+    if await conn.fetchval("SELECT to_regclass($1)", default) is None:
+        return []
+    rows = await conn.fetch(
+        f"SELECT DISTINCT date_trunc('month', {PARTITION_KEYS[table]} AT TIME ZONE 'UTC') AS month FROM {default}"
+    )
+    return [row["month"].replace(tzinfo=timezone.utc) for row in rows]
+
+
+async def ensure_partitions(conn: asyncpg.Connection, table: str, now: datetime) -> List[str]:
+    """
+    Creates missing partitions from the current month to PARTITION_PREMAKE_MONTHS ahead,
+    and for every month that has rows in the DEFAULT partition.
+    """
+    existing = await list_partitions(conn, table)
+    current = month_start(now)
+    in_default = set(await _months_in_default(conn, table))
+    if in_default:
+        app_logger.warning(
+            f"{table}_default has rows for {len(in_default)} month(s) without a partition, moving them"
+        )
+    months = in_default | {add_months(current, offset) for offset in range(PARTITION_PREMAKE_MONTHS + 1)}
+    key = PARTITION_KEYS[table]
+    created = []
+    for month in sorted(months - set(existing)):
+        name = partition_name(table, month)
+        start, end = month.isoformat(), add_months(month, 1).isoformat()
+        create = f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM ('{start}') TO ('{end}')"
+        if month in in_default:
+            # Adding a range checks that the DEFAULT partition has no rows in it:
+            # take them out first and insert them again once the partition exists
+            await _run_ddl(
+                conn,
+                f"CREATE TEMP TABLE {name}_moved ON COMMIT DROP AS "
+                f"WITH moved AS (DELETE FROM {table}_default WHERE {key} >= '{start}' AND {key} < '{end}' RETURNING *) "
+                f"SELECT * FROM moved",
+                create,
+                f"INSERT INTO {table} SELECT * FROM {name}_moved",
+            )
+        else:
+            await _run_ddl(conn, create)
+        created.append(name)
+    return created
+
+
+async def expire_partitions(conn: asyncpg.Connection, table: str, retention_months: int, now: datetime) -> List[str]:
+    """Detaches or drops partitions whose whole month is older than the retention period."""
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(now), -retention_months)
+    expired = []
+    for month, name in sorted((await list_partitions(conn, table)).items()):
+        if month >= cutoff:
+            break
+        await _run_ddl(conn, f"ALTER TABLE {table} DETACH PARTITION {name}")
+        if PARTITION_EXPIRY_MODE == "drop":
+            await conn.execute(f"DROP TABLE {name}")
+        expired.append(name)
+    return expired
+
+
+async def maintain_partitions(conn: asyncpg.Connection) -> Dict[str, dict]:
+    """Runs ensure/expire for every partitioned table and returns what was changed."""
+    now = datetime.now(timezone.utc)
+    report = {}
+    for table, retention_months in PARTITIONED_TABLES.items():
+        if not await _is_partitioned(conn, table):
+            app_logger.warning(f"Table {table} is not partitioned yet, apply migration 0013")
+            continue
+        created = await ensure_partitions(conn, table, now)
+        expired = await expire_partitions(conn, table, retention_months, now)
+        if created or expired:
+            report[table] = {"created": created, "expired": expired}
+    return report
@@ -0,0 +1,565 @@
+"""
+Registry of the SQL statements used by the routers.
+
+Every statement has a name and a fixed text: parameters change, the SQL does not.
+asyncpg keeps one prepared statement per distinct text in each connection's
+statement cache, so each query here is parsed and planned once per connection,
+and metrics/slow-query logs report it under its name. Handlers run statements by
+name, e.g. ``await queries.fetchrow(conn, "photos.get_owner", photo_id)``.
+
+Optional filters and partial updates are expressed with COALESCE / IS NULL
+checks on the parameters instead of building SQL at runtime.
+"""
+
+import asyncpg
+from typing import Dict
+
+from postgresql import metrics
+
+QUERIES: Dict[str, str] = {}
+
+
+def _register(name: str, query: str):
+    if name in QUERIES:
+        raise ValueError(f"Query '{name}' is already registered")
+    QUERIES[name] = metrics.register_query(name, query)
+
+
+def sql(name: str) -> str:
+    """Returns the text of a registered query (KeyError for unknown names)."""
+    return QUERIES[name]
+
+
+async def fetch(conn: asyncpg.Connection, name: str, *args):
+    return await conn.fetch(QUERIES[name], *args)
+
+
+async def fetchrow(conn: asyncpg.Connection, name: str, *args):
+    return await conn.fetchrow(QUERIES[name], *args)
+
+
+async def fetchval(conn: asyncpg.Connection, name: str, *args):
+    return await conn.fetchval(QUERIES[name], *args)
+
+
+async def execute(conn: asyncpg.Connection, name: str, *args) -> str:
+    return await conn.execute(QUERIES[name], *args)
+
+
+# --- users ---
+_register("users.is_public_profile", "SELECT is_public_profile FROM users WHERE id = $1")
+_register("users.name", "SELECT first_name, last_name FROM users WHERE id = $1")
+_register("users.profile_settings", "SELECT is_public_profile, contact_link FROM users WHERE id = $1")
+_register("users.public_info", "SELECT id, first_name, last_name, username, photo_url, is_public_profile FROM users WHERE id = $1")
+_register("users.public_profile", "SELECT id, first_name, last_name, username, photo_url, is_public_profile, contact_link FROM users WHERE id = $1")
+_register("users.set_contact_link", "UPDATE users SET contact_link = $1 WHERE id = $2 RETURNING *")
+_register("users.set_public_profile", "UPDATE users SET is_public_profile = $1 WHERE id = $2 RETURNING *")
+
+# --- photos ---
+# Identical uploads share a file_id: at most two rows tell whether the file is one photo's
+_register("photos.by_file_id", "SELECT * FROM art_objects WHERE file_id = $1 LIMIT 2")
+_register("photos.for_transfer", "SELECT id, owner_id, file_id, original_art_id FROM art_objects WHERE id = $1")
+# $1 - the root of a lineage (a photo that is not a copy)
+_register("photos.owner_has_lineage", """
+    SELECT EXISTS (
+        SELECT 1 FROM art_objects
+        WHERE owner_id = $2 AND (id = $1 OR original_art_id = $1)
+    )
+""")
+_register("photos.by_ids", """
+    SELECT id, file_id, created_at
+    FROM art_objects
+    WHERE id = ANY($1)
+""")
+_register("photos.by_ids_of_owner", """
+    SELECT id, file_id, created_at
+    FROM art_objects
+    WHERE id = ANY($1) AND owner_id = $2
+    ORDER BY created_at DESC
+""")
+_register("photos.by_ids_of_owner_with_metadata", """
+    SELECT id, file_id, created_at, description, tags, is_public
+    FROM art_objects
+    WHERE id = ANY($1) AND owner_id = $2
+    ORDER BY created_at DESC
+""")
+_register("photos.by_owner_with_metadata", """
+    SELECT id, file_id, created_at, description, tags, is_public
+    FROM art_objects
+    WHERE owner_id = $1
+    ORDER BY created_at DESC
+""")
+# Owned and imported photos as one stream ordered by (created_at, id) DESC, starting
+# after the cursor ($2, $3; NULLs for the first page). Each branch is limited first, so
+# a page reads at most $4 rows from each side.
+_register("photos.gallery_page", """
+    SELECT * FROM (
+        (
+            SELECT id, file_id, created_at, description, tags, is_public, owner_id,
+                   NULL::timestamptz AS imported_at, FALSE AS is_imported
+            FROM art_objects
+            WHERE owner_id = $1
+            AND (created_at, id) < (COALESCE($2::timestamptz, 'infinity'), COALESCE($3::int, 2147483647))
+            ORDER BY created_at DESC, id DESC
+            LIMIT $4
+        )
+        UNION ALL
+        (
+            SELECT ao.id, ao.file_id, ao.created_at, ao.description, ao.tags, ao.is_public, ao.owner_id,
+                   ip.imported_at, TRUE AS is_imported
+            FROM imported_photos ip
+            JOIN art_objects ao ON ip.photo_id = ao.id
+            WHERE ip.user_id = $1
+            AND (ao.created_at, ao.id) < (COALESCE($2::timestamptz, 'infinity'), COALESCE($3::int, 2147483647))
+            ORDER BY ao.created_at DESC, ao.id DESC
+            LIMIT $4
+        )
+    ) page
+    ORDER BY created_at DESC, id DESC
+    LIMIT $4
+""")
+_register("photos.get_metadata", """
+    SELECT ao.id, ao.description, ao.tags, ao.is_public, ao.owner_id
+    FROM art_objects ao
+    WHERE ao.id = $1
+""")
+_register("photos.get_owner", "SELECT id, owner_id FROM art_objects WHERE id = $1")
+_register("photos.get_owner_id", "SELECT owner_id FROM art_objects WHERE id = $1")
+_register("photos.get_visibility", "SELECT id, owner_id, is_public FROM art_objects WHERE id = $1")
+_register("photos.owned_ids", "SELECT id FROM art_objects WHERE id = ANY($1) AND owner_id = $2")
+_register("photos.public_by_owner", """
+    SELECT id, file_id, created_at, description, tags, is_public
+    FROM art_objects
+    WHERE owner_id = $1 AND is_public = TRUE
+    ORDER BY created_at DESC
+""")
+_register("photos.public_feed", """
+    SELECT 
+        ao.id,
+        ao.file_id,
+        ao.created_at,
+        ao.owner_id,
+        ao.description,
+        ao.tags,
+        ao.is_public,
+        u.first_name,
+        u.last_name,
+        u.username
+    FROM art_objects ao
+    JOIN users u ON ao.owner_id = u.id
+    WHERE ao.in_public_feed  -- is_public OR the owner has a public profile
+    AND ao.owner_id != $1  -- Exclude current user's own photos
+    ORDER BY ao.created_at DESC, ao.id DESC
+    LIMIT $2 OFFSET $3
+""")
+# Seek variant of the feed: rows after the cursor ($2, $3; NULLs for the first page),
+# so every page costs the same however deep the client scrolls
+_register("photos.public_feed_page", """
+    SELECT
+        ao.id,
+        ao.file_id,
+        ao.created_at,
+        ao.owner_id,
+        ao.description,
+        ao.tags,
+        ao.is_public,
+        u.first_name,
+        u.last_name,
+        u.username
+    FROM art_objects ao
+    JOIN users u ON ao.owner_id = u.id
+    WHERE ao.in_public_feed
+    AND ao.owner_id != $1
+    AND (ao.created_at, ao.id) < (COALESCE($2::timestamptz, 'infinity'), COALESCE($3::int, 2147483647))
+    ORDER BY ao.created_at DESC, ao.id DESC
+    LIMIT $4
+""")
+# Head of the feed for all users at once (cached in app.cache.public_feed_cache);
+# viewers' own photos are filtered out in the application
+_register("photos.public_feed_window", """
+    SELECT
+        ao.id,
+        ao.file_id,
+        ao.created_at,
+        ao.owner_id,
+        ao.description,
+        ao.tags,
+        ao.is_public,
+        u.first_name,
+        u.last_name,
+        u.username
+    FROM art_objects ao
+    JOIN users u ON ao.owner_id = u.id
+    WHERE ao.in_public_feed
+    ORDER BY ao.created_at DESC, ao.id DESC
+    LIMIT $1
+""")
+# in_public_feed = is_public OR the owner's is_public_profile, so every statement that
+# changes either side recomputes it (see migrations/0016_public_feed_flag.sql)
+_register("photos.set_owner", """
+    UPDATE art_objects
+    SET owner_id = $1,
+        in_public_feed = is_public OR (SELECT is_public_profile FROM users WHERE id = $1)
+    WHERE id = $2
+""")
+_register("photos.update_metadata", """
+    UPDATE art_objects
+    SET description = COALESCE($2, description),
+        tags = COALESCE($3::text[], tags),
+        is_public = COALESCE($4, is_public),
+        in_public_feed = COALESCE($4, is_public) OR (SELECT u.is_public_profile FROM users u WHERE u.id = art_objects.owner_id)
+    WHERE id = $1
+    RETURNING id, description, tags, is_public
+""")
+# Follows users.set_public_profile: photos take the profile's visibility, so both sides agree
+_register("photos.set_public_for_owner", "UPDATE art_objects SET is_public = $1, in_public_feed = $1 WHERE owner_id = $2")
+
+# --- imports ---
+_register("imports.delete", """
+    DELETE FROM imported_photos
+    WHERE user_id = $1 AND photo_id = $2
+""")
+_register("imports.delete_for_photos", """
+    DELETE FROM imported_photos
+    WHERE photo_id = ANY($1::int[])
+""")
+_register("imports.delete_for_user_from_owner", """
+    DELETE FROM imported_photos
+    WHERE user_id = $1 AND photo_id IN (
+        SELECT id FROM art_objects WHERE owner_id = $2
+    )
+""")
+_register("imports.delete_for_user_photos", """
+    DELETE FROM imported_photos
+    WHERE user_id = $1 AND photo_id = ANY($2::int[])
+""")
+_register("imports.delete_others_of_owner", """
+    DELETE FROM imported_photos
+    WHERE photo_id IN (
+        SELECT id FROM art_objects WHERE owner_id = $1
+    )
+    AND user_id != $1
+    RETURNING user_id
+""")
+_register("imports.delete_others_of_photo", """
+    DELETE FROM imported_photos
+    WHERE photo_id = $1 AND user_id != $2
+    RETURNING user_id
+""")
+_register("imports.exists", """
+    SELECT EXISTS(
+        SELECT 1 FROM imported_photos
+        WHERE user_id = $1 AND photo_id = $2
+    )
+""")
+_register("imports.get", """
+    SELECT id FROM imported_photos
+    WHERE user_id = $1 AND photo_id = $2
+""")
+_register("imports.insert", """
+    INSERT INTO imported_photos (user_id, photo_id)
+    VALUES ($1, $2)
+""")
+_register("imports.photo_ids_by_user", """
+    SELECT photo_id FROM imported_photos
+    WHERE user_id = $1
+""")
+_register("imports.photo_ids_by_user_among", """
+    SELECT photo_id FROM imported_photos
+    WHERE user_id = $1 AND photo_id = ANY($2::int[])
+""")
+_register("imports.photos_by_user", """
+    SELECT ao.id, ao.file_id, ao.created_at, ao.owner_id, ao.description, ao.tags, ao.is_public, ip.imported_at
+    FROM imported_photos ip
+    JOIN art_objects ao ON ip.photo_id = ao.id
+    WHERE ip.user_id = $1
+    ORDER BY ip.imported_at DESC
+""")
+_register("imports.users_for_photos", """
+    SELECT DISTINCT user_id
+    FROM imported_photos
+    WHERE photo_id = ANY($1::int[])
+""")
+
+# --- blobs ---
+# Stored contents the user may reuse without uploading: only blobs of photos they own.
+# FOR SHARE keeps the rows from the cleanup job until the transaction ends.
+_register("blobs.owned_by_sha256", """
+    SELECT b.sha256, b.file_id FROM upload_blobs b
+    WHERE b.sha256 = ANY($1::bytea[])
+    AND EXISTS (SELECT 1 FROM art_objects ao WHERE ao.file_id = b.file_id AND ao.owner_id = $2)
+    FOR SHARE OF b
+""")
+
+# --- health ---
+_register("health.ping", "SELECT 1")
+
+# --- usage ---
+_register("usage.profile_requests_with_photo", """
+    SELECT id, status, target_id, requester_id
+    FROM profile_view_requests
+    WHERE $1 = ANY(selected_photo_ids)
+    AND status IN ('pending', 'approved')
+    AND expires_at > NOW()
+    AND target_id = $2
+""")
+_register("usage.trades_with_photo", """
+    SELECT id, status, receiver_id
+    FROM trades
+    WHERE art_object_id = $1
+    AND status IN ('pending', 'scanned')
+    AND expires_at > NOW()
+    AND sender_id = $2
+""")
+_register("usage.transfers_with_photo", """
+    SELECT id, status, scanner_id
+    FROM pending_transfers
+    WHERE photo_id = $1
+    AND status = 'pending'
+    AND expires_at > NOW()
+    AND sharer_id = $2
+""")
+
+# --- ownership_history ---
+_register("ownership_history.delete_for_photos", """
+    DELETE FROM ownership_history
+    WHERE art_object_id = ANY($1::int[])
+""")
+_register("ownership_history.insert_transfer", """
+    INSERT INTO ownership_history (art_object_id, from_user_id, to_user_id, transaction_type)
+    VALUES ($1, $2, $3, 'transfer')
+""")
+
+# --- trades ---
+_register("trades.by_share_token", """
+    SELECT * FROM trades
+    WHERE share_token = $1
+    ORDER BY created_at DESC
+""")
+_register("trades.complete", "UPDATE trades SET status = 'completed' WHERE id = $1")
+_register("trades.complete_for_receiver", """
+    UPDATE trades
+    SET status = 'completed', receiver_id = $1
+    WHERE id = $2
+""")
+_register("trades.delete_for_photos", """
+    DELETE FROM trades
+    WHERE art_object_id = ANY($1::int[])
+""")
+_register("trades.get", "SELECT * FROM trades WHERE id = $1")
+_register("trades.insert", """
+    INSERT INTO trades (art_object_id, sender_id, share_token)
+    VALUES ($1, $2, $3)
+    RETURNING id, expires_at
+""")
+_register("trades.lock", "SELECT * FROM trades WHERE id = $1 FOR UPDATE")
+_register("trades.lock_pending_by_share_token", """
+    SELECT * FROM trades
+    WHERE share_token = $1 AND status = 'pending'
+    FOR UPDATE
+""")
+_register("trades.reject", "UPDATE trades SET status = 'rejected' WHERE id = $1")
+_register("trades.reject_active_between_except_id", """
+    UPDATE trades
+    SET status = 'rejected'
+    WHERE (
+        (sender_id = $1 AND receiver_id = $2) 
+        OR (sender_id = $2 AND receiver_id = $1)
+        OR (sender_id = $1 AND receiver_id IS NULL)
+        OR (sender_id = $2 AND receiver_id IS NULL)
+    )
+    AND status IN ('pending', 'scanned')
+    AND id != $3
+    AND expires_at > NOW()
+""")
+_register("trades.reject_active_between_except_ids", """
+    UPDATE trades
+    SET status = 'rejected'
+    WHERE (
+        (sender_id = $1 AND receiver_id = $2) 
+        OR (sender_id = $2 AND receiver_id = $1)
+        OR (sender_id = $1 AND receiver_id IS NULL)
+        OR (sender_id = $2 AND receiver_id IS NULL)
+    )
+    AND status IN ('pending', 'scanned')
+    AND NOT (id = ANY($3::uuid[]))
+    AND expires_at > NOW()
+""")
+_register("trades.reject_active_by_sender", """
+    UPDATE trades
+    SET status = 'rejected'
+    WHERE sender_id = $1 AND status IN ('pending', 'scanned')
+    AND expires_at > NOW()
+""")
+_register("trades.scanned_by_sender", """
+    SELECT
+        t.id as trade_id,
+        t.art_object_id,
+        t.sender_id,
+        t.receiver_id,
+        t.status,
+        t.created_at,
+        t.expires_at,
+        ao.file_id
+    FROM trades t
+    LEFT JOIN art_objects ao ON t.art_object_id = ao.id
+    WHERE t.sender_id = $1 AND t.status = 'scanned'
+    ORDER BY t.created_at DESC
+""")
+_register("trades.set_scanned", "UPDATE trades SET receiver_id = $1, status = 'scanned' WHERE id = $2")
+_register("trades.token_exists", "SELECT 1 FROM trades WHERE share_token = $1")
+
+# --- transfers ---
+_register("transfers.delete_for_photos", """
+    DELETE FROM pending_transfers
+    WHERE photo_id = ANY($1::int[])
+""")
+
+# --- profile_requests ---
+_register("profile_requests.approved_for_target", """
+    SELECT
+        pvr.id,
+        pvr.requester_id,
+        pvr.status,
+        pvr.selected_photo_ids,
+        pvr.created_at,
+        pvr.expires_at,
+        u.first_name,
+        u.last_name,
+        u.username,
+        u.photo_url
+    FROM profile_view_requests pvr
+    JOIN users u ON pvr.requester_id = u.id
+    WHERE pvr.target_id = $1 AND pvr.status = 'approved'
+    ORDER BY pvr.created_at DESC
+""")
+_register("profile_requests.approved_photo_ids", """
+    SELECT selected_photo_ids, created_at
+    FROM profile_view_requests
+    WHERE target_id = $1 AND requester_id = $2 AND status = 'approved'
+    AND selected_photo_ids IS NOT NULL AND array_length(selected_photo_ids, 1) > 0
+    AND expires_at > NOW()
+    ORDER BY created_at DESC
+""")
+_register("profile_requests.get_for_requester", """
+    SELECT * FROM profile_view_requests
+    WHERE id = $1 AND requester_id = $2
+""")
+_register("profile_requests.get_summary", """
+    SELECT id, target_id, requester_id, status
+    FROM profile_view_requests
+    WHERE id = $1
+""")
+_register("profile_requests.has_approved_photo", """
+    SELECT EXISTS(
+        SELECT 1 FROM profile_view_requests
+        WHERE requester_id = $1
+        AND target_id = $2
+        AND status = 'approved'
+        AND $3 = ANY(selected_photo_ids)
+        AND expires_at > NOW()
+    )
+""")
+_register("profile_requests.insert", """
+    INSERT INTO profile_view_requests (requester_id, target_id)
+    VALUES ($1, $2)
+    RETURNING id, created_at, expires_at
+""")
+_register("profile_requests.latest_between", """
+    SELECT id, status, created_at, expires_at
+    FROM profile_view_requests
+    WHERE target_id = $1 AND requester_id = $2
+    ORDER BY created_at DESC
+    LIMIT 1
+""")
+_register("profile_requests.lock_approved_for_target", """
+    SELECT * FROM profile_view_requests
+    WHERE id = $1 AND target_id = $2 AND status = 'approved'
+    FOR UPDATE
+""")
+_register("profile_requests.lock_for_target", """
+    SELECT * FROM profile_view_requests
+    WHERE id = $1 AND target_id = $2
+    FOR UPDATE
+""")
+_register("profile_requests.pending_between", """
+    SELECT id, created_at, expires_at
+    FROM profile_view_requests
+    WHERE requester_id = $1 AND target_id = $2
+    AND status = 'pending'
+    AND expires_at > NOW()
+""")
+_register("profile_requests.pending_for_target", """
+    SELECT
+        pvr.id,
+        pvr.requester_id,
+        pvr.created_at,
+        pvr.expires_at,
+        u.first_name,
+        u.last_name,
+        u.username
+    FROM profile_view_requests pvr
+    JOIN users u ON pvr.requester_id = u.id
+    WHERE pvr.target_id = $1 AND pvr.status = 'pending' AND pvr.expires_at > NOW()
+    ORDER BY pvr.created_at DESC
+""")
+_register("profile_requests.reject", """
+    UPDATE profile_view_requests
+    SET status = 'rejected'
+    WHERE id = $1
+""")
+_register("profile_requests.reject_pending_between", """
+    UPDATE profile_view_requests
+    SET status = 'rejected'
+    WHERE requester_id = $1 AND target_id = $2
+    AND status = 'pending'
+    AND expires_at > NOW()
+""")
+_register("profile_requests.set_response", """
+    UPDATE profile_view_requests
+    SET status = $1, selected_photo_ids = $2
+    WHERE id = $3
+""")
+_register("profile_requests.set_selected_photos", """
+    UPDATE profile_view_requests
+    SET selected_photo_ids = $1
+    WHERE id = $2
+""")
+_register("profile_requests.with_any_photo", """
+    SELECT id, selected_photo_ids
+    FROM profile_view_requests
+    WHERE selected_photo_ids && $1::int[]
+    AND status IN ('pending', 'approved')
+""")
+
+# --- favorites ---
+_register("favorites.delete", """
+    DELETE FROM favorite_photos
+    WHERE user_id = $1 AND photo_id = $2
+""")
+_register("favorites.exists", """
+    SELECT EXISTS(
+        SELECT 1 FROM favorite_photos
+        WHERE user_id = $1 AND photo_id = $2
+    )
+""")
+_register("favorites.get", """
+    SELECT id FROM favorite_photos
+    WHERE user_id = $1 AND photo_id = $2
+""")
+_register("favorites.insert", """
+    INSERT INTO favorite_photos (user_id, photo_id)
+    VALUES ($1, $2)
+""")
+_register("favorites.photo_ids_by_user", """
+    SELECT photo_id FROM favorite_photos
+    WHERE user_id = $1
+""")
+_register("favorites.photos_by_user", """
+    SELECT ao.id, ao.file_id, ao.created_at, ao.owner_id, fp.favorited_at,
+           CASE WHEN ao.owner_id = $1 THEN false ELSE true END as is_imported
+    FROM favorite_photos fp
+    JOIN art_objects ao ON fp.photo_id = ao.id
+    WHERE fp.user_id = $1
+    ORDER BY fp.favorited_at DESC
+""")
@@ -50,16 +50,19 @@ COMMENT ON COLUMN ownership_history.from_user_id IS 'The previous owner. NULL fo
 CREATE TABLE IF NOT EXISTS refresh_tokens (
     id SERIAL PRIMARY KEY,
     user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    token VARCHAR(512) NOT NULL,
+    token_hash BYTEA NOT NULL CHECK (octet_length(token_hash) = 32), -- SHA-256 of the refresh token
     expires_at TIMESTAMPTZ NOT NULL,
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     is_revoked BOOLEAN NOT NULL DEFAULT FALSE
 );
 
 CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_id ON refresh_tokens (user_id);
-CREATE UNIQUE INDEX IF NOT EXISTS idx_refresh_tokens_token ON refresh_tokens (token);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_refresh_tokens_token_hash ON refresh_tokens (token_hash);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires_at ON refresh_tokens (expires_at);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_revoked ON refresh_tokens (id) WHERE is_revoked = TRUE;
 
 COMMENT ON TABLE refresh_tokens IS 'Stores refresh tokens for users to maintain persistent sessions.';
+COMMENT ON COLUMN refresh_tokens.token_hash IS 'SHA-256 digest of the refresh token; the token itself is never stored.';
 COMMENT ON COLUMN refresh_tokens.is_revoked IS 'If TRUE, the token can no longer be used.';
 
 -- Table to manage the state of art object trades